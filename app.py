@@ -3,14 +3,24 @@ import pandas as pd
 import numpy as np
 import gspread
 import google.generativeai as genai
-from PIL import Image
-import json
-import time
-import io
-from datetime import datetime, timedelta
-import xml.etree.ElementTree as ET
+from datetime import datetime
 import os
 import html
+import uuid
+
+from conciliacion_continua import olvidar_cuenta
+from ingesta import leer_excel, leer_tabla, columnas_archivo
+from bitacora import configurar_bitacora, encolar_log
+from auditorias import auditoria_exogena, auditoria_gastos, auditoria_ugpp, auditoria_nomina
+from nit import calcular_dv, validar_nits
+from ocr_ia import obtener_modelo
+from trabajos import enviar_trabajo, estado_trabajo, listar_trabajos, resultado_trabajo, resultado_parcial, ACTIVOS, PENDIENTE, TERMINADO
+from exportar import descarga_diferida, nombre_descarga
+from catalogo import registrar_dataset, listar_datasets, nombre_dataset
+from tipos import a_fecha
+from xml_dian import CARPETA_XML_SERVIDOR, carpeta_servidor
+from deteccion_columnas import detectar_columnas, muestra_archivo, recordar_columnas
+from cache_ia import clave_ia, consultar_con_cache, leer_cache_ia, guardar_cache_ia, estadisticas_cache_ia
 
 # --- CONFIGURACIÓN DE ESTILO GLOBAL (FONDO DE TODA LA PÁGINA) ---
 st.markdown("""
@@ -53,6 +63,8 @@ try:
         sh = gc.open("DB_Alcontador")
         sheet_logs = sh.sheet1
         db_conectada = True
+        # Hilo escritor en segundo plano (uno por proceso, ver bitacora.py)
+        configurar_bitacora(sheet_logs)
     else:
         # Si no hay secretos configurados, marcamos como desconectado
         db_conectada = False
@@ -67,11 +79,12 @@ def registrar_log(usuario, accion, detalle):
     Función de Auditoría:
     Guarda un registro de actividad en Google Sheets si la DB está conectada.
     Campos: Fecha y Hora, Usuario, Acción realizada, Detalle técnico.
+    El envío es asíncrono y por lotes: aquí solo se encola (no bloquea la UI).
     """
     if db_conectada and sheet_logs:
         try:
             fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            sheet_logs.append_row([fecha_hora, usuario, accion, detalle])
+            encolar_log([fecha_hora, usuario, accion, detalle])
         except:
             # Si falla el registro del log, no detenemos la aplicación
             pass 
@@ -88,6 +101,8 @@ try:
         # Configuración de la API Key para servicios de IA Generativa
         GOOGLE_API_KEY = st.secrets["general"]["api_key_google"]
         genai.configure(api_key=GOOGLE_API_KEY)
+        # Los procesos de la cola de trabajos (OCR) toman la clave del entorno
+        os.environ.setdefault("GOOGLE_API_KEY", GOOGLE_API_KEY)
         estado_ia = "🟢 IA Activa (Enterprise)"
         api_key_valida = True
     else:
@@ -111,6 +126,12 @@ if 'logged_in' not in st.session_state:
 if 'username' not in st.session_state:
     st.session_state['username'] = None
 
+# Dueño de los trabajos y del catálogo de archivos. 'username' es solo el nombre
+# que se muestra (todos los clientes Free entran como 'Cliente'): cada sesión
+# tiene su propio ID para no ver los archivos ni los trabajos de otra persona.
+if 'id_usuario' not in st.session_state:
+    st.session_state['id_usuario'] = f"sesion-{uuid.uuid4().hex[:12]}"
+
 
 # ==============================================================================
 # ==============================================================================
@@ -353,13 +374,7 @@ st.markdown("""
 # ==============================================================================
 # ==============================================================================
 
-# CONSTANTES FISCALES COLOMBIA (AÑO GRAVABLE 2025)
-SMMLV_2025 = 1430000
-AUX_TRANS_2025 = 175000
-UVT_2025 = 49799
-TOPE_EFECTIVO = 100 * UVT_2025
-BASE_RET_SERVICIOS = 4 * UVT_2025
-BASE_RET_COMPRAS = 27 * UVT_2025
+# CONSTANTES FISCALES COLOMBIA (AÑO GRAVABLE 2025): definidas en reglas_fiscales.py
 
 # ------------------------------------------------------------------------------
 # CALCULAR DÍGITO DE VERIFICACIÓN (RUT)
@@ -367,112 +382,33 @@ BASE_RET_COMPRAS = 27 * UVT_2025
 def calcular_dv_colombia(nit_sin_dv):
     """
     Aplica el algoritmo de Módulo 11 para calcular el DV de un NIT colombiano.
+    Misma implementación vectorizada que usan los cruces masivos (nit.py).
     """
     try:
         nit_str = str(nit_sin_dv).strip()
         if not nit_str.isdigit(): return "Error"
-        
-        primos = [3, 7, 13, 17, 19, 23, 29, 37, 41, 43, 47, 53, 59, 67, 71]
-        suma = sum(int(digito) * primos[i] for i, digito in enumerate(reversed(nit_str)) if i < len(primos))
-        resto = suma % 11
-        return str(resto) if resto <= 1 else str(11 - resto)
+        # Solo cuentan los 15 dígitos menos significativos (pesos del Módulo 11)
+        return str(int(calcular_dv([int(nit_str[-15:])])[0]))
     except:
         return "?"
 
 # ------------------------------------------------------------------------------
 # ANÁLISIS DE RIESGO TRIBUTARIO (GASTOS)
 # ------------------------------------------------------------------------------
-def analizar_gasto_fila(row, col_valor, col_metodo, col_concepto):
-    """
-    Evalúa una fila de gastos contables para detectar incumplimientos del Art 771-5
-    y bases de retención en la fuente.
-    """
-    hallazgos = []
-    riesgo = "BAJO"
-    
-    # Extracción segura de valores
-    valor = float(row[col_valor]) if pd.notnull(row[col_valor]) else 0
-    metodo = str(row[col_metodo]) if pd.notnull(row[col_metodo]) else ""
-    
-    # 1. Validación de Bancarización
-    if 'efectivo' in metodo.lower() and valor > TOPE_EFECTIVO:
-        hallazgos.append(f"⛔ RECHAZO FISCAL: Pago en efectivo (${valor:,.0f}) supera tope Art 771-5.")
-        riesgo = "ALTO"
-    
-    # 2. Validación de Bases de Retención
-    if valor >= BASE_RET_SERVICIOS and valor < BASE_RET_COMPRAS:
-        hallazgos.append("⚠️ ALERTA: Verificar Retención (Base Servicios).")
-        if riesgo == "BAJO": riesgo = "MEDIO"
-    elif valor >= BASE_RET_COMPRAS:
-        hallazgos.append("⚠️ ALERTA: Verificar Retención (Base Compras).")
-        if riesgo == "BAJO": riesgo = "MEDIO"
-        
-    return " | ".join(hallazgos) if hallazgos else "OK", riesgo
+# Art 771-5 (bancarización) y bases de retención: motor de reglas vectorizado
+# en reglas_fiscales.py (REGLAS_GASTOS / auditar_gastos).
 
 # ------------------------------------------------------------------------------
 # ANÁLISIS DE RIESGO UGPP (LEY 1393)
 # ------------------------------------------------------------------------------
-def calcular_ugpp_fila(row, col_salario, col_no_salarial):
-    """
-    Verifica que los pagos no salariales no excedan el 40% del total de la remuneración.
-    """
-    salario = float(row[col_salario]) if pd.notnull(row[col_salario]) else 0
-    no_salarial = float(row[col_no_salarial]) if pd.notnull(row[col_no_salarial]) else 0
-    
-    total = salario + no_salarial
-    limite = total * 0.40
-    
-    if no_salarial > limite:
-        exceso = no_salarial - limite
-        return salario + exceso, exceso, "RIESGO ALTO", f"Excede límite Ley 1393 por ${exceso:,.0f}"
-    return salario, 0, "OK", "Cumple norma"
+# Límite del 40% de pagos no salariales: ver escanear_ugpp() en reglas_fiscales.py.
+# Los topes (UVT, SMMLV, tarifas) de cada año están en parametros_fiscales.py.
 
 # ------------------------------------------------------------------------------
 # CALCULADORA DE COSTO DE NÓMINA (LÓGICA BLINDADA)
 # ------------------------------------------------------------------------------
-def calcular_costo_empresa_fila(row, col_salario, col_aux, col_arl, col_exo):
-    """Calculadora de Nómina Real - VERSIÓN DETALLADA"""
-    try:
-        salario = float(row[col_salario]) if pd.notnull(row[col_salario]) else 0
-    except:
-        salario = 0
-
-    tiene_aux = str(row[col_aux]).strip().lower() in ['si', 's', 'true', '1', 'yes']
-    
-    # ARL
-    if col_arl and col_arl in row and pd.notnull(row[col_arl]):
-        try: nivel_arl = int(row[col_arl])
-        except: nivel_arl = 1
-    else: nivel_arl = 1 
-        
-    es_exonerado = str(row[col_exo]).strip().lower() in ['si', 's', 'true', '1', 'yes']
-    
-    # --- CÁLCULOS DETALLADOS ---
-    aux_trans = AUX_TRANS_2025 if tiene_aux else 0
-    ibc = salario
-    base_prest = salario + aux_trans
-    
-    # 1. SEGURIDAD SOCIAL (Empleador)
-    salud = 0 if es_exonerado else ibc * 0.085
-    pension = ibc * 0.12
-    arl_t = {1:0.00522, 2:0.01044, 3:0.02436, 4:0.0435, 5:0.0696}
-    arl_val = ibc * arl_t.get(nivel_arl, 0.00522)
-    
-    total_seg_social = salud + pension + arl_val
-    
-    # 2. PARAFISCALES
-    paraf = ibc * 0.04 # Caja
-    if not es_exonerado: paraf += ibc * 0.05 # SENA + ICBF
-    
-    # 3. PRESTACIONES SOCIALES (Prima, Cesantías, Int, Vacaciones)
-    # Factor 21.83% sobre salario + auxilio
-    total_prestaciones = base_prest * 0.2183 
-    
-    # TOTAL COSTO
-    costo_total = base_prest + total_seg_social + paraf + total_prestaciones
-    
-    # Retornamos los valores separados
-    return costo_total, total_seg_social, total_prestaciones, paraf
+# Salud, pensión, ARL, parafiscales y prestaciones por columnas completas:
+# ver costear_nomina() en nomina.py.
 
 # ------------------------------------------------------------------------------
 # CONEXIÓN CON IA (CEREBRO HÍBRIDO)
@@ -481,69 +417,170 @@ def consultar_ia_gemini(prompt):
     """
     Usa el modelo PRO (Más inteligente y razonador)
     Ideal para: Narrador Financiero, Análisis de Tesorería y Auditoría NIIF.
+    Un prompt idéntico (p. ej. el rerun después del botón) sale de la caché de IA.
+    """
+    def llamar():
+        try:
+            response = obtener_modelo('gemini-1.5-flash').generate_content(prompt)
+            return response.text, True
+        except Exception as e:
+            return f"Error de conexión IA: {str(e)}", False
+    return consultar_con_cache(clave_ia('gemini-1.5-flash', prompt), llamar)
+
+def consultar_ia_gemini_stream(prompt):
+    """
+    Variante en streaming: entrega el texto por fragmentos a medida que llega,
+    para pintarlo con st.write_stream sin esperar la respuesta completa.
+    Si el usuario cambia de módulo, Streamlit corta el script, el generador se
+    cierra y se deja de leer la respuesta. Solo las respuestas completas van a caché.
     """
+    clave = clave_ia('gemini-1.5-flash', prompt)
+    previo = leer_cache_ia(clave)
+    if previo is not None:
+        yield previo
+        return
+    partes = []
     try:
-        # AQUÍ ESTÁ EL CAMBIO: Usamos 'pro' para razonamiento avanzado
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        return response.text
+        for fragmento in obtener_modelo('gemini-1.5-flash').generate_content(prompt, stream=True):
+            texto = fragmento.text
+            partes.append(texto)
+            yield texto
     except Exception as e:
-        return f"Error de conexión IA: {str(e)}"
+        yield f"\n\nError de conexión IA: {str(e)}"
+        return
+    guardar_cache_ia(clave, "".join(partes))
 
 # ------------------------------------------------------------------------------
-# OCR DE FACTURAS (VELOCIDAD)
+# DESCARGA DE REPORTES (EXCEL / CSV / PARQUET)
 # ------------------------------------------------------------------------------
-def ocr_factura(imagen):
+def botones_descarga(etiqueta, hojas, nombre, clave):
     """
-    Usa el modelo FLASH (Más rápido y ligero)
-    Ideal para: Procesar imágenes masivas sin hacer esperar al usuario.
+    Botones de descarga del mismo reporte en Excel, CSV y Parquet. Mostrar los
+    resultados no genera nada: cada archivo se escribe con exportar.py solo al
+    pulsar su botón y queda memorizado por el contenido de las tablas.
+    Descargar no re-ejecuta la página: los resultados siguen en pantalla.
     """
-    try:
-        # MANTENEMOS 'flash' AQUÍ para velocidad
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        prompt = """Extrae datos JSON estricto: {"fecha": "YYYY-MM-DD", "nit": "num", "proveedor": "txt", "concepto": "txt", "base": num, "iva": num, "total": num}"""
-        response = model.generate_content([prompt, imagen])
-        return json.loads(response.text.replace("```json", "").replace("```", "").strip())
-    except:
+    c1, c2, c3 = st.columns([2, 1, 1])
+    for col, formato, texto in ((c1, 'xlsx', etiqueta), (c2, 'csv', "📄 CSV"), (c3, 'parquet', "🗜️ Parquet")):
+        nombre_archivo, mime = nombre_descarga(hojas, formato, nombre)
+        col.download_button(texto, data=descarga_diferida(hojas, formato, nombre), file_name=nombre_archivo,
+                            mime=mime, key=f"{clave}_{formato}", on_click="ignore")
+
+# ------------------------------------------------------------------------------
+# CATÁLOGO DE ARCHIVOS DEL USUARIO (PARQUET)
+# ------------------------------------------------------------------------------
+# Cada Excel/CSV subido se convierte una sola vez a Parquet (catalogo.py) y
+# queda disponible en todos los módulos: el auxiliar del cruce DIAN sirve
+# para gastos o tesorería sin volver a subirlo ni parsearlo.
+def cargar_dataset(etiqueta, clave, tipos=('xlsx',), contenedor=st):
+    """
+    Uploader + selector del catálogo del usuario. Retorna la ruta .parquet del
+    archivo subido (registrado en el catálogo) o del elegido, o None.
+    """
+    usuario = st.session_state['id_usuario']
+    subido = contenedor.file_uploader(etiqueta, type=list(tipos), key=clave)
+    if subido is not None:
+        try:
+            return registrar_dataset(subido, usuario)
+        except Exception as e:
+            contenedor.error(f"No se pudo leer '{subido.name}': {e}")
+            return None
+    previos = listar_datasets(usuario)
+    if not previos:
         return None
+    nombres = {d['ruta']: f"📚 {d['nombre']} · {d['filas']:,} filas" for d in previos}
+    return contenedor.selectbox("...o usar uno del catálogo", [None, *nombres], key=f"{clave}_catalogo",
+                                format_func=lambda r: "—" if r is None else nombres[r])
+
+# ------------------------------------------------------------------------------
+# DETECCIÓN DE COLUMNAS (deteccion_columnas.py)
+# ------------------------------------------------------------------------------
+# Un solo servicio puntúa encabezado y datos de cada columna; si un rol no se
+# identifica con seguridad queda vacío y se pide elegirlo. Lo que el usuario
+# confirma al ejecutar se recuerda para el siguiente archivo del mismo formato.
+def indice_columna(opciones, columna, desplazamiento=0):
+    """Posición de la columna detectada en un selectbox (None: sin preselección)."""
+    opciones = list(opciones)
+    return opciones.index(columna) + desplazamiento if columna in opciones else None
+
+def aviso_deteccion(*detecciones):
+    """Avisa si faltan roles por identificar. Retorna True si todas las columnas quedaron detectadas."""
+    faltan = [rol.replace('_', ' ') for mapeo, _ in detecciones for rol, col in mapeo.items() if col is None]
+    if faltan:
+        st.warning(f"⚠️ No se identificaron con seguridad las columnas de: {', '.join(dict.fromkeys(faltan))}. Elígelas abajo.")
+    elif all(recordado for _, recordado in detecciones):
+        st.info("🧠 Columnas recordadas de un archivo anterior con el mismo formato.")
+    return not faltan
+
+def confirmar_columnas(columnas, seleccion):
+    """
+    Antes de ejecutar: exige las columnas obligatorias ('seleccion' {rol:
+    columna}) y las recuerda para el próximo archivo con el mismo encabezado.
+    """
+    faltan = [rol.replace('_', ' ') for rol, col in seleccion.items() if col is None]
+    if faltan:
+        st.warning(f"⚠️ Elige las columnas de: {', '.join(faltan)}.")
+        return False
+    recordar_columnas(columnas, seleccion, st.session_state['id_usuario'])
+    return True
+
+# ------------------------------------------------------------------------------
+# TRABAJOS EN SEGUNDO PLANO (CONCILIACIÓN, XML, OCR)
+# ------------------------------------------------------------------------------
+# Los módulos pesados se envían a la cola de trabajos.py: la página solo guarda
+# el ID, consulta el avance y recoge el resultado al terminar. Un clic o una
+# recarga del navegador ya no cortan el proceso.
+def _etiqueta_trabajo(t):
+    return f"{datetime.fromtimestamp(t['creado']).strftime('%d/%m %H:%M')} · {t['descripcion'] or t['modulo']} · {t['estado'].upper()}"
+
+@st.fragment(run_every=1.0)
+def _avance_trabajo(id_trabajo):
+    """Se refresca sola cada segundo; al terminar el trabajo re-ejecuta la página para mostrar el resultado."""
+    t = estado_trabajo(id_trabajo)
+    if t and t['estado'] in ACTIVOS:
+        texto = "⏳ En cola..." if t['estado'] == PENDIENTE else f"⚙️ Procesando... {t['progreso']:.0%}"
+        st.progress(t['progreso'], text=texto)
+        parciales = resultado_parcial(id_trabajo)
+        if parciales:
+            st.caption(f"Resultados parciales: {len(parciales)} listos")
+            st.dataframe(pd.DataFrame(parciales), use_container_width=True)
+    else:
+        st.rerun()
+
+def panel_trabajos(modulo, clave):
+    """
+    Selector de los trabajos recientes del usuario en este módulo y su estado.
+    Retorna (id, resultado) con el resultado ({'hojas', 'resumen'}) si el
+    trabajo elegido terminó; (id, None) mientras corre o si falló.
+    """
+    recientes = listar_trabajos(usuario=st.session_state['id_usuario'], modulo=modulo, limite=10)
+    if not recientes:
+        return None, None
+    por_id = {t['id']: t for t in recientes}
+    if st.session_state.get(clave) not in por_id:
+        st.session_state.pop(clave, None)
+    st.divider()
+    id_trabajo = st.selectbox("🗂️ Trabajos recientes", list(por_id), format_func=lambda i: _etiqueta_trabajo(por_id[i]), key=clave)
+    t = por_id[id_trabajo]
+    if t['estado'] in ACTIVOS:
+        _avance_trabajo(id_trabajo)
+        return id_trabajo, None
+    if t['estado'] != TERMINADO:
+        st.error(f"❌ El trabajo no terminó: {t['error'] or t['estado']}")
+        return id_trabajo, None
+    return id_trabajo, resultado_trabajo(id_trabajo)
+
+# ------------------------------------------------------------------------------
+# OCR DE FACTURAS (VELOCIDAD)
+# ------------------------------------------------------------------------------
+# Planificador concurrente (hilos + límite RPM/TPM + reintentos) con un solo
+# cliente de modelo: ver procesar_ocr() en ocr_ia.py.
 
 # ------------------------------------------------------------------------------
 # PARSEADOR DE XML (FACTURACIÓN ELECTRÓNICA DIAN)
 # ------------------------------------------------------------------------------
-def parsear_xml_dian(archivo_xml):
-    try:
-        tree = ET.parse(archivo_xml)
-        root = tree.getroot()
-        ns = {'cac': 'urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2',
-              'cbc': 'urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2'}
-        def get_text(path, root_elem=root):
-            elem = root_elem.find(path, ns)
-            return elem.text if elem is not None else ""
-        
-        data = {}
-        data['Archivo'] = archivo_xml.name
-        data['Prefijo'] = get_text('.//cbc:ID')
-        data['Fecha Emision'] = get_text('.//cbc:IssueDate')
-        
-        emisor = root.find('.//cac:AccountingSupplierParty', ns)
-        if emisor:
-            data['NIT Emisor'] = get_text('.//cbc:CompanyID', emisor.find('.//cac:PartyTaxScheme', ns))
-            data['Emisor'] = get_text('.//cbc:RegistrationName', emisor.find('.//cac:PartyTaxScheme', ns))
-            
-        receptor = root.find('.//cac:AccountingCustomerParty', ns)
-        if receptor:
-            data['NIT Receptor'] = get_text('.//cbc:CompanyID', receptor.find('.//cac:PartyTaxScheme', ns))
-            data['Receptor'] = get_text('.//cbc:RegistrationName', receptor.find('.//cac:PartyTaxScheme', ns))
-            
-        monetary = root.find('.//cac:LegalMonetaryTotal', ns)
-        if monetary:
-            data['Total a Pagar'] = float(get_text('cbc:PayableAmount', monetary) or 0)
-            data['Base Imponible'] = float(get_text('cbc:LineExtensionAmount', monetary) or 0)
-            data['Total Impuestos'] = float(get_text('cbc:TaxInclusiveAmount', monetary) or 0) - data['Base Imponible']
-            
-        return data
-    except:
-        return {"Archivo": archivo_xml.name, "Error": "Error XML"}
+# La extracción vive en xml_dian.py: parsear_xml_dian() para un archivo y
+# lote_a_dataframe() para lotes (rutas directas precompiladas + procesos en paralelo).
 
 # ==============================================================================
 # ==============================================================================
@@ -567,12 +604,14 @@ with st.sidebar:
                     st.session_state['user_plan'] = 'PRO'
                     st.session_state['logged_in'] = True
                     st.session_state['username'] = 'Admin'
+                    st.session_state['id_usuario'] = 'admin'
                     registrar_log("Admin", "Login", "Ingreso exitoso al sistema")
                     st.rerun()
                 elif u == "cliente":
                     st.session_state['user_plan'] = 'FREE'
                     st.session_state['logged_in'] = True
                     st.session_state['username'] = 'Cliente'
+                    st.session_state['id_usuario'] = f"cliente-{uuid.uuid4().hex[:12]}"
                     registrar_log("Cliente", "Login", "Ingreso modo Free")
                     st.rerun()
                 else:
@@ -588,12 +627,15 @@ with st.sidebar:
         user_plan_safe = html.escape(str(st.session_state['user_plan']))
         estado_ia_safe = html.escape(str(estado_ia))
         status_db_safe = html.escape(str(status_db))
+        stats_ia = estadisticas_cache_ia()
+        cache_ia_safe = html.escape(f"♻️ Caché IA: {stats_ia['aciertos']} aciertos / {stats_ia['fallos']} fallos")
         
         st.markdown(f"""
         <div style='background: rgba(255,255,255,0.1); padding: 15px; border-radius: 10px; border-left: 5px solid {plan_bg}; margin-bottom: 20px;'>
             <small style='color: #cbd5e1;'>Bienvenido,</small><br>
             <strong style='font-size: 1.1rem;'>Usuario {user_plan_safe}</strong><br>
             <small>{estado_ia_safe}</small><br>
+            <small style='color: #cbd5e1;'>{cache_ia_safe}</small><br>
             <small style='color: {'#22c55e' if db_conectada else '#ef4444'}; font-weight:bold;'>{status_db_safe}</small>
         </div>
         """, unsafe_allow_html=True)
@@ -611,6 +653,7 @@ with st.sidebar:
         if st.button("Cerrar Sesión"):
             registrar_log(st.session_state['username'], "Logout", "Salida del sistema")
             st.session_state['logged_in'] = False
+            st.session_state['id_usuario'] = f"sesion-{uuid.uuid4().hex[:12]}"
             st.rerun()
 
     st.markdown("---")
@@ -792,56 +835,43 @@ else:
         col_dian, col_conta = st.columns(2)
         with col_dian:
             st.subheader("🏛️ 1. Archivo DIAN")
-            file_dian = st.file_uploader("Subir 'Reporte Terceros DIAN' (.xlsx)", type=['xlsx'])
+            file_dian = cargar_dataset("Subir 'Reporte Terceros DIAN' (.xlsx)", "upl_dian")
         with col_conta:
             st.subheader("📒 2. Contabilidad")
-            file_conta = st.file_uploader("Subir Auxiliar por Tercero (.xlsx)", type=['xlsx'])
+            file_conta = cargar_dataset("Subir Auxiliar por Tercero (.xlsx)", "upl_conta")
             
         if file_dian and file_conta:
-            df_dian = pd.read_excel(file_dian)
-            df_conta = pd.read_excel(file_conta)
-            
-            # Cerebro de Auto-Detección
-            def detectar_idx(columnas, keywords):
-                cols_str = [str(c).lower().strip() for c in columnas]
-                for i, col in enumerate(cols_str):
-                    for kw in keywords:
-                        if kw in col: return i
-                return 0
-            
-            kw_nit = ['nit', 'n.i.t', 'cedula', 'documento', 'id', 'tercero']
-            kw_valor = ['valor', 'saldo', 'total', 'monto', 'pago', 'cuantia']
+            # Solo leemos encabezados: las columnas de datos se cargan al ejecutar (ingesta.py)
+            cols_dian = columnas_archivo(file_dian)
+            cols_conta = columnas_archivo(file_conta)
             
-            idx_nit_d = detectar_idx(df_dian.columns, kw_nit)
-            idx_val_d = detectar_idx(df_dian.columns, kw_valor)
-            idx_nit_c = detectar_idx(df_conta.columns, kw_nit)
-            idx_val_c = detectar_idx(df_conta.columns, kw_valor)
+            # Cerebro de Auto-Detección (encabezado + muestra de datos, deteccion_columnas.py)
+            det_dian = detectar_columnas(muestra_archivo(file_dian), ['nit', 'valor'], st.session_state['id_usuario'])
+            det_conta = detectar_columnas(muestra_archivo(file_conta), ['nit', 'valor'], st.session_state['id_usuario'])
             
             st.divider()
-            st.success(f"✅ Sistema Autoconfigurado: Se usarán las columnas '{df_dian.columns[idx_nit_d]}' y '{df_dian.columns[idx_val_d]}' automáticamente.")
+            completas = aviso_deteccion(det_dian, det_conta)
+            if completas:
+                st.success(f"✅ Sistema Autoconfigurado: Se usarán las columnas '{det_dian[0]['nit']}' y '{det_dian[0]['valor']}' automáticamente.")
             
-            with st.expander("🛠️ (Opcional) Ver o cambiar columnas seleccionadas manualmente"):
+            with st.expander("🛠️ (Opcional) Ver o cambiar columnas seleccionadas manualmente", expanded=not completas):
                 c1, c2, c3, c4 = st.columns(4)
-                nit_dian = c1.selectbox("NIT (DIAN)", df_dian.columns, index=idx_nit_d)
-                val_dian = c2.selectbox("Valor (DIAN)", df_dian.columns, index=idx_val_d)
-                nit_conta = c3.selectbox("NIT (Conta)", df_conta.columns, index=idx_nit_c)
-                val_conta = c4.selectbox("Valor (Conta)", df_conta.columns, index=idx_val_c)
+                nit_dian = c1.selectbox("NIT (DIAN)", cols_dian, index=indice_columna(cols_dian, det_dian[0]['nit']))
+                val_dian = c2.selectbox("Valor (DIAN)", cols_dian, index=indice_columna(cols_dian, det_dian[0]['valor']))
+                nit_conta = c3.selectbox("NIT (Conta)", cols_conta, index=indice_columna(cols_conta, det_conta[0]['nit']))
+                val_conta = c4.selectbox("Valor (Conta)", cols_conta, index=indice_columna(cols_conta, det_conta[0]['valor']))
 
-            if st.button("▶️ EJECUTAR AUDITORÍA AHORA", type="primary"):
+            ejecutar = st.button("▶️ EJECUTAR AUDITORÍA AHORA", type="primary")
+            if ejecutar and confirmar_columnas(cols_dian, {'nit': nit_dian, 'valor': val_dian}) and confirmar_columnas(cols_conta, {'nit': nit_conta, 'valor': val_conta}):
                 try:
                     # registrar_log(st.session_state['username'], "Auditoria", "Ejecución cruce DIAN") # Comentado por seguridad si falta la funcion
-                    dian_grouped = df_dian.groupby(nit_dian)[val_dian].sum().reset_index(name='Valor_DIAN').rename(columns={nit_dian: 'NIT'})
-                    conta_grouped = df_conta.groupby(nit_conta)[val_conta].sum().reset_index(name='Valor_Conta').rename(columns={nit_conta: 'NIT'})
+                    # Agregación por bloques: la memoria depende de los terceros, no de las líneas del auxiliar
+                    resultado = auditoria_exogena(file_dian, file_conta, nit_dian, val_dian, nit_conta, val_conta)
+                    diferencias = resultado['hojas']['Diferencias']
                     
-                    dian_grouped['NIT'] = dian_grouped['NIT'].astype(str).str.strip()
-                    conta_grouped['NIT'] = conta_grouped['NIT'].astype(str).str.strip()
-
-                    cruce = pd.merge(dian_grouped, conta_grouped, on='NIT', how='outer').fillna(0)
-                    cruce['Diferencia'] = cruce['Valor_DIAN'] - cruce['Valor_Conta']
-                    diferencias = cruce[abs(cruce['Diferencia']) > 1000].sort_values(by="Diferencia", ascending=False)
-                    
-                    num_hallazgos = len(diferencias)
-                    total_riesgo = diferencias['Diferencia'].abs().sum()
+                    num_hallazgos = resultado['resumen']['hallazgos']
+                    dv_errados = resultado['resumen']['dv_errados']
+                    total_riesgo = resultado['resumen']['riesgo_total']
                     
                     st.divider()
                     if num_hallazgos == 0:
@@ -849,9 +879,10 @@ else:
                         st.success("✅ ¡Perfecto! No hay diferencias entre la DIAN y tu Contabilidad.")
                     else:
                         st.error(f"⚠️ Se encontraron {num_hallazgos} inconsistencias.")
-                        col_met1, col_met2 = st.columns(2)
+                        col_met1, col_met2, col_met3 = st.columns(3)
                         col_met1.metric("Riesgo Total", f"${total_riesgo:,.0f}")
                         col_met2.metric("Terceros con Error", num_hallazgos)
+                        col_met3.metric("NIT con DV Errado", dv_errados)
                         
                         if st.session_state.get('user_plan') == 'FREE':
                             st.warning("🔒 Versión GRATUITA: Solo se muestran los primeros 3 errores.")
@@ -869,242 +900,191 @@ else:
     elif menu == "Minería de XML (Facturación)":
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/2823/2823523.png' class='pro-module-icon'><div class='pro-module-title'><h2>Minería de Datos XML (Facturación)</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Extraer información estructurada directamente de los archivos XML de Facturación Electrónica validados por la DIAN.</div>""", unsafe_allow_html=True)
-        archivos_xml = st.file_uploader("Cargar XMLs (Lote)", type=['xml'], accept_multiple_files=True)
-        if archivos_xml and st.button("▶️ INICIAR PROCESAMIENTO"):
+        archivos_xml = st.file_uploader("Cargar XMLs o ZIP de la DIAN/Proveedores (Lote)", type=['xml', 'zip'], accept_multiple_files=True)
+        fuentes_xml = list(archivos_xml or [])
+        if st.session_state.get('user_plan') == 'PRO' and CARPETA_XML_SERVIDOR:
+            # Solo carpetas dentro de la raíz configurada (CONTADOR_XML_DIR)
+            carpeta_xml = st.text_input(f"📂 (Opcional) Carpeta con XML/ZIP dentro de {CARPETA_XML_SERVIDOR}:", key="xml_carpeta")
+            if carpeta_xml:
+                ruta_xml = carpeta_servidor(carpeta_xml)
+                if ruta_xml: fuentes_xml.append(ruta_xml)
+                else: st.error("❌ La carpeta no existe o está fuera de la carpeta permitida del servidor.")
+        if fuentes_xml and st.button("▶️ INICIAR PROCESAMIENTO"):
             st.toast("Procesando lote de archivos...")
-            datos_xml = []; barra = st.progress(0)
-            for i, f in enumerate(archivos_xml): barra.progress((i+1)/len(archivos_xml)); datos_xml.append(parsear_xml_dian(f))
-            df_xml = pd.DataFrame(datos_xml)
-            st.success("Extracción completada."); st.dataframe(df_xml, use_container_width=True)
-            out = io.BytesIO(); 
-            with pd.ExcelWriter(out, engine='xlsxwriter') as w: df_xml.to_excel(w, index=False)
-            st.download_button("📥 Descargar Reporte Maestro (.xlsx)", out.getvalue(), "Resumen_XML.xlsx")
-            registrar_log(st.session_state['username'], "Mineria XML", f"Procesados {len(archivos_xml)} archivos")
+            # Extracción por lotes en segundo plano: los XML (sueltos, dentro de ZIP o AttachedDocument) se leen
+            # de a uno, se reparten entre varios procesos y en una sola pasada salen encabezados, líneas e impuestos
+            st.session_state['trabajo_xml'] = enviar_trabajo('xml', {'fuentes': fuentes_xml}, usuario=st.session_state['id_usuario'],
+                                                             descripcion=f"{len(fuentes_xml)} archivos / carpetas")
+            registrar_log(st.session_state['username'], "Mineria XML", f"Enviados {len(fuentes_xml)} archivos / carpetas")
+        id_xml, resultado_xml = panel_trabajos('xml', 'trabajo_xml')
+        if resultado_xml:
+            hojas_xml = resultado_xml['hojas']
+            df_xml, df_lineas_xml, df_impuestos_xml = hojas_xml.values()
+            st.success(f"Extracción completada: {len(df_xml)} documentos.")
+            tx1, tx2, tx3 = st.tabs(["🧾 Facturas", "📦 Líneas de Detalle", "💰 Impuestos y Retenciones"])
+            with tx1: st.dataframe(df_xml, use_container_width=True)
+            with tx2: st.dataframe(df_lineas_xml, use_container_width=True)
+            with tx3: st.dataframe(df_impuestos_xml, use_container_width=True)
+            botones_descarga("📥 Descargar Reporte Maestro (.xlsx)", hojas_xml, "Resumen_XML", f"dl_xml_{id_xml}")
 
     elif menu == "Conciliación Bancaria IA":
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/2489/2489756.png' class='pro-module-icon'><div class='pro-module-title'><h2>Conciliación Bancaria Inteligente</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Automatizar el emparejamiento de transacciones entre el Extracto Bancario y el Libro Auxiliar de Bancos usando lógica difusa (Fechas cercanas).</div>""", unsafe_allow_html=True)
         
         col_banco, col_libro = st.columns(2)
-        with col_banco: st.subheader("🏦 Extracto Bancario"); file_banco = st.file_uploader("Subir Excel Banco", type=['xlsx'])
-        with col_libro: st.subheader("📒 Libro Auxiliar"); file_libro = st.file_uploader("Subir Excel Contabilidad", type=['xlsx'])
+        with col_banco: st.subheader("🏦 Extracto Bancario"); file_banco = cargar_dataset("Subir Excel Banco", "upl_banco")
+        with col_libro: st.subheader("📒 Libro Auxiliar"); file_libro = cargar_dataset("Subir Excel Contabilidad", "upl_libro")
         
         if file_banco and file_libro:
             # Lectura
-            df_banco = pd.read_excel(file_banco)
-            df_libro = pd.read_excel(file_libro)
-            
-            # --- CEREBRO DE AUTO-DETECCIÓN ---
-            def detectar_idx(columnas, keywords):
-                cols_str = [str(c).lower().strip() for c in columnas]
-                for i, col in enumerate(cols_str):
-                    for kw in keywords:
-                        if kw in col: return i
-                return 0
+            df_banco = leer_excel(file_banco)
+            df_libro = leer_excel(file_libro)
             
-            kw_fecha = ['fecha', 'date', 'dia', 'fec']
-            kw_valor = ['valor', 'monto', 'importe', 'saldo', 'debito', 'credito', 'total']
-            kw_desc = ['desc', 'detalle', 'concepto', 'tercero', 'referencia']
-            
-            idx_fb = detectar_idx(df_banco.columns, kw_fecha)
-            idx_vb = detectar_idx(df_banco.columns, kw_valor)
-            idx_db = detectar_idx(df_banco.columns, kw_desc)
-            
-            idx_fl = detectar_idx(df_libro.columns, kw_fecha)
-            idx_vl = detectar_idx(df_libro.columns, kw_valor)
+            # --- CEREBRO DE AUTO-DETECCIÓN (deteccion_columnas.py) ---
+            det_banco = detectar_columnas(df_banco, ['fecha', 'valor', 'descripcion'], st.session_state['id_usuario'])
+            det_libro = detectar_columnas(df_libro, ['fecha', 'valor'], st.session_state['id_usuario'])
+            det_desc_l, _ = detectar_columnas(df_libro, ['descripcion'], st.session_state['id_usuario'], opcionales=True)
             
             st.divider()
-            st.success(f"✅ Configuración Automática: Se comparará '{df_banco.columns[idx_vb]}' del Banco vs '{df_libro.columns[idx_vl]}' del Libro.")
+            completas = aviso_deteccion(det_banco, det_libro)
+            if completas:
+                st.success(f"✅ Configuración Automática: Se comparará '{det_banco[0]['valor']}' del Banco vs '{det_libro[0]['valor']}' del Libro.")
 
-            with st.expander("🛠️ Ver/Editar Columnas Seleccionadas"):
+            with st.expander("🛠️ Ver/Editar Columnas Seleccionadas", expanded=not completas):
                 c1, c2, c3, c4 = st.columns(4)
-                col_fecha_b = c1.selectbox("Fecha Banco:", df_banco.columns, index=idx_fb, key="fb")
-                col_valor_b = c2.selectbox("Valor Banco:", df_banco.columns, index=idx_vb, key="vb")
-                col_fecha_l = c3.selectbox("Fecha Libro:", df_libro.columns, index=idx_fl, key="fl")
-                col_valor_l = c4.selectbox("Valor Libro:", df_libro.columns, index=idx_vl, key="vl")
-                col_desc_b = st.selectbox("Descripción Banco:", df_banco.columns, index=idx_db, key="db")
-
-            if st.button("▶️ EJECUTAR CONCILIACIÓN AHORA", type="primary"):
+                col_fecha_b = c1.selectbox("Fecha Banco:", df_banco.columns, index=indice_columna(df_banco.columns, det_banco[0]['fecha']), key="fb")
+                col_valor_b = c2.selectbox("Valor Banco:", df_banco.columns, index=indice_columna(df_banco.columns, det_banco[0]['valor']), key="vb")
+                col_fecha_l = c3.selectbox("Fecha Libro:", df_libro.columns, index=indice_columna(df_libro.columns, det_libro[0]['fecha']), key="fl")
+                col_valor_l = c4.selectbox("Valor Libro:", df_libro.columns, index=indice_columna(df_libro.columns, det_libro[0]['valor']), key="vl")
+                d1, d2 = st.columns(2)
+                col_desc_b = d1.selectbox("Descripción Banco:", df_banco.columns, index=indice_columna(df_banco.columns, det_banco[0]['descripcion']), key="db")
+                desc_l = d2.selectbox("Descripción / Comprobante Libro (Opcional):", ["No Aplica"] + list(df_libro.columns),
+                                      index=indice_columna(df_libro.columns, det_desc_l['descripcion'], 1) or 0, key="dl")
+                n1, n2 = st.columns(2)
+                nit_b = n1.selectbox("NIT Tercero Banco (Opcional):", ["No Aplica"] + list(df_banco.columns), key="nb")
+                nit_l = n2.selectbox("NIT Tercero Libro (Opcional):", ["No Aplica"] + list(df_libro.columns), key="nl")
+
+            with st.expander("⚙️ Reglas de Emparejamiento (Tolerancias)"):
+                r1, r2, r3 = st.columns(3)
+                dias_tol = r1.number_input("Días de tolerancia (±)", min_value=0, max_value=60, value=3, key="tol_dias")
+                valor_tol = r2.number_input("Tolerancia de valor ($)", min_value=0.0, value=0.0, step=100.0, key="tol_valor")
+                max_grupo = r3.number_input("Máx. partidas por agrupación", min_value=2, max_value=6, value=3, key="tol_grupo")
+                usar_grupos = st.checkbox("Buscar agrupaciones (1 Banco : N Libro y N Banco : 1 Libro)", value=False, key="tol_grupos")
+
+            with st.expander("🔁 Conciliación Continua (Mes a Mes)"):
+                st.caption("Recuerda lo ya conciliado y arrastra las partidas abiertas al siguiente periodo: solo se cruza lo nuevo.")
+                cuenta_cc = st.text_input("Identificador de la cuenta (ej: Bancolombia Ahorros 1234)", key="cc_cuenta").strip()
+                if cuenta_cc and st.button("🗑️ Reiniciar historial de esta cuenta", key="cc_reset"):
+                    olvidar_cuenta(st.session_state['id_usuario'], cuenta_cc)
+                    st.success("Historial borrado: la próxima conciliación empieza desde cero.")
+
+            ejecutar = st.button("▶️ EJECUTAR CONCILIACIÓN AHORA", type="primary")
+            if ejecutar and confirmar_columnas(list(df_banco.columns), {'fecha': col_fecha_b, 'valor': col_valor_b, 'descripcion': col_desc_b}) and confirmar_columnas(list(df_libro.columns), {'fecha': col_fecha_l, 'valor': col_valor_l}):
                 registrar_log(st.session_state['username'], "Conciliacion", "Inicio matching bancario")
                 
-                # Normalización de Fechas
-                try:
-                    df_banco['Fecha_Dt'] = pd.to_datetime(df_banco[col_fecha_b])
-                    df_libro['Fecha_Dt'] = pd.to_datetime(df_libro[col_fecha_l])
-                except:
-                    st.error("Error en formato de fechas. Asegúrate que las columnas de fecha sean correctas.")
-                    st.stop()
-
-                df_banco['Conciliado'] = False
-                df_libro['Conciliado'] = False
-                matches = []
-                
-                bar = st.progress(0)
-                total_rows = len(df_banco)
-                
-                # ALGORITMO DE MATCHING INTELIGENTE
-                # Optimización: Usamos zip para iterar más rápido que iterrows
-                # Extraemos las columnas necesarias a listas/arrays para velocidad
-                # Nota: Necesitamos el índice original (idx_b) para actualizar 'Conciliado'
-                for i, (idx_b, vb, fb, fecha_b_orig, desc_b) in enumerate(zip(df_banco.index, df_banco[col_valor_b], df_banco['Fecha_Dt'], df_banco[col_fecha_b], df_banco[col_desc_b])):
-                    bar.progress((i+1)/total_rows)
-                    
-                    # Busca coincidencias: Mismo valor, no conciliado aun, y fecha +/- 3 días
-                    # Nota: df_libro se filtra repetidamente. Para grandes volúmenes esto debería ser vectorizado,
-                    # pero dada la lógica 'first match consumes', la iteración es necesaria para mantener estado.
-                    cands = df_libro[
-                        (df_libro[col_valor_l] == vb) & 
-                        (~df_libro['Conciliado']) & 
-                        (df_libro['Fecha_Dt'].between(fb - timedelta(days=3), fb + timedelta(days=3)))
-                    ]
-                    
-                    if not cands.empty:
-                        # Si encuentra match, marca ambos como conciliados
-                        match_idx = cands.index[0]
-                        df_banco.at[idx_b, 'Conciliado'] = True
-                        df_libro.at[match_idx, 'Conciliado'] = True
-                        
-                        f_libro_str = df_libro.at[match_idx, col_fecha_l]
-                        matches.append({
-                            "Fecha Banco": str(fecha_b_orig),
-                            "Fecha Libro": str(f_libro_str),
-                            "Descripción": str(desc_b),
-                            "Valor Cruzado": f"${vb:,.2f}",
-                            "Estado": "✅ AUTOMÁTICO"
-                        })
-                
-                st.divider()
-                st.balloons()
-                st.success(f"🚀 ¡Proceso Terminado! {len(matches)} partidas conciliadas automáticamente.")
-                
-                # PREPARAR ARCHIVO PARA DESCARGA
-                df_matches = pd.DataFrame(matches)
-                df_pend_banco = df_banco[~df_banco['Conciliado']]
-                df_pend_libro = df_libro[~df_libro['Conciliado']]
-                
-                buffer = io.BytesIO()
-                with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                    df_matches.to_excel(writer, sheet_name='1. Cruzados', index=False)
-                    df_pend_banco.to_excel(writer, sheet_name='2. Pendientes Banco', index=False)
-                    df_pend_libro.to_excel(writer, sheet_name='3. Pendientes Libros', index=False)
-                    
-                st.download_button(
-                    label="📥 DESCARGAR CONCILIACIÓN (.xlsx)",
-                    data=buffer.getvalue(),
-                    file_name=f"Conciliacion_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                    mime="application/vnd.ms-excel"
-                )
-                
-                t1, t2, t3 = st.tabs(["✅ Partidas Cruzadas", "⚠️ Pendientes en Banco", "⚠️ Pendientes en Libros"])
-                
-                with t1: 
-                    st.dataframe(df_matches, use_container_width=True)
-                with t2: 
-                    st.warning("Estas partidas están en el Banco pero NO en tu contabilidad:")
-                    st.dataframe(df_pend_banco, use_container_width=True)
-                with t3: 
-                    st.warning("Estos registros están en Contabilidad pero NO han salido del Banco:")
-                    st.dataframe(df_pend_libro, use_container_width=True)
+                # ALGORITMO DE MATCHING INTELIGENTE (POR ETAPAS) - ver auditorias.auditoria_conciliacion
+                # 1. Exacto: mismo valor, fecha +/- N días ('first match consumes', ver conciliacion.py)
+                # 2. Tolerancia de valor (comisiones, redondeos) y 3. Agrupaciones N a 1 (opcionales)
+                # Con NIT en ambos lados, antes del exacto se cruza por (valor, NIT)
+                # Con cuenta, solo entran al motor las partidas nuevas y las abiertas de periodos anteriores
+                # Corre en segundo plano (trabajos.py): el resultado se recoge abajo por ID
+                st.session_state['trabajo_conc'] = enviar_trabajo('conciliacion', dict(
+                    archivo_banco=file_banco, archivo_libro=file_libro,
+                    col_fecha_b=col_fecha_b, col_valor_b=col_valor_b, col_fecha_l=col_fecha_l, col_valor_l=col_valor_l,
+                    col_desc_b=col_desc_b, col_desc_l=desc_l if desc_l != "No Aplica" else None,
+                    col_nit_b=nit_b if nit_b != "No Aplica" else None,
+                    col_nit_l=nit_l if nit_l != "No Aplica" else None,
+                    dias_tolerancia=int(dias_tol), tolerancia_valor=float(valor_tol), max_partidas=int(max_grupo),
+                    agrupaciones=usar_grupos, cuenta=cuenta_cc or None, usuario=st.session_state['id_usuario'],
+                ), usuario=st.session_state['id_usuario'], descripcion=f"{nombre_dataset(file_banco)} vs {nombre_dataset(file_libro)}")
+
+        id_conc, resultado = panel_trabajos('conciliacion', 'trabajo_conc')
+        if resultado:
+            resumen_cc = resultado['resumen']
+            if 'conciliadas_antes_banco' in resumen_cc:
+                st.info(f"🔁 Ya conciliadas en periodos anteriores: {resumen_cc['conciliadas_antes_banco']} del banco y "
+                        f"{resumen_cc['conciliadas_antes_libro']} del libro. Partidas abiertas arrastradas: "
+                        f"{resumen_cc['arrastradas_banco']} del banco y {resumen_cc['arrastradas_libro']} del libro.")
+            hojas_cc = resultado['hojas']
+            df_matches, df_pend_banco, df_pend_libro = hojas_cc['1. Cruzados'], hojas_cc['2. Pendientes Banco'], hojas_cc['3. Pendientes Libros']
+            df_sugeridas = hojas_cc.get('4. Sugeridas (Revisar)')
+            
+            st.success(f"🚀 ¡Proceso Terminado! {len(df_matches)} partidas conciliadas automáticamente.")
+            if df_sugeridas is not None and len(df_sugeridas):
+                st.info(f"🔎 {len(df_sugeridas)} agrupaciones sugeridas para revisar (ambiguas o cuadradas por tolerancia). Sus partidas siguen pendientes.")
+            
+            # ARCHIVO PARA DESCARGA
+            botones_descarga(
+                "📥 DESCARGAR CONCILIACIÓN (.xlsx)", resultado['hojas'],
+                f"Conciliacion_{datetime.now().strftime('%Y%m%d')}", f"dl_conc_{id_conc}"
+            )
+            
+            t1, t2, t3 = st.tabs(["✅ Partidas Cruzadas", "⚠️ Pendientes en Banco", "⚠️ Pendientes en Libros"])
+            
+            with t1: 
+                st.dataframe(df_matches, use_container_width=True)
+            with t2: 
+                st.warning("Estas partidas están en el Banco pero NO en tu contabilidad:")
+                st.dataframe(df_pend_banco, use_container_width=True)
+            with t3: 
+                st.warning("Estos registros están en Contabilidad pero NO han salido del Banco:")
+                st.dataframe(df_pend_libro, use_container_width=True)
+            if df_sugeridas is not None and len(df_sugeridas):
+                with st.expander("🔎 Agrupaciones Sugeridas (Revisar)"):
+                    st.dataframe(df_sugeridas, use_container_width=True)
 
     elif menu == "Auditoría Fiscal de Gastos":
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/1642/1642346.png' class='pro-module-icon'><div class='pro-module-title'><h2>Auditoría Fiscal Masiva (Art. 771-5)</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Verificar el cumplimiento de los requisitos de deducibilidad (Bancarización y Retenciones).<br>Detecta pagos en efectivo superiores a 100 UVT y bases de retención omitidas.</div>""", unsafe_allow_html=True)
         
-        ar = st.file_uploader("Cargar Auxiliar de Gastos (.xlsx)", type=['xlsx'])
+        ar = cargar_dataset("Cargar Auxiliar de Gastos (.xlsx)", "upl_gastos")
         
         if ar:
-            df = pd.read_excel(ar)
+            df = leer_excel(ar)
             
-            # --- CEREBRO DE AUTO-DETECCIÓN ---
-            def detectar_idx(columnas, keywords):
-                cols_str = [str(c).lower().strip() for c in columnas]
-                for i, col in enumerate(cols_str):
-                    for kw in keywords:
-                        if kw in col: return i
-                return 0
-
-            # Palabras clave
-            kw_fecha = ['fecha', 'date', 'dia']
-            kw_tercero = ['tercero', 'beneficiario', 'nombre', 'proveedor']
-            kw_valor = ['valor', 'monto', 'importe', 'saldo', 'debito', 'total']
-            kw_metodo = ['metodo', 'forma', 'pago', 'medio', 'banco', 'caja']
-            kw_concepto = ['concepto', 'detalle', 'descripcion', 'nota']
-
-            # Detección
-            idx_f = detectar_idx(df.columns, kw_fecha)
-            idx_t = detectar_idx(df.columns, kw_tercero)
-            idx_v = detectar_idx(df.columns, kw_valor)
-            idx_m = detectar_idx(df.columns, kw_metodo)
-            idx_c = detectar_idx(df.columns, kw_concepto)
+            # --- CEREBRO DE AUTO-DETECCIÓN (deteccion_columnas.py) ---
+            det = detectar_columnas(df, ['fecha', 'tercero', 'valor', 'metodo_pago'], st.session_state['id_usuario'])
+            det_c, _ = detectar_columnas(df, ['concepto'], st.session_state['id_usuario'], opcionales=True)
 
             st.divider()
-            st.success(f"✅ Configuración Automática: Analizando columna '{df.columns[idx_v]}' según método '{df.columns[idx_m]}'.")
+            completas = aviso_deteccion(det)
+            if completas:
+                st.success(f"✅ Configuración Automática: Analizando columna '{det[0]['valor']}' según método '{det[0]['metodo_pago']}'.")
 
-            with st.expander("🛠️ Ver/Editar Columnas Seleccionadas"):
+            with st.expander("🛠️ Ver/Editar Columnas Seleccionadas", expanded=not completas):
                 c1, c2, c3, c4 = st.columns(4)
-                cf = c1.selectbox("Fecha", df.columns, index=idx_f)
-                ct = c2.selectbox("Tercero", df.columns, index=idx_t)
-                cv = c3.selectbox("Valor", df.columns, index=idx_v)
-                cm = c4.selectbox("Método de Pago", df.columns, index=idx_m)
-                cc = st.selectbox("Concepto (Opcional)", df.columns, index=idx_c)
-
-            if st.button("▶️ ANALIZAR RIESGOS FISCALES", type="primary"):
+                cf = c1.selectbox("Fecha", df.columns, index=indice_columna(df.columns, det[0]['fecha']))
+                ct = c2.selectbox("Tercero", df.columns, index=indice_columna(df.columns, det[0]['tercero']))
+                cv = c3.selectbox("Valor", df.columns, index=indice_columna(df.columns, det[0]['valor']))
+                cm = c4.selectbox("Método de Pago", df.columns, index=indice_columna(df.columns, det[0]['metodo_pago']))
+                cc = st.selectbox("Concepto (Opcional)", df.columns, index=indice_columna(df.columns, det_c['concepto']))
+
+            ejecutar = st.button("▶️ ANALIZAR RIESGOS FISCALES", type="primary")
+            if ejecutar and confirmar_columnas(list(df.columns), {'fecha': cf, 'tercero': ct, 'valor': cv, 'metodo_pago': cm}):
                 registrar_log(st.session_state['username'], "Auditoria Gastos", "Inicio escaneo 771-5")
                 
-                # Optimización: Uso de apply en lugar de iterar con to_dict('records')
-                # Pre-calculamos valores seguros numéricos
-                df['val_check_safe'] = pd.to_numeric(df[cv], errors='coerce').fillna(0)
-                
-                # Definimos una función wrapper para usar en apply
-                def wrapper_analisis(row):
-                    return analizar_gasto_fila(row, cv, cm, cc)
-
-                # Ejecutamos análisis vectorizado (row-wise pero optimizado por pandas)
-                analisis_result = df.apply(wrapper_analisis, axis=1)
-                
-                # Expandimos los resultados
-                df['Hallazgo_Temp'] = analisis_result.apply(lambda x: x[0])
-                df['Riesgo_Temp'] = analisis_result.apply(lambda x: x[1])
-                
-                # Filtramos resultados
-                df_riesgos = df[df['Riesgo_Temp'] != "BAJO"].copy()
+                # Motor de reglas vectorizado: cada regla es una máscara sobre columnas completas.
+                # Los topes en UVT se toman del año de la fecha de cada gasto (auditorias.auditoria_gastos).
+                resultado = auditoria_gastos(ar, cf, ct, cv, cm)
+                df_res = resultado['hojas']['Hallazgos']
                 
                 st.divider()
-                if df_riesgos.empty:
+                if df_res.empty:
                     st.balloons()
                     st.success("✅ ¡Excelente! No se encontraron riesgos fiscales evidentes en los gastos analizados.")
                 else:
-                    st.warning(f"⚠️ Se encontraron {len(df_riesgos)} operaciones con riesgo fiscal.")
-                    
-                    # Construimos DataFrame de reporte
-                    df_res = pd.DataFrame({
-                        "Fecha": df_riesgos[cf].astype(str),
-                        "Tercero": df_riesgos[ct].astype(str),
-                        "Valor": df_riesgos['val_check_safe'].apply(lambda x: f"${x:,.0f}"),
-                        "Método Pago": df_riesgos[cm].astype(str),
-                        "Riesgo": df_riesgos['Riesgo_Temp'],
-                        "Hallazgo": df_riesgos['Hallazgo_Temp']
-                    })
+                    st.warning(f"⚠️ Se encontraron {len(df_res)} operaciones con riesgo fiscal.")
                     
                     # Métricas rápidas
                     col_a, col_b = st.columns(2)
-                    riesgo_alto = len(df_res[df_res['Riesgo'] == 'ALTO'])
-                    col_a.metric("Rechazos Fiscales (Efectivo)", riesgo_alto)
-                    col_b.metric("Alertas de Retención", len(df_res) - riesgo_alto)
+                    col_a.metric("Rechazos Fiscales (Efectivo)", resultado['resumen']['riesgo_alto'])
+                    col_b.metric("Alertas de Retención", resultado['resumen']['alertas_retencion'])
 
                     st.dataframe(df_res, use_container_width=True)
                     
                     # Botón Descarga
-                    buffer = io.BytesIO()
-                    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                        df_res.to_excel(writer, index=False)
-                    
-                    st.download_button(
-                        label="📥 DESCARGAR REPORTE DE HALLAZGOS",
-                        data=buffer.getvalue(),
-                        file_name="Auditoria_Fiscal_Gastos.xlsx",
-                        mime="application/vnd.ms-excel"
-                    )
+                    botones_descarga("📥 DESCARGAR REPORTE DE HALLAZGOS", resultado['hojas'],
+                                     "Auditoria_Fiscal_Gastos", "dl_gastos")
 
     # --------------------------------------------------------------------------
     # MÓDULO 1: ESCÁNER UGPP (LEY 1393 - REGLA DEL 40%)
@@ -1113,68 +1093,45 @@ else:
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/3135/3135817.png' class='pro-module-icon'><div class='pro-module-title'><h2>Escáner de Riesgo UGPP (Ley 1393)</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Auditar pagos laborales. Verifica si los pagos NO salariales exceden el 40% del total (Art. 30 Ley 1393).</div>""", unsafe_allow_html=True)
         
-        an = st.file_uploader("Cargar Nómina UGPP (.xlsx)", type=['xlsx'], key="upl_ugpp")
+        an = cargar_dataset("Cargar Nómina UGPP (.xlsx)", "upl_ugpp")
         if an:
-            dn = pd.read_excel(an)
+            dn = leer_excel(an)
             
             # FILTRO INTELIGENTE: Solo columnas numéricas
             cols_todas = dn.columns.tolist()
-            cols_numericas = dn.select_dtypes(include=['float64', 'int64']).columns.tolist()
+            cols_numericas = dn.select_dtypes(include='number').columns.tolist()
             if not cols_numericas: cols_numericas = cols_todas
 
-            # Auto-detección
-            def detectar_idx(columnas, keywords):
-                cols_str = [str(c).lower().strip() for c in columnas]
-                for i, col in enumerate(cols_str):
-                    for kw in keywords:
-                        if kw in col: return i
-                return 0
-
-            idx_e = detectar_idx(cols_todas, ['nombre', 'empleado', 'tercero'])
-            idx_s = detectar_idx(cols_numericas, ['salario', 'sueldo', 'basico'])
+            # Auto-detección (deteccion_columnas.py); los opcionales quedan en "No Aplica" si no se detectan
+            det = detectar_columnas(dn, ['empleado', 'salario'], st.session_state['id_usuario'])
+            det_op, _ = detectar_columnas(dn, ['no_salarial', 'periodo'], st.session_state['id_usuario'], opcionales=True)
             
             st.divider()
+            aviso_deteccion(det)
             with st.expander("🛠️ Configuración de Columnas", expanded=True):
                 c1, c2, c3 = st.columns(3)
-                cn = c1.selectbox("Empleado", cols_todas, index=idx_e, key="ugpp_n")
-                cs = c2.selectbox("Salario Básico", cols_numericas, index=idx_s, key="ugpp_s")
+                cn = c1.selectbox("Empleado", cols_todas, index=indice_columna(cols_todas, det[0]['empleado']), key="ugpp_n")
+                cs = c2.selectbox("Salario Básico", cols_numericas, index=indice_columna(cols_numericas, det[0]['salario']), key="ugpp_s")
                 
                 # Opción "Ninguno" por si no hay bonos
                 opciones_ns = ["< No Aplica / Es $0 >"] + cols_numericas
-                cns = c3.selectbox("Pagos No Salariales (Bonos/Auxilios)", opciones_ns, index=0, key="ugpp_ns")
-
-            if st.button("▶️ ESCANEAR RIESGO UGPP", type="primary"):
-                # Optimización: Vectorización con Pandas
-                
-                # Conversión numérica segura
-                dn['salario_safe'] = pd.to_numeric(dn[cs], errors='coerce').fillna(0)
-                if cns == "< No Aplica / Es $0 >":
-                    dn['no_salarial_safe'] = 0.0
-                else:
-                    dn['no_salarial_safe'] = pd.to_numeric(dn[cns], errors='coerce').fillna(0)
-                
-                # Cálculos vectorizados
-                dn['total_rem'] = dn['salario_safe'] + dn['no_salarial_safe']
-                dn['limite_40'] = dn['total_rem'] * 0.40
-                dn['exceso'] = dn['no_salarial_safe'] - dn['limite_40']
-                # Si no hay exceso (negativo), ponemos 0
-                dn['exceso'] = dn['exceso'].clip(lower=0)
-                
-                dn['estado'] = dn['exceso'].apply(lambda x: "RIESGO ALTO" if x > 0 else "OK")
-                
-                # Construcción del DataFrame de resultados
-                df_res = pd.DataFrame({
-                    "Empleado": dn[cn].astype(str),
-                    "Salario": dn['salario_safe'].apply(lambda x: f"${x:,.0f}"),
-                    "No Salarial": dn['no_salarial_safe'].apply(lambda x: f"${x:,.0f}"),
-                    "Límite 40%": dn['limite_40'].apply(lambda x: f"${x:,.0f}"),
-                    "Exceso IBC": dn['exceso'].apply(lambda x: f"${x:,.0f}"),
-                    "Estado": dn['estado']
-                })
+                cns = c3.selectbox("Pagos No Salariales (Bonos/Auxilios)", opciones_ns, index=indice_columna(cols_numericas, det_op['no_salarial'], 1) or 0, key="ugpp_ns")
+                c_per = st.selectbox("Periodo (Opcional - Si no seleccionas, asume el año vigente)", ["No Aplica"] + cols_todas,
+                                     index=indice_columna(cols_todas, det_op['periodo'], 1) or 0, key="ugpp_per")
+
+            ejecutar = st.button("▶️ ESCANEAR RIESGO UGPP", type="primary")
+            opcionales = {'no_salarial': None if cns == "< No Aplica / Es $0 >" else cns, 'periodo': None if c_per == "No Aplica" else c_per}
+            if ejecutar and confirmar_columnas(cols_todas, {'empleado': cn, 'salario': cs, **{r: c for r, c in opcionales.items() if c}}):
+                # Motor vectorizado (porcentaje límite según el año del periodo)
+                resultado_ugpp = auditoria_ugpp(an, cn, cs, None if cns == "< No Aplica / Es $0 >" else cns,
+                                                col_periodo=c_per if c_per != "No Aplica" else None)
+                df_res = resultado_ugpp['hojas']['UGPP']
                 
                 riesgos = df_res[df_res['Estado'] == "RIESGO ALTO"]
                 
                 st.divider()
+                if resultado_ugpp['resumen']['anios_sin_parametros']:
+                    st.warning(f"⚠️ {resultado_ugpp['resumen']['anios_sin_parametros']} filas son de un año sin parámetros fiscales: no se evaluaron (Estado 'SIN PARAMETROS').")
                 if riesgos.empty:
                     st.success("✅ ¡Perfecto! Cumples con la norma del 40%.")
                     st.dataframe(df_res, use_container_width=True)
@@ -1190,23 +1147,24 @@ else:
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/5806/5806289.png' class='pro-module-icon'><div class='pro-module-title'><h2>Radar de Liquidez & Flujo de Caja</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Visualizar la salud financiera futura cruzando CxC y CxP.</div>""", unsafe_allow_html=True)
         saldo_hoy = st.number_input("💵 Saldo Disponible Hoy ($):", min_value=0.0, format="%.2f")
-        c1, c2 = st.columns(2); fcxc = c1.file_uploader("Cartera (CxC)", type=['xlsx']); fcxp = c2.file_uploader("Proveedores (CxP)", type=['xlsx'])
+        c1, c2 = st.columns(2); fcxc = cargar_dataset("Cartera (CxC)", "upl_cxc", contenedor=c1); fcxp = cargar_dataset("Proveedores (CxP)", "upl_cxp", contenedor=c2)
         if fcxc and fcxp:
-            dcxc = pd.read_excel(fcxc); dcxp = pd.read_excel(fcxp)
+            cols_cxc = columnas_archivo(fcxc); cols_cxp = columnas_archivo(fcxp)
             c1, c2, c3, c4 = st.columns(4)
-            cfc = c1.selectbox("Fecha Vencimiento CxC:", dcxc.columns); cvc = c2.selectbox("Valor CxC:", dcxc.columns)
-            cfp = c3.selectbox("Fecha Vencimiento CxP:", dcxp.columns); cvp = c4.selectbox("Valor CxP:", dcxp.columns)
+            cfc = c1.selectbox("Fecha Vencimiento CxC:", cols_cxc); cvc = c2.selectbox("Valor CxC:", cols_cxc)
+            cfp = c3.selectbox("Fecha Vencimiento CxP:", cols_cxp); cvp = c4.selectbox("Valor CxP:", cols_cxp)
             if st.button("▶️ GENERAR PROYECCIÓN"):
                 try:
-                    dcxc['Fecha'] = pd.to_datetime(dcxc[cfc]); dcxp['Fecha'] = pd.to_datetime(dcxp[cfp])
+                    dcxc = leer_excel(fcxc, columnas=dict.fromkeys([cfc, cvc])); dcxp = leer_excel(fcxp, columnas=dict.fromkeys([cfp, cvp]))
+                    dcxc['Fecha'] = a_fecha(dcxc[cfc]); dcxp['Fecha'] = a_fecha(dcxp[cfp])
                     fi = dcxc.groupby('Fecha')[cvc].sum().reset_index(); fe = dcxp.groupby('Fecha')[cvp].sum().reset_index()
                     cal = pd.merge(fi, fe, on='Fecha', how='outer').fillna(0); cal.columns = ['Fecha', 'Ingresos', 'Egresos']; cal = cal.sort_values('Fecha')
                     cal['Saldo Proyectado'] = saldo_hoy + (cal['Ingresos'] - cal['Egresos']).cumsum()
                     st.area_chart(cal.set_index('Fecha')['Saldo Proyectado']); st.dataframe(cal, use_container_width=True)
                     if api_key_valida:
-                        with st.spinner("🤖 La IA está analizando tu flujo de caja..."):
-                            st.markdown(consultar_ia_gemini(f"Analiza este flujo de caja. Saldo inicial: {saldo_hoy}. Datos: {cal.head(10).to_string()}"))
-                except: st.error("Error en el formato de fechas.")
+                        st.caption("🤖 La IA está analizando tu flujo de caja...")
+                        st.write_stream(consultar_ia_gemini_stream(f"Analiza este flujo de caja. Saldo inicial: {saldo_hoy}. Datos: {cal.head(10).to_string()}"))
+                except Exception: st.error("Error en el formato de fechas.")
 
     # ==============================================================================
     # 🚨 MÓDULO DE NÓMINA (CORREGIDO: Auto-Detección y Protección de Errores)
@@ -1220,61 +1178,51 @@ else:
         </div>
         """, unsafe_allow_html=True)
         
-        ac = st.file_uploader("Cargar Listado Personal (.xlsx)", type=['xlsx'])
+        ac = cargar_dataset("Cargar Listado Personal (.xlsx)", "upl_nomina")
         if ac:
             try:
-                dc = pd.read_excel(ac)
+                dc = leer_excel(ac)
                 st.info("Configura las columnas (El sistema intenta detectarlas automáticamente):")
                 
-                # INTENTO DE AUTO-SELECCIÓN (Busca palabras clave en tus títulos)
+                # AUTO-SELECCIÓN por encabezado y datos (deteccion_columnas.py)
                 cols = list(dc.columns)
-                idx_nom = next((i for i, c in enumerate(cols) if "nombre" in c.lower()), 0)
-                idx_sal = next((i for i, c in enumerate(cols) if "salario" in c.lower() or "sueldo" in c.lower() or "base" in c.lower()), 0 if len(cols) < 2 else 1)
-                idx_aux = next((i for i, c in enumerate(cols) if "aux" in c.lower() or "transporte" in c.lower()), 0 if len(cols) < 3 else 2)
-                idx_exo = next((i for i, c in enumerate(cols) if "exo" in c.lower()), 0 if len(cols) < 4 else 3)
+                det = detectar_columnas(dc, ['empleado', 'salario', 'auxilio', 'exonerado'], st.session_state['id_usuario'])
+                det_op, _ = detectar_columnas(dc, ['arl', 'periodo'], st.session_state['id_usuario'], opcionales=True)
+                aviso_deteccion(det)
 
                 c1, c2, c3, c4 = st.columns(4)
-                cn = c1.selectbox("1. Columna Nombre", cols, index=idx_nom)
-                cs = c2.selectbox("2. Columna Salario", cols, index=idx_sal)
-                ca = c3.selectbox("3. Auxilio Trans (SI/NO)", cols, index=idx_aux)
-                ce = c4.selectbox("4. Exonerada (SI/NO)", cols, index=idx_exo)
+                cn = c1.selectbox("1. Columna Nombre", cols, index=indice_columna(cols, det[0]['empleado']))
+                cs = c2.selectbox("2. Columna Salario", cols, index=indice_columna(cols, det[0]['salario']))
+                ca = c3.selectbox("3. Auxilio Trans (SI/NO)", cols, index=indice_columna(cols, det[0]['auxilio']))
+                ce = c4.selectbox("4. Exonerada (SI/NO)", cols, index=indice_columna(cols, det[0]['exonerado']))
                 
                 # Selector opcional de ARL
-                c_arl = st.selectbox("5. Nivel ARL (Opcional - Si no seleccionas, asume Nivel 1)", ["No Aplica"] + cols)
+                c_arl = st.selectbox("5. Nivel ARL (Opcional - Si no seleccionas, asume Nivel 1)", ["No Aplica"] + cols,
+                                     index=indice_columna(cols, det_op['arl'], 1) or 0)
                 col_arl = c_arl if c_arl != "No Aplica" else None
-
-                if st.button("▶️ CALCULAR DESGLOSE"):
-                    rc = []
-                    errores = 0
-                    for r in dc.to_dict('records'):
-                        # PROTECCIÓN: Si el salario no es un número, lo convierte a 0 y avisa
-                        try:
-                            val_salario = float(r[cs])
-                        except:
-                            val_salario = 0
-                            errores += 1
-
-                        # Calculamos
-                        # CORRECCIÓN BUG: La función retorna 4 valores, no 2. Desempaquetamos correctamente.
-                        costo_total, total_seg, total_prest, paraf = calcular_costo_empresa_fila(r, cs, ca, col_arl, ce)
-                        
-                        # Agrupamos para visualización
-                        total_aportes_prestaciones = total_seg + total_prest + paraf
-                        
-                        rc.append({
-                            "Empleado": str(r[cn]),
-                            "Salario Base": f"${val_salario:,.0f}",
-                            "Prestaciones y Aportes": f"${total_aportes_prestaciones:,.0f}",
-                            "Costo Total Mensual": f"${costo_total:,.0f}"
-                        })
+                c_per = st.selectbox("6. Periodo / Fecha (Opcional - Si no seleccionas, usa tarifas del año vigente)", ["No Aplica"] + cols,
+                                     index=indice_columna(cols, det_op['periodo'], 1) or 0)
+                col_per = c_per if c_per != "No Aplica" else None
+
+                ejecutar = st.button("▶️ CALCULAR DESGLOSE")
+                opcionales = {'arl': col_arl, 'periodo': col_per}
+                if ejecutar and confirmar_columnas(cols, {'empleado': cn, 'salario': cs, 'auxilio': ca, 'exonerado': ce, **{r: c for r, c in opcionales.items() if c}}):
+                    # Motor vectorizado: todo el desglose en columnas numéricas (sin formatear)
+                    resultado = auditoria_nomina(ac, cn, cs, ca, ce, col_arl=col_arl, col_periodo=col_per)
+                    rc = resultado['hojas']['Costo Nomina']
+                    errores = resultado['resumen']['salarios_invalidos']
                     
+                    sin_parametros = resultado['resumen']['anios_sin_parametros']
                     if errores > 0:
                         st.warning(f"⚠️ OJO: En {errores} filas el salario no era un número válido (quizás seleccionaste la columna equivocada). Revisa los resultados.")
-                    else:
+                    if sin_parametros > 0:
+                        st.warning(f"⚠️ {sin_parametros} filas son de un año sin parámetros fiscales (UVT, SMMLV, auxilio): quedan sin costear. Revisa la columna de periodo.")
+                    if not errores and not sin_parametros:
                         st.success("✅ Cálculo exitoso.")
                     
                     st.markdown("### 📊 Resultado del Análisis")
-                    st.dataframe(pd.DataFrame(rc), use_container_width=True)
+                    formato_pesos = {c: st.column_config.NumberColumn(c, format="$%.0f") for c in rc.columns if c != "Empleado"}
+                    st.dataframe(rc, use_container_width=True, column_config=formato_pesos)
 
             except Exception as e:
                 st.error(f"Error leyendo el archivo: {str(e)}. Revisa que el Excel no tenga filas vacías al inicio.")
@@ -1286,46 +1234,82 @@ else:
     elif menu == "Analítica Financiera Inteligente":
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/10041/10041467.png' class='pro-module-icon'><div class='pro-module-title'><h2>Inteligencia Financiera (IA)</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Detectar patrones de gasto y anomalías en cuentas contables usando IA.</div>""", unsafe_allow_html=True)
-        fi = st.file_uploader("Cargar Datos Financieros (.xlsx/.csv)", type=['xlsx', 'csv'])
+        fi = cargar_dataset("Cargar Datos Financieros (.xlsx/.csv)", "upl_analitica", tipos=('xlsx', 'csv'))
         if fi and api_key_valida:
-            df = pd.read_csv(fi) if fi.name.endswith('.csv') else pd.read_excel(fi)
-            c1, c2 = st.columns(2); cd = c1.selectbox("Columna Descripción", df.columns); cv = c2.selectbox("Columna Valor", df.columns)
+            cols_fi = columnas_archivo(fi)
+            c1, c2 = st.columns(2); cd = c1.selectbox("Columna Descripción", cols_fi); cv = c2.selectbox("Columna Valor", cols_fi)
             if st.button("▶️ INICIAR ANÁLISIS IA"):
+                df = leer_tabla(fi, columnas=dict.fromkeys([cd, cv]))
                 res = df.groupby(cd)[cv].sum().sort_values(ascending=False).head(10); st.bar_chart(res)
-                st.markdown(consultar_ia_gemini(f"Actúa como auditor financiero. Analiza estos saldos principales y da recomendaciones: {res.to_string()}"))
+                st.write_stream(consultar_ia_gemini_stream(f"Actúa como auditor financiero. Analiza estos saldos principales y da recomendaciones: {res.to_string()}"))
 
     elif menu == "Narrador Financiero & NIIF":
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/3208/3208727.png' class='pro-module-icon'><div class='pro-module-title'><h2>Narrador Financiero & Notas NIIF</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Automatizar la redacción de informes gerenciales y Notas a Estados Financieros.</div>""", unsafe_allow_html=True)
-        c1, c2 = st.columns(2); f1 = c1.file_uploader("Año Actual", type=['xlsx']); f2 = c2.file_uploader("Año Anterior", type=['xlsx'])
+        c1, c2 = st.columns(2); f1 = cargar_dataset("Año Actual", "upl_actual", contenedor=c1); f2 = cargar_dataset("Año Anterior", "upl_anterior", contenedor=c2)
         if f1 and f2 and api_key_valida:
-            d1 = pd.read_excel(f1); d2 = pd.read_excel(f2)
-            st.divider(); c1, c2, c3 = st.columns(3); cta = c1.selectbox("Cuenta Contable", d1.columns); v1 = c2.selectbox("Valor Año Actual", d1.columns); v2 = c3.selectbox("Valor Año Anterior", d2.columns)
+            cols_1 = columnas_archivo(f1); cols_2 = columnas_archivo(f2)
+            st.divider(); c1, c2, c3 = st.columns(3); cta = c1.selectbox("Cuenta Contable", cols_1); v1 = c2.selectbox("Valor Año Actual", cols_1); v2 = c3.selectbox("Valor Año Anterior", cols_2)
             if st.button("✨ GENERAR INFORME ESTRATÉGICO"):
+                d1 = leer_excel(f1, columnas=dict.fromkeys([cta, v1])); d2 = leer_excel(f2, columnas=dict.fromkeys([cta, v2]))
                 g1 = d1.groupby(cta)[v1].sum().reset_index(name='V_Act'); g2 = d2.groupby(cta)[v2].sum().reset_index(name='V_Ant')
                 merged = pd.merge(g1, g2, on=cta, how='inner').fillna(0); merged['Variacion'] = merged['V_Act'] - merged['V_Ant']
                 top = merged.reindex(merged.Variacion.abs().sort_values(ascending=False).index).head(10)
                 st.markdown("### 📊 Tablero de Control Gerencial"); st.bar_chart(top.set_index(cta)['Variacion'])
-                with st.spinner("🤖 El Consultor IA está redactando el informe..."):
-                    prompt = f"""Actúa como un CFO experto. Analiza la siguiente tabla de variaciones contables:{top.to_string()} GENERA: 1. Un Informe Gerencial Ejecutivo. 2. Un borrador de Nota a los Estados Financieros bajo NIIF."""
-                    st.markdown(consultar_ia_gemini(prompt))
+                st.caption("🤖 El Consultor IA está redactando el informe...")
+                prompt = f"""Actúa como un CFO experto. Analiza la siguiente tabla de variaciones contables:{top.to_string()} GENERA: 1. Un Informe Gerencial Ejecutivo. 2. Un borrador de Nota a los Estados Financieros bajo NIIF."""
+                st.write_stream(consultar_ia_gemini_stream(prompt))
 
     elif menu == "Validador de RUT Oficial":
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/9422/9422888.png' class='pro-module-icon'><div class='pro-module-title'><h2>Validador Oficial de RUT</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Asegurar la integridad de datos de terceros. Aplica algoritmo de Módulo 11.</div>""", unsafe_allow_html=True)
-        nit = st.text_input("Ingrese NIT o Cédula (Sin DV):", max_chars=15)
-        if st.button("🔢 VERIFICAR"):
-            dv = calcular_dv_colombia(nit); st.metric("Dígito de Verificación (DV)", dv); st.link_button("🔗 Consulta Estado en Muisca (DIAN)", "https://muisca.dian.gov.co/WebRutMuisca/DefConsultaEstadoRUT.faces")
+        t_uno, t_masivo = st.tabs(["🔢 Un NIT", "📂 Validación Masiva (Maestro de Terceros)"])
+        with t_uno:
+            nit = st.text_input("Ingrese NIT o Cédula (Sin DV):", max_chars=15)
+            if st.button("🔢 VERIFICAR"):
+                dv = calcular_dv_colombia(nit); st.metric("Dígito de Verificación (DV)", dv); st.link_button("🔗 Consulta Estado en Muisca (DIAN)", "https://muisca.dian.gov.co/WebRutMuisca/DefConsultaEstadoRUT.faces")
+        with t_masivo:
+            fr = cargar_dataset("Cargar Maestro de Terceros (.xlsx/.csv)", "upl_rut", tipos=('xlsx', 'csv'))
+            if fr:
+                cols_fr = columnas_archivo(fr)
+                muestra_fr = muestra_archivo(fr)
+                det, _ = detectar_columnas(muestra_fr, ['nit'], st.session_state['id_usuario'])
+                det_dv, _ = detectar_columnas(muestra_fr, ['dv'], st.session_state['id_usuario'], opcionales=True)
+                c1, c2 = st.columns(2)
+                col_n = c1.selectbox("Columna NIT", cols_fr, index=indice_columna(cols_fr, det['nit']), key="rut_n")
+                col_d = c2.selectbox("Columna DV (Opcional - si no, se usa el DV después del guion)", ["No Aplica"] + cols_fr,
+                                     index=indice_columna(cols_fr, det_dv['dv'], 1) or 0, key="rut_d")
+                ejecutar = st.button("🔢 VALIDAR MAESTRO", type="primary")
+                if ejecutar and confirmar_columnas(cols_fr, {'nit': col_n, **({'dv': col_d} if col_d != "No Aplica" else {})}):
+                    dm = leer_tabla(fr, columnas=dict.fromkeys([col_n] + ([col_d] if col_d != "No Aplica" else [])))
+                    # Módulo 11 vectorizado sobre toda la columna (nit.py)
+                    val = validar_nits(dm[col_n], dm[col_d] if col_d != "No Aplica" else None)
+                    rv = pd.concat([dm[col_n].rename("NIT Original"), val], axis=1)
+                    conteo = rv['Estado'].value_counts()
+                    m1, m2, m3, m4 = st.columns(4)
+                    m1.metric("Correctos", int(conteo.get("✅ OK", 0)))
+                    m2.metric("DV Errado", int(conteo.get("❌ DV NO COINCIDE", 0)))
+                    m3.metric("Sin DV", int(conteo.get("⚠️ SIN DV", 0)))
+                    m4.metric("NIT Inválido", int(conteo.get("⛔ NIT INVÁLIDO", 0)))
+                    st.dataframe(rv[rv['Estado'] != "✅ OK"].head(5000), use_container_width=True)
+
+                    botones_descarga("📥 DESCARGAR VALIDACIÓN (.xlsx)", {'Validacion RUT': rv}, "Validacion_RUT", "dl_rut")
 
     elif menu == "Digitalización OCR":
         st.markdown("""<div class='pro-module-header'><img src='https://cdn-icons-png.flaticon.com/512/3588/3588241.png' class='pro-module-icon'><div class='pro-module-title'><h2>Digitalización Inteligente (OCR)</h2></div></div>""", unsafe_allow_html=True)
         st.markdown("""<div class='detail-box'><strong>Objetivo:</strong> Eliminar la digitación manual. Usa IA para leer imágenes de facturas.</div>""", unsafe_allow_html=True)
         af = st.file_uploader("Cargar Imágenes", type=["jpg", "png"], accept_multiple_files=True)
         if af and st.button("🧠 PROCESAR IMÁGENES") and api_key_valida:
-            do = []; bar = st.progress(0)
-            for i, f in enumerate(af): bar.progress((i+1)/len(af)); info = ocr_factura(Image.open(f)); 
-            if info: do.append(info)
-            st.dataframe(pd.DataFrame(do), use_container_width=True)
+            # Planificador concurrente de ocr_ia.py, en segundo plano (trabajos.py)
+            st.session_state['trabajo_ocr'] = enviar_trabajo('ocr', {'fuentes': af}, usuario=st.session_state['id_usuario'],
+                                                             descripcion=f"{len(af)} imágenes")
+        id_ocr, resultado_ocr = panel_trabajos('ocr', 'trabajo_ocr')
+        if resultado_ocr:
+            facturas, fallas = resultado_ocr['hojas'].values()
+            if not facturas.empty: st.dataframe(facturas, use_container_width=True)
+            if not fallas.empty:
+                st.warning(f"⚠️ {len(fallas)} imágenes no se pudieron leer.")
+                st.dataframe(fallas, use_container_width=True)
 
     st.markdown('</div>', unsafe_allow_html=True)
 
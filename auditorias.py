@@ -0,0 +1,267 @@
+# ==============================================================================
+# SERVICIOS DE AUDITORÍA (SIN STREAMLIT)
+# ==============================================================================
+# Cada módulo de la app (cruce DIAN, conciliación, gastos, UGPP, nómina, XML)
+# se expone aquí como una función importable: recibe archivos (subidos, rutas
+# o bytes), nombres de columnas y opciones, y retorna
+#   {'hojas': {nombre: DataFrame}, 'resumen': {métrica: valor}}
+# 'hojas' es lo que se muestra y se descarga; 'resumen' son las métricas de la
+# cabecera. La página de Streamlit y el procesador por lotes (lote.py) llaman
+# a las mismas funciones, así un cliente da el mismo resultado en los dos.
+# Los parámetros que empiezan por 'archivo' (o 'fuentes') son archivos.
+# completar_columnas() llena los parámetros de columna que no vengan con la
+# detección de deteccion_columnas.py.
+# ==============================================================================
+
+import os
+
+import pandas as pd
+
+from conciliacion import conciliar_por_etapas, describir_parejas
+from conciliacion_continua import conciliar_incremental
+from deteccion_columnas import detectar_columnas, muestra_archivo
+from exogena import UMBRAL_DIFERENCIA, cruzar_exogena
+from ingesta import leer_excel
+from nomina import costear_nomina
+from ocr_ia import procesar_ocr
+from reglas_fiscales import auditar_gastos, escanear_ugpp
+from tipos import a_fecha, a_numero
+from xml_dian import contar_documentos, iterar_documentos, lote_a_tablas
+
+
+def _pesos(serie):
+    return serie.apply(lambda x: f"${x:,.0f}")
+
+
+# ------------------------------------------------------------------------------
+# CRUCE DE EXÓGENA DIAN VS CONTABILIDAD
+# ------------------------------------------------------------------------------
+def auditoria_exogena(archivo_dian, archivo_conta, nit_dian, val_dian, nit_conta, val_conta, umbral=UMBRAL_DIFERENCIA):
+    cruce, diferencias = cruzar_exogena(archivo_dian, archivo_conta, nit_dian, val_dian, nit_conta, val_conta, umbral=umbral)
+    return {
+        'hojas': {'Diferencias': diferencias, 'Cruce Completo': cruce},
+        'resumen': {
+            'hallazgos': len(diferencias),
+            'riesgo_total': float(diferencias['Diferencia'].abs().sum()),
+            'dv_errados': int(cruce['DV Errado'].sum()),
+        },
+    }
+
+
+# ------------------------------------------------------------------------------
+# CONCILIACIÓN BANCARIA
+# ------------------------------------------------------------------------------
+def auditoria_conciliacion(archivo_banco, archivo_libro, col_fecha_b, col_valor_b, col_fecha_l, col_valor_l,
+                           col_desc_b, col_nit_b=None, col_nit_l=None, dias_tolerancia=3, tolerancia_valor=0.0,
+                           max_partidas=3, agrupaciones=False, cuenta=None, progreso=None, col_desc_l=None,
+                           usuario=None):
+    """
+    Conciliación por etapas (exacto, tercero, tolerancia, agrupaciones). Con
+    'cuenta' continúa la conciliación de periodos anteriores de esa cuenta del
+    'usuario' (conciliacion_continua.py); 'col_desc_l' (concepto o comprobante del libro)
+    distingue asientos de igual fecha y valor entre periodos.
+    """
+    df_banco = leer_excel(archivo_banco)
+    df_libro = leer_excel(archivo_libro)
+    df_banco['Fecha_Dt'] = a_fecha(df_banco[col_fecha_b])
+    df_libro['Fecha_Dt'] = a_fecha(df_libro[col_fecha_l])
+    if any(len(df) and df['Fecha_Dt'].isna().all() for df in (df_banco, df_libro)):
+        raise ValueError("Error en formato de fechas. Asegúrate que las columnas de fecha sean correctas.")
+
+    etapas = ["exacto"]
+    if tolerancia_valor > 0: etapas.append("tolerancia")
+    if agrupaciones: etapas += ["uno_a_varios", "varios_a_uno"]
+    opciones = dict(
+        dias_tolerancia=int(dias_tolerancia), tolerancia_valor=tolerancia_valor, max_partidas=int(max_partidas),
+        etapas=etapas, progreso=progreso, col_nit_b=col_nit_b, col_nit_l=col_nit_l,
+    )
+
+    resumen = {}
+    if cuenta:
+        # Solo entran al motor las partidas nuevas y las abiertas de periodos anteriores
+        parejas, df_banco, df_libro, resumen = conciliar_incremental(
+            usuario, cuenta, df_banco, df_libro, col_valor_b, 'Fecha_Dt', col_valor_l, 'Fecha_Dt',
+            col_desc_b=col_desc_b, col_desc_l=col_desc_l, **opciones
+        )
+    else:
+        df_banco['Conciliado'] = False
+        df_libro['Conciliado'] = False
+        parejas = conciliar_por_etapas(df_banco, df_libro, col_valor_b, 'Fecha_Dt', col_valor_l, 'Fecha_Dt', **opciones)
+        confirmadas = parejas[~parejas['Sugerida']]
+        pos_b = [p for grupo in confirmadas['Pos_Banco'] for p in grupo]
+        pos_l = [p for grupo in confirmadas['Pos_Libro'] for p in grupo]
+        df_banco.iloc[pos_b, df_banco.columns.get_loc('Conciliado')] = True
+        df_libro.iloc[pos_l, df_libro.columns.get_loc('Conciliado')] = True
+
+    # Las agrupaciones sugeridas van aparte: sus partidas siguen en pendientes
+    df_matches = describir_parejas(parejas[~parejas['Sugerida']], df_banco, df_libro, col_fecha_b, col_fecha_l, col_desc_b, col_valor_b)
+    df_sugeridas = describir_parejas(parejas[parejas['Sugerida']], df_banco, df_libro, col_fecha_b, col_fecha_l, col_desc_b, col_valor_b)
+    df_pend_banco = df_banco[~df_banco['Conciliado']]
+    df_pend_libro = df_libro[~df_libro['Conciliado']]
+    resumen.update(cruzadas=len(df_matches), sugeridas=len(df_sugeridas),
+                   pendientes_banco=len(df_pend_banco), pendientes_libro=len(df_pend_libro))
+    return {
+        'hojas': {'1. Cruzados': df_matches, '2. Pendientes Banco': df_pend_banco, '3. Pendientes Libros': df_pend_libro,
+                  '4. Sugeridas (Revisar)': df_sugeridas},
+        'resumen': resumen,
+    }
+
+
+# ------------------------------------------------------------------------------
+# AUDITORÍA FISCAL DE GASTOS (ART. 771-5 Y RETENCIONES)
+# ------------------------------------------------------------------------------
+def auditoria_gastos(archivo, col_fecha, col_tercero, col_valor, col_metodo):
+    """Hallazgos de bancarización y bases de retención (topes en UVT del año de cada gasto)."""
+    df = leer_excel(archivo)
+    valores = a_numero(df[col_valor]).fillna(0)
+    analisis = auditar_gastos(df, col_valor, col_metodo, col_fecha=col_fecha)
+    riesgos = (analisis['Riesgo'] != "BAJO").to_numpy()
+
+    hallazgos = pd.DataFrame({
+        "Fecha": df.loc[riesgos, col_fecha].astype(str),
+        "Tercero": df.loc[riesgos, col_tercero].astype(str),
+        "Valor": _pesos(valores[riesgos]),
+        "Método Pago": df.loc[riesgos, col_metodo].astype(str),
+        "Riesgo": analisis.loc[riesgos, 'Riesgo'],
+        "Hallazgo": analisis.loc[riesgos, 'Hallazgo'],
+    })
+    riesgo_alto = int((hallazgos['Riesgo'] == 'ALTO').sum())
+    return {
+        'hojas': {'Hallazgos': hallazgos},
+        'resumen': {'hallazgos': len(hallazgos), 'riesgo_alto': riesgo_alto, 'alertas_retencion': len(hallazgos) - riesgo_alto},
+    }
+
+
+# ------------------------------------------------------------------------------
+# ESCÁNER UGPP (LEY 1393 - REGLA DEL 40%)
+# ------------------------------------------------------------------------------
+def auditoria_ugpp(archivo, col_empleado, col_salario, col_no_salarial=None, col_periodo=None):
+    dn = leer_excel(archivo)
+    ugpp = escanear_ugpp(dn, col_salario, col_no_salarial, col_fecha=col_periodo)
+    resultado = pd.DataFrame({
+        "Empleado": dn[col_empleado].astype(str),
+        "Salario": _pesos(ugpp['Salario']),
+        "No Salarial": _pesos(ugpp['No Salarial']),
+        "Límite 40%": _pesos(ugpp['Limite']),
+        "Exceso IBC": _pesos(ugpp['Exceso']),
+        "Estado": ugpp['Estado'],
+    })
+    return {
+        'hojas': {'UGPP': resultado},
+        'resumen': {'empleados': len(resultado), 'riesgo_alto': int((resultado['Estado'] == "RIESGO ALTO").sum()),
+                    'anios_sin_parametros': int((resultado['Estado'] == "SIN PARAMETROS").sum())},
+    }
+
+
+# ------------------------------------------------------------------------------
+# COSTEO DE NÓMINA
+# ------------------------------------------------------------------------------
+def auditoria_nomina(archivo, col_nombre, col_salario, col_aux, col_exo, col_arl=None, col_periodo=None):
+    dc = leer_excel(archivo)
+    costos = costear_nomina(dc, col_salario, col_aux, col_arl, col_exo, col_fecha=col_periodo)
+    errores = int(costos['Salario Invalido'].sum())
+    sin_parametros = int(costos['Anio Sin Parametros'].sum())
+    rc = pd.concat([
+        dc[col_nombre].astype(str).rename("Empleado"),
+        costos.drop(columns=['Salario Invalido', 'Anio Sin Parametros']),
+    ], axis=1)
+    rc["Prestaciones y Aportes"] = rc["Total Seguridad Social"] + rc["Prestaciones"] + rc["Parafiscales"]
+    return {
+        'hojas': {'Costo Nomina': rc},
+        'resumen': {'empleados': len(rc), 'salarios_invalidos': errores, 'anios_sin_parametros': sin_parametros},
+    }
+
+
+# ------------------------------------------------------------------------------
+# MINERÍA DE XML (FACTURACIÓN ELECTRÓNICA)
+# ------------------------------------------------------------------------------
+def auditoria_xml(fuentes, procesos=None, progreso=None):
+    """
+    'fuentes': XML, ZIP o carpetas. 'progreso' recibe la fracción procesada (0..1).
+    """
+    fuentes = list(fuentes) if isinstance(fuentes, (list, tuple)) else [fuentes]
+    total = max(contar_documentos(fuentes), 1)
+    avance = (lambda n: progreso(min(n / total, 1.0))) if progreso else None
+    facturas, lineas, impuestos = lote_a_tablas(iterar_documentos(fuentes), procesos=procesos, total=total, progreso=avance)
+    return {
+        'hojas': {'1. Facturas': facturas, '2. Lineas': lineas, '3. Impuestos': impuestos},
+        'resumen': {'documentos': len(facturas), 'lineas': len(lineas)},
+    }
+
+
+# ------------------------------------------------------------------------------
+# DIGITALIZACIÓN OCR DE FACTURAS
+# ------------------------------------------------------------------------------
+def auditoria_ocr(fuentes, progreso=None):
+    """
+    'fuentes': imágenes (rutas o archivos subidos). Requiere el API de Gemini
+    configurado (genai.configure o la variable GOOGLE_API_KEY). 'progreso'
+    recibe la fracción procesada y, en 'fila', cada factura apenas se lee.
+    """
+    fuentes = list(fuentes) if isinstance(fuentes, (list, tuple)) else [fuentes]
+    nombres = [os.path.basename(f) if isinstance(f, str) else getattr(f, 'name', str(i)) for i, f in enumerate(fuentes)]
+    leidas, fallas = [], []
+    for n, (i, info, error) in enumerate(procesar_ocr(fuentes), start=1):
+        fila = {"Archivo": nombres[i], **info} if info else {"Archivo": nombres[i], "Error": error}
+        if info: leidas.append({**fila, "_orden": i})
+        else: fallas.append(fila)
+        if progreso: progreso(n / len(fuentes), fila=fila)
+    facturas = pd.DataFrame(leidas)
+    if not facturas.empty:
+        facturas = facturas.sort_values("_orden").drop(columns="_orden").reset_index(drop=True)
+    return {
+        'hojas': {'Facturas': facturas, 'Fallas': pd.DataFrame(fallas, columns=["Archivo", "Error"])},
+        'resumen': {'imagenes': len(fuentes), 'leidas': len(leidas), 'fallas': len(fallas)},
+    }
+
+
+MODULOS = {
+    'exogena': auditoria_exogena,
+    'conciliacion': auditoria_conciliacion,
+    'gastos': auditoria_gastos,
+    'ugpp': auditoria_ugpp,
+    'nomina': auditoria_nomina,
+    'xml': auditoria_xml,
+    'ocr': auditoria_ocr,
+}
+
+# Parámetros de columna obligatorios de cada módulo: (parámetro del archivo, rol)
+COLUMNAS_MODULOS = {
+    'exogena': {'nit_dian': ('archivo_dian', 'nit'), 'val_dian': ('archivo_dian', 'valor'),
+                'nit_conta': ('archivo_conta', 'nit'), 'val_conta': ('archivo_conta', 'valor')},
+    'conciliacion': {'col_fecha_b': ('archivo_banco', 'fecha'), 'col_valor_b': ('archivo_banco', 'valor'),
+                     'col_desc_b': ('archivo_banco', 'descripcion'),
+                     'col_fecha_l': ('archivo_libro', 'fecha'), 'col_valor_l': ('archivo_libro', 'valor')},
+    'gastos': {'col_fecha': ('archivo', 'fecha'), 'col_tercero': ('archivo', 'tercero'),
+               'col_valor': ('archivo', 'valor'), 'col_metodo': ('archivo', 'metodo_pago')},
+    'ugpp': {'col_empleado': ('archivo', 'empleado'), 'col_salario': ('archivo', 'salario')},
+    'nomina': {'col_nombre': ('archivo', 'empleado'), 'col_salario': ('archivo', 'salario'),
+               'col_aux': ('archivo', 'auxilio'), 'col_exo': ('archivo', 'exonerado')},
+}
+
+
+def completar_columnas(modulo, parametros, usuario=None):
+    """
+    Parámetros con las columnas obligatorias que falten detectadas (encabezado,
+    datos y, con 'usuario', sus mapeos recordados). Lanza ValueError si alguna no se identifica con
+    seguridad: es mejor no correr que auditar la columna equivocada.
+    """
+    parametros = dict(parametros)
+    por_archivo = {}
+    for parametro, (archivo, rol) in COLUMNAS_MODULOS.get(modulo, {}).items():
+        if parametros.get(parametro) is None and parametros.get(archivo) is not None:
+            por_archivo.setdefault(archivo, {})[parametro] = rol
+    sin_detectar = []
+    for archivo, roles in por_archivo.items():
+        muestra = muestra_archivo(parametros[archivo])
+        # Las columnas ya indicadas no compiten por los roles que faltan
+        indicadas = {parametros.get(p) for p, (a, _) in COLUMNAS_MODULOS[modulo].items() if a == archivo}
+        muestra = muestra.loc[:, [c not in indicadas for c in muestra.columns]]
+        mapeo, _ = detectar_columnas(muestra, list(roles.values()), usuario)
+        for parametro, rol in roles.items():
+            parametros[parametro] = mapeo[rol]
+            if mapeo[rol] is None:
+                sin_detectar.append(parametro)
+    if sin_detectar:
+        raise ValueError(f"No se pudieron identificar las columnas de: {', '.join(sin_detectar)}. Indícalas en el trabajo.")
+    return parametros
@@ -0,0 +1,142 @@
+# ==============================================================================
+# BITÁCORA DE AUDITORÍA ASÍNCRONA (GOOGLE SHEETS)
+# ==============================================================================
+# Antes cada registrar_log() hacía un append_row síncrono: una ida y vuelta HTTP
+# a la API de Sheets (300-1000 ms) dentro del clic del usuario, y con varios
+# usuarios se agotaba la cuota por minuto.
+#
+# Ahora los registros van a una cola en memoria y un hilo en segundo plano los
+# envía con append_rows en lotes (por tamaño o por tiempo). Si Sheets no
+# responde se reintenta con espera exponencial; si aun así falla, las filas se
+# guardan en un archivo local y se reenvían en el siguiente lote exitoso.
+# Al cerrar el proceso se vacía la cola.
+# ==============================================================================
+
+import atexit
+import csv
+import os
+import queue
+import random
+import threading
+import time
+
+LOTE_MAXIMO = 50            # filas por append_rows
+INTERVALO_SEGUNDOS = 5.0    # tiempo máximo que una fila espera en la cola
+REINTENTOS = 3
+ESPERA_BASE_SEGUNDOS = 1.0
+ARCHIVO_PENDIENTES = os.environ.get("CONTADOR_LOGS_PENDIENTES", "logs_pendientes.csv")
+
+_cola = queue.Queue(maxsize=10000)
+_FIN = object()
+_hoja = None
+_hilo = None
+_lock = threading.Lock()
+_lock_archivo = threading.Lock()
+
+
+# ------------------------------------------------------------------------------
+# ARCHIVO LOCAL DE RESPALDO
+# ------------------------------------------------------------------------------
+def _derramar(filas):
+    """Guarda filas no enviadas en el archivo local (se agregan al final)."""
+    with _lock_archivo:
+        with open(ARCHIVO_PENDIENTES, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(filas)
+
+
+def _tomar_pendientes():
+    """Lee y elimina el archivo local; las filas vuelven a intentarse con el lote."""
+    with _lock_archivo:
+        if not os.path.exists(ARCHIVO_PENDIENTES):
+            return []
+        with open(ARCHIVO_PENDIENTES, newline="", encoding="utf-8") as f:
+            filas = [fila for fila in csv.reader(f) if fila]
+        os.remove(ARCHIVO_PENDIENTES)
+        return filas
+
+
+# ------------------------------------------------------------------------------
+# ENVÍO A SHEETS
+# ------------------------------------------------------------------------------
+def _enviar(lote):
+    filas = _tomar_pendientes() + lote
+    if not filas:
+        return
+    hoja = _hoja
+    for intento in range(REINTENTOS):
+        try:
+            if hoja is None:
+                break
+            hoja.append_rows(filas)
+            return
+        except Exception:
+            # Espera exponencial con jitter para no chocar con la cuota por minuto
+            time.sleep(ESPERA_BASE_SEGUNDOS * (2 ** intento) + random.uniform(0, ESPERA_BASE_SEGUNDOS))
+    _derramar(filas)
+
+
+def _trabajador():
+    lote = []
+    limite = time.monotonic() + INTERVALO_SEGUNDOS
+    while True:
+        try:
+            item = _cola.get(timeout=max(0.0, limite - time.monotonic()))
+        except queue.Empty:
+            item = None
+
+        if item is _FIN:
+            _enviar(lote)
+            return
+        if isinstance(item, threading.Event):
+            # Pedido explícito de vaciado (vaciar_bitacora)
+            _enviar(lote)
+            lote = []
+            item.set()
+        elif item is not None:
+            lote.append(item)
+
+        if len(lote) >= LOTE_MAXIMO or time.monotonic() >= limite:
+            if lote:
+                _enviar(lote)
+                lote = []
+            limite = time.monotonic() + INTERVALO_SEGUNDOS
+
+
+# ------------------------------------------------------------------------------
+# API PÚBLICA
+# ------------------------------------------------------------------------------
+def configurar_bitacora(hoja):
+    """
+    Define la hoja destino y arranca el hilo escritor si no está corriendo.
+    Es seguro llamarla en cada rerun de Streamlit (solo hay un hilo por proceso).
+    """
+    global _hoja, _hilo
+    with _lock:
+        _hoja = hoja
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_trabajador, name="bitacora-sheets", daemon=True)
+            _hilo.start()
+
+
+def encolar_log(fila):
+    """Agrega una fila a la cola sin bloquear. Si la cola está llena, va al archivo local."""
+    try:
+        _cola.put_nowait(list(fila))
+    except queue.Full:
+        _derramar([list(fila)])
+
+
+def vaciar_bitacora(timeout=30):
+    """Fuerza el envío de lo que haya en cola y espera a que termine."""
+    if _hilo is None or not _hilo.is_alive():
+        return False
+    listo = threading.Event()
+    _cola.put(listo)
+    return listo.wait(timeout)
+
+
+@atexit.register
+def _cerrar():
+    if _hilo is not None and _hilo.is_alive():
+        _cola.put(_FIN)
+        _hilo.join(timeout=30)
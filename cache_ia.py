@@ -0,0 +1,160 @@
+# ==============================================================================
+# CACHÉ PERSISTENTE DE RESPUESTAS DE IA (DIRECCIONADA POR CONTENIDO)
+# ==============================================================================
+# La misma factura se vuelve a subir a menudo, y Tesorería / Analítica /
+# Narrador reenvían el mismo prompt en cada rerun de Streamlit. Cada vez era un
+# viaje completo a Gemini (segundos y cuota).
+#
+# Aquí cada llamada se identifica por el hash BLAKE2b de (modelo, prompt,
+# bytes de la imagen, ...) y la respuesta queda en un SQLite local, compartido
+# entre sesiones y reinicios. Las entradas vencen por TTL y, si el archivo
+# supera el límite, se desalojan las menos usadas recientemente.
+# ==============================================================================
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ARCHIVO_CACHE_IA = os.environ.get("CONTADOR_CACHE_IA", "cache_ia.sqlite")
+TTL_CACHE_IA_DIAS = float(os.environ.get("CONTADOR_CACHE_IA_DIAS", "30"))
+LIMITE_CACHE_IA_MB = int(os.environ.get("CONTADOR_CACHE_IA_MB", "200"))
+
+_local = threading.local()
+_lock = threading.Lock()
+_estadisticas = {"aciertos": 0, "fallos": 0, "desalojos": 0}
+
+
+# ------------------------------------------------------------------------------
+# CONEXIÓN (UNA POR HILO: EL OCR CONSULTA DESDE VARIOS HILOS)
+# ------------------------------------------------------------------------------
+def _conexion():
+    conexion = getattr(_local, "conexion", None)
+    if conexion is None or getattr(_local, "archivo", None) != ARCHIVO_CACHE_IA:
+        conexion = sqlite3.connect(ARCHIVO_CACHE_IA, timeout=30, isolation_level=None)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas ("
+            "clave TEXT PRIMARY KEY, valor TEXT NOT NULL, creado REAL NOT NULL, "
+            "usado REAL NOT NULL, tamano INTEGER NOT NULL)"
+        )
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_usado ON respuestas(usado)")
+        _local.conexion, _local.archivo = conexion, ARCHIVO_CACHE_IA
+    return conexion
+
+
+def _contar(evento, n=1):
+    with _lock:
+        _estadisticas[evento] += n
+
+
+# ------------------------------------------------------------------------------
+# CLAVE
+# ------------------------------------------------------------------------------
+def clave_ia(modelo, *partes):
+    """
+    Hash de la llamada. Las partes pueden ser texto, bytes, blobs
+    {'mime_type', 'data'} o cualquier valor serializable (parámetros).
+    """
+    h = hashlib.blake2b(digest_size=20)
+    for parte in (modelo,) + partes:
+        if isinstance(parte, dict) and "data" in parte:
+            parte = parte["data"]
+        if isinstance(parte, (bytes, bytearray, memoryview)):
+            datos = bytes(parte)
+        elif isinstance(parte, str):
+            datos = parte.encode("utf-8")
+        else:
+            datos = json.dumps(parte, sort_keys=True, default=str).encode("utf-8")
+        # Longitud como separador: ("ab", "c") y ("a", "bc") no colisionan
+        h.update(len(datos).to_bytes(8, "little"))
+        h.update(datos)
+    return h.hexdigest()
+
+
+# ------------------------------------------------------------------------------
+# API PÚBLICA
+# ------------------------------------------------------------------------------
+def leer_cache_ia(clave):
+    """Respuesta guardada (cualquier valor JSON) o None si no existe o venció."""
+    try:
+        conexion = _conexion()
+        fila = conexion.execute("SELECT valor, creado FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+        ahora = time.time()
+        if fila and ahora - fila[1] <= TTL_CACHE_IA_DIAS * 86400:
+            conexion.execute("UPDATE respuestas SET usado = ? WHERE clave = ?", (ahora, clave))
+            _contar("aciertos")
+            return json.loads(fila[0])
+        if fila:
+            conexion.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+    except sqlite3.Error:
+        pass
+    _contar("fallos")
+    return None
+
+
+def guardar_cache_ia(clave, valor):
+    """Guarda una respuesta exitosa. Un error de disco nunca interrumpe la consulta."""
+    try:
+        texto = json.dumps(valor, ensure_ascii=False)
+        ahora = time.time()
+        conexion = _conexion()
+        conexion.execute(
+            "INSERT OR REPLACE INTO respuestas (clave, valor, creado, usado, tamano) VALUES (?, ?, ?, ?, ?)",
+            (clave, texto, ahora, ahora, len(texto.encode("utf-8"))),
+        )
+        _desalojar(conexion)
+    except (sqlite3.Error, TypeError, ValueError):
+        pass
+
+
+def _desalojar(conexion):
+    """Borra vencidas y, si se pasa del límite, las menos usadas hasta quedar en 90%."""
+    limite = LIMITE_CACHE_IA_MB * 1024 * 1024
+    vencidas = conexion.execute("DELETE FROM respuestas WHERE creado < ?", (time.time() - TTL_CACHE_IA_DIAS * 86400,)).rowcount
+    total = conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM respuestas").fetchone()[0]
+    borradas = 0
+    if total > limite:
+        sobrante = total - int(limite * 0.9)
+        for clave, tamano in conexion.execute("SELECT clave, tamano FROM respuestas ORDER BY usado").fetchall():
+            if sobrante <= 0:
+                break
+            conexion.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+            sobrante -= tamano
+            borradas += 1
+    if vencidas + borradas:
+        _contar("desalojos", vencidas + borradas)
+
+
+def consultar_con_cache(clave, calcular):
+    """
+    Retorna la respuesta en caché o la calcula con calcular() y la guarda.
+    calcular() retorna (valor, exitoso); solo se guardan los exitosos.
+    """
+    previo = leer_cache_ia(clave)
+    if previo is not None:
+        return previo
+    valor, exitoso = calcular()
+    if exitoso:
+        guardar_cache_ia(clave, valor)
+    return valor
+
+
+def estadisticas_cache_ia():
+    """Aciertos, fallos y desalojos (de este proceso) y tamaño del archivo de caché."""
+    try:
+        entradas, total = _conexion().execute("SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM respuestas").fetchone()
+    except sqlite3.Error:
+        entradas, total = 0, 0
+    with _lock:
+        return dict(_estadisticas, entradas=entradas, megabytes=round(total / 1024 / 1024, 2))
+
+
+def limpiar_cache_ia():
+    try:
+        _conexion().execute("DELETE FROM respuestas")
+    except sqlite3.Error:
+        pass
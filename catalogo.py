@@ -0,0 +1,186 @@
+# ==============================================================================
+# CATÁLOGO DE DATASETS POR USUARIO (PARQUET COLUMNAR)
+# ==============================================================================
+# Los Excel subidos solo vivían como UploadedFile y DataFrames que se
+# reconstruían en cada rerun; pasar del cruce DIAN a la auditoría de gastos
+# con el mismo auxiliar obligaba a subirlo y parsearlo otra vez con openpyxl.
+#
+# Aquí cada carga se convierte una sola vez a Parquet comprimido (zstd), con
+# el esquema tipado de tipos.py (fechas, montos, NIT como texto), y queda en el
+# catálogo del usuario:
+#   <CARPETA_CATALOGO>/catalogo.sqlite          (nombre, filas, esquema, uso)
+#   <CARPETA_CATALOGO>/<usuario>/<huella>.parquet
+# La huella es la del contenido del archivo original (ingesta.huella_archivo):
+# volver a subir el mismo archivo no lo convierte de nuevo. Cualquier módulo
+# recibe la ruta .parquet e ingesta.py la lee mapeada en memoria y solo con
+# las columnas que necesita.
+#
+# La conversión va por bloques (ingesta.iterar_bloques -> ParquetWriter): el
+# libro nunca está completo en memoria, así que un auxiliar enorme se puede
+# catalogar y luego cruzar fuera de memoria (exógena). Los tipos se detectan
+# en el primer bloque y los demás se convierten a ese mismo esquema.
+# ==============================================================================
+
+import json
+import os
+import re
+import sqlite3
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingesta import columnas_archivo, huella_archivo, iterar_bloques
+from tipos import normalizar_tabla
+
+CARPETA_CATALOGO = os.environ.get("CONTADOR_CATALOGO_DIR", "catalogo")
+LIMITE_CATALOGO_MB = int(os.environ.get("CONTADOR_CATALOGO_MB", "2048"))   # por usuario
+COMPRESION = "zstd"
+FILAS_POR_BLOQUE = 100_000
+
+# Tipo de tipos.py -> columna Parquet (todas admiten vacíos)
+TIPOS_PARQUET = {
+    'nit': pa.string(), 'texto': pa.string(), 'fecha': pa.timestamp('ns'),
+    'monto': pa.float64(), 'entero': pa.int64(), 'logico': pa.bool_(),
+}
+
+
+def _conexion():
+    os.makedirs(CARPETA_CATALOGO, exist_ok=True)
+    conexion = sqlite3.connect(os.path.join(CARPETA_CATALOGO, "catalogo.sqlite"), timeout=30, isolation_level=None)
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS datasets ("
+        "usuario TEXT NOT NULL, huella TEXT NOT NULL, nombre TEXT, hoja TEXT, ruta TEXT NOT NULL, "
+        "filas INTEGER, esquema TEXT, tamano INTEGER, creado REAL NOT NULL, usado REAL NOT NULL, "
+        "PRIMARY KEY (usuario, huella, hoja))"
+    )
+    return conexion
+
+
+def _carpeta_usuario(usuario):
+    return os.path.join(CARPETA_CATALOGO, re.sub(r'[^\w\-]', '_', str(usuario or 'anonimo')))
+
+
+def _escribir_parquet(archivo, hoja, ruta):
+    """
+    Escribe el archivo en 'ruta' bloque a bloque, tipando cada bloque una sola
+    vez. Retorna (filas, esquema {columna: tipo}).
+    """
+    escritor, esquema, filas = None, None, 0
+    try:
+        for bloque in iterar_bloques(archivo, hoja=hoja, filas_por_bloque=FILAS_POR_BLOQUE):
+            bloque, esquema = normalizar_tabla(bloque, esquema)
+            bloque.columns = [str(c) for c in bloque.columns]
+            if escritor is None:
+                esquema_parquet = pa.schema([(str(c), TIPOS_PARQUET[t]) for c, t in esquema.items()])
+                escritor = pq.ParquetWriter(ruta, esquema_parquet, compression=COMPRESION)
+            escritor.write_table(pa.Table.from_pandas(bloque, schema=esquema_parquet, preserve_index=False))
+            filas += len(bloque)
+        if escritor is None:
+            # Archivo sin filas: solo el encabezado
+            esquema = {c: 'texto' for c in columnas_archivo(archivo, hoja=hoja)}
+            pq.write_table(pa.table({str(c): pa.array([], pa.string()) for c in esquema}), ruta, compression=COMPRESION)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return filas, esquema
+
+
+# ------------------------------------------------------------------------------
+# API PÚBLICA
+# ------------------------------------------------------------------------------
+def registrar_dataset(archivo, usuario, hoja=0):
+    """
+    Convierte el archivo (Excel / CSV subido o ruta) a Parquet en el catálogo
+    del usuario, si no estaba ya. Retorna la ruta absoluta del .parquet.
+    """
+    huella = huella_archivo(archivo)
+    conexion = _conexion()
+    try:
+        fila = conexion.execute("SELECT ruta FROM datasets WHERE usuario = ? AND huella = ? AND hoja = ?",
+                                (usuario, huella, str(hoja))).fetchone()
+        if fila and os.path.exists(fila[0]):
+            conexion.execute("UPDATE datasets SET usado = ? WHERE usuario = ? AND huella = ? AND hoja = ?",
+                             (time.time(), usuario, huella, str(hoja)))
+            return fila[0]
+
+        carpeta = _carpeta_usuario(usuario)
+        os.makedirs(carpeta, exist_ok=True)
+        sufijo = "" if hoja == 0 else "_" + re.sub(r'[^\w\-]', '_', str(hoja))
+        ruta = os.path.abspath(os.path.join(carpeta, f"{huella}{sufijo}.parquet"))
+        try:
+            filas, esquema = _escribir_parquet(archivo, hoja, ruta + ".parcial")
+        except BaseException:
+            if os.path.exists(ruta + ".parcial"):
+                os.remove(ruta + ".parcial")
+            raise
+        os.replace(ruta + ".parcial", ruta)
+
+        ahora = time.time()
+        nombre = os.path.basename(str(getattr(archivo, 'name', None) or archivo))
+        conexion.execute(
+            "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (usuario, huella, nombre, str(hoja), ruta, filas, json.dumps({str(k): v for k, v in esquema.items()}, ensure_ascii=False),
+             os.path.getsize(ruta), ahora, ahora),
+        )
+        _desalojar(conexion, usuario)
+        return ruta
+    finally:
+        conexion.close()
+
+
+def _desalojar(conexion, usuario):
+    """Si el catálogo del usuario pasa del límite, borra los datasets menos usados."""
+    filas = conexion.execute("SELECT huella, hoja, ruta, tamano FROM datasets WHERE usuario = ? ORDER BY usado DESC",
+                             (usuario,)).fetchall()
+    acumulado = 0
+    for huella, hoja, ruta, tamano in filas:
+        acumulado += tamano or 0
+        if acumulado > LIMITE_CATALOGO_MB * 1024 * 1024 and acumulado != tamano:
+            _borrar(conexion, usuario, huella, hoja, ruta)
+
+
+def _borrar(conexion, usuario, huella, hoja, ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+    conexion.execute("DELETE FROM datasets WHERE usuario = ? AND huella = ? AND hoja = ?", (usuario, huella, hoja))
+
+
+def listar_datasets(usuario):
+    """Datasets del usuario, del más reciente al más antiguo (dicts con ruta, nombre, filas, esquema...)."""
+    conexion = _conexion()
+    try:
+        cursor = conexion.execute("SELECT * FROM datasets WHERE usuario = ? ORDER BY usado DESC", (usuario,))
+        columnas = [c[0] for c in cursor.description]
+        datasets = []
+        for fila in cursor.fetchall():
+            dataset = dict(zip(columnas, fila))
+            if not os.path.exists(dataset['ruta']):
+                continue
+            dataset['esquema'] = json.loads(dataset['esquema'] or "{}")
+            datasets.append(dataset)
+        return datasets
+    finally:
+        conexion.close()
+
+
+def nombre_dataset(ruta):
+    """Nombre del archivo original de un dataset del catálogo (o el de la ruta)."""
+    conexion = _conexion()
+    try:
+        fila = conexion.execute("SELECT nombre FROM datasets WHERE ruta = ?", (ruta,)).fetchone()
+    finally:
+        conexion.close()
+    return fila[0] if fila else os.path.basename(str(ruta))
+
+
+def borrar_dataset(usuario, ruta):
+    conexion = _conexion()
+    try:
+        fila = conexion.execute("SELECT huella, hoja FROM datasets WHERE usuario = ? AND ruta = ?", (usuario, ruta)).fetchone()
+        if fila:
+            _borrar(conexion, usuario, fila[0], fila[1], ruta)
+    finally:
+        conexion.close()
@@ -0,0 +1,443 @@
+# ==============================================================================
+# MOTOR DE CONCILIACIÓN BANCARIA
+# ==============================================================================
+# Lógica de emparejamiento Extracto vs Libro Auxiliar, independiente de Streamlit
+# para poder ejecutarla desde scripts o procesos por lotes.
+#
+# Estrategia: en lugar de filtrar todo el libro por cada fila del banco (O(n·m)),
+# agrupamos el libro en "cubetas" por valor y, dentro de cada cubeta, ordenamos
+# por fecha. Cada fila del banco hace una búsqueda binaria en su cubeta para
+# ubicar la ventana de ±N días.
+# ==============================================================================
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+from nit import clave_nit
+from tipos import a_fecha, a_numero
+
+NS_POR_DIA = 86_400 * 10**9
+
+
+def _fechas_a_ns(fechas):
+    """
+    Convierte una serie/arreglo de fechas a enteros int64 (nanosegundos).
+    Retorna también la máscara de fechas válidas (las NaT nunca concilian).
+    """
+    fechas = a_fecha(pd.Series(fechas).reset_index(drop=True))
+    validas = fechas.notna().to_numpy()
+    ns = fechas.to_numpy(dtype='datetime64[ns]').view('int64')
+    return ns, validas
+
+
+def _libre_desde(siguiente, i):
+    """Primer índice libre >= i según los punteros de salto (con compresión de camino)."""
+    raiz = i
+    while siguiente[raiz] != raiz:
+        raiz = siguiente[raiz]
+    while siguiente[i] != raiz:
+        siguiente[i], i = raiz, siguiente[i]
+    return raiz
+
+
+def emparejar_exacto(valores_banco, fechas_banco, valores_libro, fechas_libro,
+                     dias_tolerancia=3, progreso=None):
+    """
+    Empareja cada fila del banco con una fila del libro de IGUAL valor y fecha
+    dentro de ±dias_tolerancia (inclusive).
+
+    Conserva la regla histórica 'first match consumes': las filas del banco se
+    recorren en su orden original y cada una toma, entre los candidatos libres,
+    el de menor posición en el libro. Un registro del libro solo se usa una vez.
+
+    Retorna un arreglo int64 del tamaño del banco con la posición (0..m-1) del
+    libro emparejado, o -1 si la fila quedó pendiente.
+    """
+    n_banco = len(valores_banco)
+    n_libro = len(valores_libro)
+    resultado = np.full(n_banco, -1, dtype=np.int64)
+    if n_banco == 0 or n_libro == 0:
+        return resultado
+
+    # 1. Códigos de valor compartidos (misma semántica de igualdad que '==')
+    valores = np.concatenate([np.asarray(valores_banco, dtype=object),
+                              np.asarray(valores_libro, dtype=object)])
+    codigos, _ = pd.factorize(valores)
+    cod_banco = codigos[:n_banco]
+    cod_libro = codigos[n_banco:]
+
+    ns_banco, ok_banco = _fechas_a_ns(fechas_banco)
+    ns_libro, ok_libro = _fechas_a_ns(fechas_libro)
+
+    # 2. Cubetas: libro ordenado por (valor, fecha, posición original)
+    posiciones = np.flatnonzero((cod_libro >= 0) & ok_libro)
+    orden = posiciones[np.lexsort((posiciones, ns_libro[posiciones], cod_libro[posiciones]))]
+    cod_ord = cod_libro[orden]
+    inicio_cubeta = np.searchsorted(cod_ord, np.arange(codigos.max() + 2), side='left')
+
+    fechas_ord = ns_libro[orden].tolist()
+    pos_ord = orden.tolist()
+    inicio_cubeta = inicio_cubeta.tolist()
+    ventana = int(dias_tolerancia) * NS_POR_DIA
+
+    # Punteros de salto (union-find): siguiente[i] apunta al primer libre >= i
+    siguiente = list(range(len(pos_ord) + 1))
+
+    # 3. Recorrido del banco en orden original
+    cod_banco_l = cod_banco.tolist()
+    ns_banco_l = ns_banco.tolist()
+    ok_banco_l = ok_banco.tolist()
+    paso_progreso = max(1, n_banco // 100)
+
+    for i in range(n_banco):
+        if progreso is not None and i % paso_progreso == 0:
+            progreso(i / n_banco)
+
+        cod = cod_banco_l[i]
+        if cod < 0 or not ok_banco_l[i]:
+            continue
+        ini, fin = inicio_cubeta[cod], inicio_cubeta[cod + 1]
+        if ini == fin:
+            continue
+
+        fb = ns_banco_l[i]
+        lo = bisect_left(fechas_ord, fb - ventana, ini, fin)
+        hi = bisect_right(fechas_ord, fb + ventana, lo, fin)
+
+        # Entre los libres de la ventana, el de menor posición en el libro
+        mejor = -1
+        j = _libre_desde(siguiente, lo)
+        while j < hi:
+            if mejor < 0 or pos_ord[j] < pos_ord[mejor]:
+                mejor = j
+            j = _libre_desde(siguiente, j + 1)
+
+        if mejor >= 0:
+            resultado[i] = pos_ord[mejor]
+            siguiente[mejor] = mejor + 1
+
+    if progreso is not None:
+        progreso(1.0)
+    return resultado
+
+
+def conciliar_banco_libro(df_banco, df_libro, col_valor_b, col_fecha_b, col_valor_l, col_fecha_l,
+                          dias_tolerancia=3, progreso=None):
+    """
+    Versión para DataFrames del motor de emparejamiento.
+    Espera columnas de fecha ya convertidas a datetime.
+
+    Retorna (pos_banco, pos_libro): posiciones (iloc) de las parejas conciliadas,
+    en el orden original del extracto.
+    """
+    asignacion = emparejar_exacto(
+        df_banco[col_valor_b].to_numpy(), df_banco[col_fecha_b],
+        df_libro[col_valor_l].to_numpy(), df_libro[col_fecha_l],
+        dias_tolerancia=dias_tolerancia, progreso=progreso,
+    )
+    pos_banco = np.flatnonzero(asignacion >= 0)
+    return pos_banco, asignacion[pos_banco]
+
+
+# ==============================================================================
+# CONCILIACIÓN POR ETAPAS (TOLERANCIAS Y AGRUPACIONES)
+# ==============================================================================
+# Cada etapa trabaja solo sobre lo que dejaron libre las anteriores:
+#   0. tercero       -> como 'exacto' pero además mismo NIT (solo si ambos lados traen
+#                       columna de NIT; se ejecuta antes para que un pago repetido
+#                       del mismo valor se quede con su propio tercero)
+#   1. exacto        -> mismo valor, fecha ±N días (motor de cubetas de arriba)
+#   2. tolerancia    -> 1 a 1 con diferencia de valor <= tolerancia (comisiones, redondeos)
+#   3. uno_a_varios  -> 1 línea del banco contra 2..k líneas del libro (transferencia partida)
+#   4. varios_a_uno  -> 2..k líneas del banco contra 1 línea del libro (consignaciones agrupadas)
+# Los montos se manejan en centavos (int64) para que las sumas sean exactas.
+# En las agrupaciones casi siempre hay algún subconjunto que suma lo buscado
+# (con 20.000 movimientos y tolerancia salen miles de grupos al azar): un grupo
+# solo se concilia si es el único que cuadra en la ventana y su suma es exacta.
+# Si cuadran varios, o solo cuadra por tolerancia, queda como SUGERIDO: se
+# reporta para revisión y sus partidas siguen pendientes.
+# ==============================================================================
+
+ESTADOS_CONCILIACION = {
+    "tercero": "🤝 AUTOMÁTICO (MISMO NIT)",
+    "exacto": "✅ AUTOMÁTICO",
+    "tolerancia": "🟡 TOLERANCIA",
+    "uno_a_varios": "🧩 AGRUPADO (1 Banco : N Libro)",
+    "varios_a_uno": "🧩 AGRUPADO (N Banco : 1 Libro)",
+}
+
+ETAPAS_POR_DEFECTO = ("exacto", "tolerancia", "uno_a_varios", "varios_a_uno")
+
+
+def _a_centavos(valores):
+    """Convierte montos a centavos enteros. Los no numéricos quedan marcados como inválidos."""
+    num = a_numero(pd.Series(valores).reset_index(drop=True)).to_numpy(dtype=float)
+    validos = np.isfinite(num)
+    centavos = np.zeros(len(num), dtype=np.int64)
+    centavos[validos] = np.round(num[validos] * 100).astype(np.int64)
+    return centavos, validos
+
+
+def _etapa_exacto(estado, params):
+    libres_b = np.flatnonzero(estado['libre_b'])
+    libres_l = np.flatnonzero(estado['libre_l'])
+    asignacion = emparejar_exacto(
+        estado['cent_b'][libres_b],
+        estado['ns_b'][libres_b].view('datetime64[ns]'),
+        estado['cent_l'][libres_l],
+        estado['ns_l'][libres_l].view('datetime64[ns]'),
+        dias_tolerancia=params['dias_tolerancia'],
+    )
+    for i, j in zip(np.flatnonzero(asignacion >= 0).tolist(), asignacion[asignacion >= 0].tolist()):
+        _registrar(estado, "exacto", [libres_b[i]], [libres_l[j]])
+
+
+def _etapa_tercero(estado, params):
+    """Exacto restringido a filas con NIT en ambos lados: la cubeta es (valor, NIT)."""
+    if 'nit_b' not in estado:
+        return
+    libres_b = np.flatnonzero(estado['libre_b'] & (estado['nit_b'] >= 0))
+    libres_l = np.flatnonzero(estado['libre_l'] & (estado['nit_l'] >= 0))
+    if len(libres_b) == 0 or len(libres_l) == 0:
+        return
+    # Código combinado (valor, NIT) como un solo entero para reutilizar el motor de cubetas
+    cod_valor, _ = pd.factorize(np.concatenate([estado['cent_b'][libres_b], estado['cent_l'][libres_l]]))
+    cod_nit, unicos_nit = pd.factorize(np.concatenate([estado['nit_b'][libres_b], estado['nit_l'][libres_l]]))
+    combinado = cod_valor.astype(np.int64) * len(unicos_nit) + cod_nit
+    asignacion = emparejar_exacto(
+        combinado[:len(libres_b)],
+        estado['ns_b'][libres_b].view('datetime64[ns]'),
+        combinado[len(libres_b):],
+        estado['ns_l'][libres_l].view('datetime64[ns]'),
+        dias_tolerancia=params['dias_tolerancia'],
+    )
+    for i, j in zip(np.flatnonzero(asignacion >= 0).tolist(), asignacion[asignacion >= 0].tolist()):
+        _registrar(estado, "tercero", [libres_b[i]], [libres_l[j]])
+
+
+def _etapa_tolerancia(estado, params):
+    """
+    1 a 1 con diferencia de valor. Índice del libro ordenado por (monto, fecha,
+    posición), con una cubeta por monto distinto: cada fila del banco recorre las
+    cubetas de [v - tol, v + tol], ubica la ventana de fechas por bisección y se
+    queda con la menor diferencia (empate: menor posición en el libro). Las filas
+    ya usadas se saltan con los mismos punteros que emparejar_exacto(); las
+    sugeridas por una etapa anterior no entran al índice.
+    """
+    tol = params['tolerancia_centavos']
+    if tol <= 0:
+        return
+    ventana = int(params['dias_tolerancia']) * NS_POR_DIA
+    cent_l, ns_l = estado['cent_l'], estado['ns_l']
+    libres_l = np.flatnonzero(estado['libre_l'] & ~estado['sugerida_l'])
+    orden = libres_l[np.lexsort((libres_l, ns_l[libres_l], cent_l[libres_l]))]
+    distintos, inicio_cubeta = np.unique(cent_l[orden], return_index=True)
+    distintos = distintos.tolist()
+    inicio_cubeta = inicio_cubeta.tolist() + [len(orden)]
+    fechas_ord = ns_l[orden].tolist()
+    pos_ord = orden.tolist()
+    siguiente = list(range(len(pos_ord) + 1))
+
+    for i in np.flatnonzero(estado['libre_b'] & ~estado['sugerida_b']).tolist():
+        v, fb = int(estado['cent_b'][i]), int(estado['ns_b'][i])
+        mejor, mejor_clave = -1, None
+        primera = bisect_left(distintos, v - tol)
+        for c in range(primera, bisect_right(distintos, v + tol, primera)):
+            ini, fin = inicio_cubeta[c], inicio_cubeta[c + 1]
+            lo = bisect_left(fechas_ord, fb - ventana, ini, fin)
+            hi = bisect_right(fechas_ord, fb + ventana, lo, fin)
+            # Dentro de la cubeta la diferencia es la misma: gana la menor posición
+            k = _libre_desde(siguiente, lo)
+            while k < hi:
+                clave = (abs(distintos[c] - v), pos_ord[k])
+                if mejor_clave is None or clave < mejor_clave:
+                    mejor, mejor_clave = k, clave
+                k = _libre_desde(siguiente, k + 1)
+        if mejor >= 0:
+            _registrar(estado, "tolerancia", [i], [pos_ord[mejor]])
+            siguiente[mejor] = mejor + 1
+
+
+def _buscar_subconjuntos(montos, objetivo, tolerancia, max_partidas, limite=2):
+    """
+    Busca grupos de 2..max_partidas elementos de 'montos' (enteros positivos
+    ordenados de menor a mayor) cuya suma quede en objetivo ± tolerancia.
+    Retorna hasta 'limite' grupos (listas de índices), primero los más pequeños:
+    con dos ya se sabe que el grupo no es único.
+
+    Poda: con los montos ordenados, la suma mínima y máxima alcanzable desde cada
+    posición se conoce por sumas acumuladas; el último elemento se ubica por bisección.
+    """
+    n = len(montos)
+    acumulado = [0]
+    for m in montos:
+        acumulado.append(acumulado[-1] + m)
+
+    def buscar(inicio, restante, faltan):
+        if faltan == 1:
+            j = bisect_left(montos, restante - tolerancia, inicio)
+            while j < n and montos[j] <= restante + tolerancia:
+                yield [j]
+                j += 1
+            return
+        for j in range(inicio, n - faltan + 1):
+            if acumulado[j + faltan] - acumulado[j] > restante + tolerancia:
+                break
+            maximo = montos[j] + acumulado[n] - acumulado[max(j + 1, n - faltan + 1)]
+            if maximo < restante - tolerancia:
+                continue
+            for resto in buscar(j + 1, restante - montos[j], faltan - 1):
+                yield [j] + resto
+
+    encontrados = []
+    for tamano in range(2, max_partidas + 1):
+        for grupo in buscar(0, objetivo, tamano):
+            encontrados.append(grupo)
+            if len(encontrados) >= limite:
+                return encontrados
+    return encontrados
+
+
+def _etapa_agrupada(estado, params, lado):
+    """
+    Agrupaciones N a 1. 'lado' indica quién aporta la línea única ('b' banco, 'l' libro).
+    Candidatos: libres del otro lado, mismo signo, |monto| <= |objetivo| + tol y fecha
+    en la ventana (bisección sobre el índice ordenado por fecha). Si hay demasiados,
+    se conservan los más cercanos en fecha. Un grupo ambiguo o que solo cuadra por
+    tolerancia se registra como sugerido (no concilia sus partidas).
+    """
+    otro = 'l' if lado == 'b' else 'b'
+    etapa = "uno_a_varios" if lado == 'b' else "varios_a_uno"
+    tol = params['tolerancia_centavos']
+    ventana = int(params['dias_tolerancia']) * NS_POR_DIA
+    max_partidas = int(params['max_partidas'])
+    max_candidatos = int(params['max_candidatos'])
+    if max_partidas < 2:
+        return
+
+    cent_o, ns_o, libre_o = estado['cent_' + otro], estado['ns_' + otro], estado['libre_' + otro]
+    sugerida_o = estado['sugerida_' + otro]
+    base = np.flatnonzero(libre_o & ~sugerida_o & (cent_o != 0))
+    orden = base[np.argsort(ns_o[base], kind='stable')]
+    fechas_ord = ns_o[orden]
+
+    for i in np.flatnonzero(estado['libre_' + lado] & ~estado['sugerida_' + lado]).tolist():
+        objetivo = int(estado['cent_' + lado][i])
+        if objetivo == 0:
+            continue
+        fecha = int(estado['ns_' + lado][i])
+        lo = np.searchsorted(fechas_ord, fecha - ventana, side='left')
+        hi = np.searchsorted(fechas_ord, fecha + ventana, side='right')
+        cands = orden[lo:hi]
+        montos = cent_o[cands]
+        mascara = libre_o[cands] & ~sugerida_o[cands] & (np.sign(montos) == np.sign(objetivo)) & (np.abs(montos) <= abs(objetivo) + tol)
+        cands = cands[mascara]
+        if len(cands) < 2:
+            continue
+        if len(cands) > max_candidatos:
+            distancia = np.abs(ns_o[cands] - fecha)
+            cands = cands[np.argsort(distancia, kind='stable')[:max_candidatos]]
+
+        abs_montos = np.abs(cent_o[cands])
+        por_monto = np.argsort(abs_montos, kind='stable')
+        grupos = _buscar_subconjuntos(abs_montos[por_monto].tolist(), abs(objetivo), tol, max_partidas)
+        if not grupos:
+            continue
+        grupo = cands[por_monto[grupos[0]]].tolist()
+        sugerida = len(grupos) > 1 or int(np.abs(cent_o[grupo]).sum()) != abs(objetivo)
+        if lado == 'b':
+            _registrar(estado, etapa, [i], grupo, sugerida)
+        else:
+            _registrar(estado, etapa, grupo, [i], sugerida)
+
+
+def _registrar(estado, etapa, pos_b, pos_l, sugerida=False):
+    """Marca el emparejamiento. Uno sugerido no libera nada: sus partidas siguen pendientes."""
+    if sugerida:
+        estado['sugerida_b'][pos_b] = True
+        estado['sugerida_l'][pos_l] = True
+    else:
+        estado['libre_b'][pos_b] = False
+        estado['libre_l'][pos_l] = False
+    diferencia = int(estado['cent_b'][pos_b].sum()) - int(estado['cent_l'][pos_l].sum())
+    estado['parejas'].append((etapa, tuple(int(p) for p in pos_b), tuple(int(p) for p in pos_l), diferencia / 100, sugerida))
+
+
+# Registro de etapas: para agregar una regla nueva basta con una función
+# f(estado, params) que llame _registrar() sobre filas libres.
+ETAPAS_CONCILIACION = {
+    "tercero": _etapa_tercero,
+    "exacto": _etapa_exacto,
+    "tolerancia": _etapa_tolerancia,
+    "uno_a_varios": lambda estado, params: _etapa_agrupada(estado, params, 'b'),
+    "varios_a_uno": lambda estado, params: _etapa_agrupada(estado, params, 'l'),
+}
+
+
+def conciliar_por_etapas(df_banco, df_libro, col_valor_b, col_fecha_b, col_valor_l, col_fecha_l,
+                         dias_tolerancia=3, tolerancia_valor=0.0, max_partidas=3, max_candidatos=40,
+                         etapas=ETAPAS_POR_DEFECTO, progreso=None, col_nit_b=None, col_nit_l=None):
+    """
+    Conciliación configurable. Las fechas deben venir ya convertidas a datetime.
+    Con 'col_nit_b' y 'col_nit_l' se normalizan los NIT (nit.py) y, si hay etapa
+    'exacto', se antepone la etapa 'tercero'.
+
+    Retorna un DataFrame con una fila por emparejamiento:
+    Etapa, Pos_Banco (tupla de posiciones iloc), Pos_Libro (tupla), Diferencia (Banco - Libro),
+    Sugerida (True: agrupación para revisar, sus partidas no quedan conciliadas).
+    """
+    cent_b, val_b = _a_centavos(df_banco[col_valor_b])
+    cent_l, val_l = _a_centavos(df_libro[col_valor_l])
+    ns_b, fecha_b = _fechas_a_ns(df_banco[col_fecha_b])
+    ns_l, fecha_l = _fechas_a_ns(df_libro[col_fecha_l])
+
+    estado = {
+        'cent_b': cent_b, 'ns_b': ns_b, 'libre_b': val_b & fecha_b, 'sugerida_b': np.zeros(len(cent_b), dtype=bool),
+        'cent_l': cent_l, 'ns_l': ns_l, 'libre_l': val_l & fecha_l, 'sugerida_l': np.zeros(len(cent_l), dtype=bool),
+        'parejas': [],
+    }
+    if col_nit_b and col_nit_l:
+        estado['nit_b'] = clave_nit(df_banco[col_nit_b])
+        estado['nit_l'] = clave_nit(df_libro[col_nit_l])
+        if "exacto" in etapas and "tercero" not in etapas:
+            etapas = ("tercero",) + tuple(etapas)
+    params = {
+        'dias_tolerancia': dias_tolerancia,
+        'tolerancia_centavos': int(round(float(tolerancia_valor) * 100)),
+        'max_partidas': max_partidas,
+        'max_candidatos': max_candidatos,
+    }
+
+    for n, nombre in enumerate(etapas):
+        if progreso is not None:
+            progreso(n / len(etapas))
+        ETAPAS_CONCILIACION[nombre](estado, params)
+    if progreso is not None:
+        progreso(1.0)
+
+    return pd.DataFrame(estado['parejas'], columns=['Etapa', 'Pos_Banco', 'Pos_Libro', 'Diferencia', 'Sugerida'])
+
+
+def describir_parejas(parejas, df_banco, df_libro, col_fecha_b, col_fecha_l, col_desc_b, col_valor_b):
+    """
+    Construye la tabla legible de partidas cruzadas a partir de conciliar_por_etapas().
+    En las agrupaciones las fechas/descripciones se unen con ' | '.
+    """
+    fechas_b = df_banco[col_fecha_b].map(str).tolist()
+    fechas_l = df_libro[col_fecha_l].map(str).tolist()
+    desc_b = df_banco[col_desc_b].map(str).tolist()
+    valores_b = a_numero(df_banco[col_valor_b]).fillna(0).tolist()
+
+    filas = []
+    for etapa, pos_b, pos_l, diferencia, sugerida in parejas.itertuples(index=False):
+        filas.append({
+            "Fecha Banco": " | ".join(fechas_b[p] for p in pos_b),
+            "Fecha Libro": " | ".join(fechas_l[p] for p in pos_l),
+            "Descripción": " | ".join(desc_b[p] for p in pos_b),
+            "Valor Cruzado": f"${sum(valores_b[p] for p in pos_b):,.2f}",
+            "Diferencia": diferencia,
+            "Estado": ("🔎 SUGERIDA - " if sugerida else "") + ESTADOS_CONCILIACION.get(etapa, etapa),
+        })
+    return pd.DataFrame(filas, columns=["Fecha Banco", "Fecha Libro", "Descripción", "Valor Cruzado", "Diferencia", "Estado"])
@@ -0,0 +1,204 @@
+# ==============================================================================
+# CONCILIACIÓN CONTINUA (ESTADO ENTRE PERIODOS)
+# ==============================================================================
+# Cada mes se vuelve a subir el extracto acumulado y el auxiliar, y antes todo
+# se conciliaba desde cero. Aquí cada partida se identifica con una huella
+# estable (fecha, valor en centavos, descripción y número de ocurrencia para
+# repetidas) y un SQLite local recuerda, por usuario y cuenta bancaria (la
+# cuenta es texto libre: dos clientes que escriben "Bancolombia" no comparten
+# historial):
+#   - las partidas ya conciliadas (no vuelven a entrar al motor),
+#   - las partidas abiertas, con sus datos, para arrastrarlas al siguiente periodo
+#     aunque el nuevo archivo ya no las traiga.
+# Una corrida solo empareja lo nuevo contra lo que sigue abierto, así el costo
+# depende de la actividad del periodo y no de todo el historial: del almacén
+# solo se leen las huellas del archivo (por la llave primaria) y las abiertas,
+# y solo se escriben las partidas que cambian (nuevas o recién conciliadas).
+# ==============================================================================
+
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from conciliacion import conciliar_por_etapas
+from tipos import a_fecha, a_numero
+
+ARCHIVO_CONCILIACIONES = os.environ.get("CONTADOR_CONCILIACIONES", "conciliaciones.sqlite")
+
+ABIERTA = "abierta"
+CONCILIADA = "conciliada"
+
+
+def _conexion(archivo):
+    conexion = sqlite3.connect(archivo, timeout=30)
+    columnas = [c[1] for c in conexion.execute("PRAGMA table_info(partidas)")]
+    if columnas and 'usuario' not in columnas:
+        # Historial de antes de separar por usuario: no se sabe de quién es, se aparta sin borrarlo
+        with conexion:
+            conexion.execute("ALTER TABLE partidas RENAME TO partidas_sin_usuario")
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS partidas ("
+        "usuario TEXT NOT NULL, cuenta TEXT NOT NULL, lado TEXT NOT NULL, huella INTEGER NOT NULL, "
+        "estado TEXT NOT NULL, etapa TEXT, grupo TEXT, fila TEXT, actualizado REAL NOT NULL, "
+        "PRIMARY KEY (usuario, cuenta, lado, huella))"
+    )
+    return conexion
+
+
+# ------------------------------------------------------------------------------
+# HUELLAS
+# ------------------------------------------------------------------------------
+def _texto_fila(df, columnas):
+    """Las columnas de la fila unidas como texto (identifican la partida si no hay descripción)."""
+    if not columnas:
+        return ""
+    texto = df[columnas[0]].astype(str).str.strip()
+    for columna in columnas[1:]:
+        texto = texto + "\x1f" + df[columna].astype(str).str.strip()
+    return texto.to_numpy()
+
+
+def huellas_partidas(df, col_valor, col_fecha, col_desc=None):
+    """
+    Huella int64 por fila a partir de datos normalizados (fecha al día, valor en
+    centavos, descripción sin espacios a los lados). Sin 'col_desc' se usan las
+    demás columnas de la fila (comprobante, tercero, ...): dos asientos con la
+    misma fecha y valor no deben depender solo del orden. Las filas idénticas se
+    distinguen por su número de ocurrencia, así dos cargos iguales el mismo día
+    siguen siendo dos partidas y conservan su huella en el extracto del mes siguiente.
+    """
+    valor = a_numero(df[col_valor]).to_numpy(dtype=float)
+    otras = [c for c in df.columns if c not in (col_valor, col_fecha)]
+    base = pd.DataFrame({
+        'fecha': a_fecha(df[col_fecha]).dt.normalize().to_numpy(dtype='datetime64[ns]').view('int64'),
+        'centavos': np.where(np.isfinite(valor), np.round(valor * 100), 0).astype(np.int64),
+        'desc': df[col_desc].astype(str).str.strip().to_numpy() if col_desc else _texto_fila(df, otras),
+    })
+    h = pd.util.hash_pandas_object(base, index=False).to_numpy()
+    ocurrencia = pd.Series(h).groupby(h).cumcount().to_numpy(dtype=np.uint64)
+    combinado = pd.util.hash_pandas_object(pd.DataFrame({'h': h, 'o': ocurrencia}), index=False).to_numpy()
+    return combinado.view(np.int64)
+
+
+# ------------------------------------------------------------------------------
+# ALMACÉN
+# ------------------------------------------------------------------------------
+def _estado_guardado(conexion, usuario, cuenta, lado, huellas):
+    """
+    (huellas del archivo ya conciliadas, {huella: fila JSON} de las abiertas).
+    Las conciliadas se buscan solo entre las huellas entrantes (tabla temporal
+    unida por la llave primaria): el historial conciliado no se lee completo.
+    """
+    conexion.execute("CREATE TEMP TABLE IF NOT EXISTS entrantes (huella INTEGER PRIMARY KEY)")
+    conexion.execute("DELETE FROM entrantes")
+    conexion.executemany("INSERT OR IGNORE INTO entrantes VALUES (?)", ((int(h),) for h in huellas))
+    conciliadas = conexion.execute(
+        "SELECT p.huella FROM entrantes e JOIN partidas p "
+        "ON p.usuario = ? AND p.cuenta = ? AND p.lado = ? AND p.huella = e.huella "
+        "WHERE p.estado = ?", (usuario, cuenta, lado, CONCILIADA)).fetchall()
+    abiertas = conexion.execute(
+        "SELECT huella, fila FROM partidas WHERE usuario = ? AND cuenta = ? AND lado = ? AND estado = ?",
+        (usuario, cuenta, lado, ABIERTA)).fetchall()
+    return np.array([h for (h,) in conciliadas], dtype=np.int64), dict(abiertas)
+
+
+def _preparar_lado(df, huellas, conciliadas, abiertas):
+    """
+    Partidas que entran al motor: las del archivo que no estaban conciliadas,
+    más las abiertas guardadas que el archivo ya no trae (arrastradas).
+    """
+    ya_conciliadas = np.isin(huellas, conciliadas)
+    nuevas = df.loc[~ya_conciliadas].copy()
+    nuevas['_huella'] = huellas[~ya_conciliadas]
+    nuevas['Origen'] = np.where(np.isin(nuevas['_huella'], list(abiertas)), "Periodo anterior", "Nuevo")
+
+    en_archivo = set(huellas.tolist())
+    faltantes = [h for h in abiertas if h not in en_archivo]
+    if faltantes:
+        arrastradas = pd.DataFrame([json.loads(abiertas[h]) for h in faltantes])
+        arrastradas['_huella'] = np.array(faltantes, dtype=np.int64)
+        arrastradas['Origen'] = "Arrastrada"
+        nuevas = pd.concat([nuevas, arrastradas], ignore_index=True)
+    return nuevas.reset_index(drop=True), int(ya_conciliadas.sum())
+
+
+def _filas_json(df):
+    columnas = [c for c in df.columns if c not in ('_huella', 'Origen', 'Conciliado')]
+    # JSON escapa los saltos de línea dentro de los textos: cada fila es una línea
+    texto = df[columnas].to_json(orient='records', date_format='iso', force_ascii=False, lines=True)
+    return texto.rstrip('\n').split('\n') if len(df) else []
+
+
+def conciliar_incremental(usuario, cuenta, df_banco, df_libro, col_valor_b, col_fecha_b, col_valor_l, col_fecha_l,
+                          col_desc_b=None, col_desc_l=None, archivo=None, **opciones):
+    """
+    Conciliación que continúa la de periodos anteriores de la misma 'cuenta'
+    del mismo 'usuario' (id_usuario de la sesión).
+    Las opciones (etapas, tolerancias, NIT, progreso) son las de conciliar_por_etapas.
+
+    Retorna (parejas, banco, libro, resumen):
+    - banco / libro: partidas abiertas que entraron al motor (nuevas + arrastradas),
+      con columnas 'Origen' y 'Conciliado'; 'parejas' usa posiciones de estas tablas,
+    - resumen: conteos de partidas ya conciliadas en periodos anteriores.
+    """
+    if not usuario:
+        raise ValueError("La conciliación continua requiere el usuario")
+    conexion = _conexion(archivo or ARCHIVO_CONCILIACIONES)
+    try:
+        huellas_b = huellas_partidas(df_banco, col_valor_b, col_fecha_b, col_desc_b)
+        huellas_l = huellas_partidas(df_libro, col_valor_l, col_fecha_l, col_desc_l)
+        conc_b, abiertas_b = _estado_guardado(conexion, usuario, cuenta, 'b', huellas_b)
+        conc_l, abiertas_l = _estado_guardado(conexion, usuario, cuenta, 'l', huellas_l)
+        banco, previas_b = _preparar_lado(df_banco, huellas_b, conc_b, abiertas_b)
+        libro, previas_l = _preparar_lado(df_libro, huellas_l, conc_l, abiertas_l)
+        # Las arrastradas vienen de JSON: las fechas vuelven como texto ISO
+        banco[col_fecha_b] = a_fecha(banco[col_fecha_b])
+        libro[col_fecha_l] = a_fecha(libro[col_fecha_l])
+
+        parejas = conciliar_por_etapas(banco, libro, col_valor_b, col_fecha_b, col_valor_l, col_fecha_l, **opciones)
+
+        banco['Conciliado'] = False
+        libro['Conciliado'] = False
+        ahora = time.time()
+        registros = []
+        for k, pareja in enumerate(parejas.itertuples(index=False)):
+            if pareja.Sugerida:
+                # Agrupación para revisar: sus partidas siguen abiertas
+                continue
+            grupo = f"{int(ahora)}-{k}"
+            for lado, tabla, posiciones in (('b', banco, pareja.Pos_Banco), ('l', libro, pareja.Pos_Libro)):
+                tabla.iloc[list(posiciones), tabla.columns.get_loc('Conciliado')] = True
+                registros += [(usuario, cuenta, lado, int(h), CONCILIADA, pareja.Etapa, grupo, None, ahora)
+                              for h in tabla['_huella'].to_numpy()[list(posiciones)]]
+        for lado, tabla in (('b', banco), ('l', libro)):
+            # Las que ya estaban abiertas y siguen así no cambian: solo se guardan las nuevas
+            abiertas = tabla[~tabla['Conciliado'] & (tabla['Origen'] == "Nuevo")]
+            registros += [(usuario, cuenta, lado, int(h), ABIERTA, None, None, fila, ahora)
+                          for h, fila in zip(abiertas['_huella'].to_numpy(), _filas_json(abiertas))]
+
+        with conexion:
+            conexion.executemany("INSERT OR REPLACE INTO partidas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", registros)
+    finally:
+        conexion.close()
+
+    resumen = {
+        'conciliadas_antes_banco': previas_b,
+        'conciliadas_antes_libro': previas_l,
+        'arrastradas_banco': int((banco['Origen'] == "Arrastrada").sum()),
+        'arrastradas_libro': int((libro['Origen'] == "Arrastrada").sum()),
+    }
+    return parejas, banco.drop(columns=['_huella']), libro.drop(columns=['_huella']), resumen
+
+
+def olvidar_cuenta(usuario, cuenta, archivo=None):
+    """Borra el historial de una cuenta del usuario (la siguiente corrida empieza desde cero)."""
+    conexion = _conexion(archivo or ARCHIVO_CONCILIACIONES)
+    try:
+        with conexion:
+            conexion.execute("DELETE FROM partidas WHERE usuario = ? AND cuenta = ?", (usuario, cuenta))
+    finally:
+        conexion.close()
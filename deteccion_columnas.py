@@ -0,0 +1,277 @@
+# ==============================================================================
+# DETECCIÓN DE COLUMNAS POR ROL (ENCABEZADO + DATOS) CON MEMORIA POR FORMATO
+# ==============================================================================
+# Cada página tenía su propio detectar_idx(): buscaba palabras clave en los
+# nombres de columna y, si no encontraba ninguna, elegía la columna 0. Con un
+# auxiliar cuyo encabezado no traía "valor" la auditoría corría sobre la
+# primera columna (un código o un NIT) sin avisar.
+#
+# Aquí cada rol (nit, valor, fecha, tercero, salario, ...) se puntúa por:
+#   - el encabezado: palabras fuertes y débiles, sin tildes ni mayúsculas,
+#   - los datos de una muestra: la fracción de celdas que son montos, fechas,
+#     NIT (6 a 10 dígitos), textos o SI/NO según el rol. Una columna cuyos
+#     datos no corresponden al rol (menos de la mitad) no puede tomarlo.
+# Si ninguna columna alcanza el puntaje mínimo, el rol queda en None y la
+# página pide elegirlo: nunca se adivina la columna 0. Los roles opcionales
+# (período, ARL, DV, ...) solo se asignan si el encabezado los nombra: sin
+# eso quedan en "No Aplica", que es el valor seguro.
+#
+# Los mapeos que el usuario confirma (al ejecutar) se recuerdan por usuario y
+# firma del encabezado (nombres de columna en orden): el siguiente archivo del
+# mismo ERP queda mapeado de inmediato para ese usuario, y una confirmación
+# equivocada de uno no se aplica sola a los archivos de los demás.
+# ==============================================================================
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from ingesta import columnas_archivo, iterar_bloques
+from nit import normalizar_nits
+from tipos import a_fecha, a_numero
+
+ARCHIVO_COLUMNAS = os.environ.get("CONTADOR_COLUMNAS", "columnas.sqlite")
+MUESTRA_FILAS = 500
+MINIMO_PUNTAJE = 2.0
+MINIMO_DATOS = 0.5              # fracción de la muestra que debe corresponder al tipo del rol
+
+# rol: (palabras fuertes, palabras débiles, tipo de dato esperado)
+ROLES = {
+    'nit': (('nit', 'n i t', 'cedula', 'documento', 'identificacion', 'nro identificacion', 'num id'), ('id', 'tercero', 'cc'), 'nit'),
+    'dv': (('dv', 'digito', 'digito verificacion', 'digito de verificacion'), (), 'digito'),
+    # 'saldo' es débil: en un extracto es el saldo corrido, no el movimiento
+    'valor': (('valor', 'monto', 'importe', 'total', 'cuantia'), ('saldo', 'debito', 'credito', 'pago', 'neto'), 'monto'),
+    'fecha': (('fecha', 'date', 'fec'), ('dia', 'periodo', 'corte'), 'fecha'),
+    'descripcion': (('descripcion', 'detalle', 'concepto', 'referencia', 'desc'), ('tercero', 'glosa', 'observacion'), 'texto'),
+    'tercero': (('tercero', 'beneficiario', 'proveedor', 'razon social'), ('nombre', 'cliente'), 'texto'),
+    'metodo_pago': (('metodo', 'forma de pago', 'forma pago', 'medio de pago', 'medio pago'), ('pago', 'medio', 'banco', 'caja'), 'texto'),
+    'concepto': (('concepto', 'detalle', 'descripcion', 'nota'), (), 'texto'),
+    'empleado': (('empleado', 'nombre', 'trabajador', 'funcionario'), ('tercero',), 'texto'),
+    'salario': (('salario', 'sueldo', 'basico'), ('base', 'devengado'), 'monto'),
+    'no_salarial': (('no salarial', 'bonificacion', 'bono'), ('auxilio', 'beneficio'), 'monto'),
+    'auxilio': (('auxilio transporte', 'aux transporte', 'auxilio', 'aux'), ('transporte',), 'si_no'),
+    'exonerado': (('exonerado', 'exonerada', 'exo', 'exoneracion'), ('ley 1607', '114 1'), 'si_no'),
+    'arl': (('arl', 'nivel arl', 'riesgo arl'), ('riesgo', 'nivel'), 'nivel'),
+    # Solo un encabezado que nombra el período: "Fecha Ingreso" es una fecha, no el período liquidado
+    'periodo': (('periodo', 'mes', 'ano', 'anio'), (), 'fecha'),
+}
+
+VALORES_SI_NO = {'si', 's', 'no', 'n', 'x', '1', '0', 'true', 'false', 'verdadero', 'falso'}
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii').lower()
+    return re.sub(r'[^a-z0-9]+', ' ', texto).strip()
+
+
+# ------------------------------------------------------------------------------
+# PUNTAJES
+# ------------------------------------------------------------------------------
+def _contiene(nombre, palabra):
+    """La palabra como token (o frase) del encabezado; las de más de 3 letras también como prefijo."""
+    if re.search(rf'(^| ){re.escape(palabra)}( |$)', nombre):
+        return True
+    return len(palabra) > 3 and re.search(rf'(^| ){re.escape(palabra)}', nombre) is not None
+
+
+def puntaje_encabezado(nombre, rol):
+    """3 si el encabezado es una palabra fuerte, 2 si la contiene, 1 si contiene una débil, 0 si nada."""
+    fuertes, debiles, _ = ROLES[rol]
+    nombre = _normalizar(nombre)
+    if nombre in fuertes:
+        return 3.0
+    if any(_contiene(nombre, p) for p in fuertes):
+        return 2.0
+    if any(_contiene(nombre, p) for p in debiles):
+        return 1.0
+    return 0.0
+
+
+def _fraccion(mascara):
+    return float(np.mean(mascara)) if len(mascara) else 0.0
+
+
+def _es_texto(muestra):
+    return muestra.map(lambda v: isinstance(v, str)).to_numpy() & a_numero(muestra).isna().to_numpy()
+
+
+def afinidad_datos(muestra, tipo):
+    """Fracción (0..1) de las celdas no vacías de la muestra que son del tipo."""
+    muestra = muestra.dropna()
+    if tipo is None:
+        return 1.0
+    if muestra.empty:
+        return 0.0
+    numerica = pd.api.types.is_numeric_dtype(muestra) and not pd.api.types.is_bool_dtype(muestra)
+    if tipo == 'monto':
+        return _fraccion(a_numero(muestra).notna().to_numpy())
+    if tipo == 'fecha':
+        if pd.api.types.is_datetime64_any_dtype(muestra):
+            return 1.0
+        if numerica:
+            # Un serial de Excel es un número como cualquier monto: cuenta a medias
+            return 0.5 * _fraccion(muestra.between(20_000, 80_000).to_numpy())
+        return _fraccion(a_fecha(muestra).notna().to_numpy())
+    if tipo == 'nit':
+        if pd.api.types.is_datetime64_any_dtype(muestra):
+            return 0.0
+        claves = normalizar_nits(muestra)['NIT'].to_numpy()
+        return _fraccion((claves >= 100_000) & (claves < 10_000_000_000))
+    if tipo == 'texto':
+        if numerica or pd.api.types.is_datetime64_any_dtype(muestra):
+            return 0.0
+        return _fraccion(_es_texto(muestra.astype(object)))
+    if tipo == 'si_no':
+        return _fraccion(muestra.astype(str).map(_normalizar).isin(VALORES_SI_NO).to_numpy())
+    if tipo in ('nivel', 'digito'):
+        numeros = a_numero(muestra)
+        minimo, maximo = (1, 5) if tipo == 'nivel' else (0, 9)
+        return _fraccion((numeros.between(minimo, maximo) & (numeros % 1 == 0)).to_numpy())
+    raise ValueError(f"Tipo de dato desconocido: {tipo}")
+
+
+def puntajes_columnas(datos, roles):
+    """DataFrame (roles x columnas) de puntajes; NaN donde los datos no corresponden al rol."""
+    muestra = datos.head(MUESTRA_FILAS)
+    afinidades = {}
+    tabla = {}
+    for n, columna in enumerate(muestra.columns):
+        serie = muestra.iloc[:, n]
+        fila = {}
+        for rol in roles:
+            tipo = ROLES[rol][2]
+            if (n, tipo) not in afinidades:
+                afinidades[(n, tipo)] = afinidad_datos(serie, tipo)
+            datos_rol = afinidades[(n, tipo)]
+            fila[rol] = puntaje_encabezado(columna, rol) + 2.0 * datos_rol if datos_rol >= MINIMO_DATOS else np.nan
+        tabla[n] = fila
+    return pd.DataFrame(tabla, index=list(roles), dtype=float)
+
+
+def _asignar(puntajes, columnas, roles, opcionales=False):
+    """
+    Asignación voraz del mayor puntaje: cada columna sirve a un solo rol. Sin
+    coincidencia en el encabezado, un rol solo se asigna si una única columna
+    tiene datos compatibles (si hay varias, sería adivinar). Con 'opcionales'
+    el encabezado debe contener una palabra fuerte del rol.
+    """
+    encabezados = pd.DataFrame({n: [puntaje_encabezado(c, r) for r in roles] for n, c in enumerate(columnas)},
+                               index=list(roles), dtype=float)
+    candidatos = []
+    for rol in roles:
+        fila = puntajes.loc[rol]
+        compatibles = fila.notna().sum()
+        for n, puntaje in fila.dropna().items():
+            if puntaje < MINIMO_PUNTAJE:
+                continue
+            if encabezados.loc[rol, n] == 0 and compatibles > 1:
+                continue
+            if opcionales and encabezados.loc[rol, n] < 2:
+                continue
+            candidatos.append((puntaje, encabezados.loc[rol, n], -roles.index(rol), -n, rol, n))
+    mapeo, usadas = dict.fromkeys(roles), set()
+    for *_, rol, n in sorted(candidatos, reverse=True):
+        if mapeo[rol] is None and n not in usadas:
+            mapeo[rol] = columnas[n]
+            usadas.add(n)
+    return mapeo
+
+
+# ------------------------------------------------------------------------------
+# MEMORIA DE MAPEOS CONFIRMADOS
+# ------------------------------------------------------------------------------
+def _conexion():
+    conexion = sqlite3.connect(ARCHIVO_COLUMNAS, timeout=30)
+    llave = {c[1] for c in conexion.execute("PRAGMA table_info(mapeos)") if c[5]}
+    if llave and 'usuario' not in llave:
+        # Mapeos de antes de separar por usuario (compartidos por todos): se apartan sin borrarlos
+        with conexion:
+            conexion.execute("ALTER TABLE mapeos RENAME TO mapeos_sin_usuario")
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS mapeos ("
+        "usuario TEXT NOT NULL, firma TEXT NOT NULL, columnas TEXT NOT NULL, mapeo TEXT NOT NULL, "
+        "actualizado REAL NOT NULL, PRIMARY KEY (usuario, firma))"
+    )
+    return conexion
+
+
+def firma_columnas(columnas):
+    """Huella del encabezado (nombres normalizados, en orden): la identidad de un formato de archivo."""
+    nombres = [_normalizar(c) for c in columnas]
+    return hashlib.blake2b(json.dumps(nombres).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def mapeo_recordado(columnas, usuario):
+    """{rol: columna} que el usuario confirmó antes para este encabezado (solo columnas que siguen existiendo)."""
+    if not usuario:
+        return {}
+    conexion = _conexion()
+    try:
+        fila = conexion.execute("SELECT mapeo FROM mapeos WHERE usuario = ? AND firma = ?",
+                                (usuario, firma_columnas(columnas))).fetchone()
+    finally:
+        conexion.close()
+    if not fila:
+        return {}
+    existentes = {str(c): c for c in columnas}
+    return {rol: existentes[col] for rol, col in json.loads(fila[0]).items() if col in existentes}
+
+
+def recordar_columnas(columnas, mapeo, usuario):
+    """Guarda los roles confirmados por el usuario (se suman a los que ya tenía para el formato)."""
+    confirmados = {rol: str(col) for rol, col in mapeo.items() if col is not None}
+    if not confirmados or not usuario:
+        return
+    firma = firma_columnas(columnas)
+    conexion = _conexion()
+    try:
+        with conexion:
+            fila = conexion.execute("SELECT mapeo FROM mapeos WHERE usuario = ? AND firma = ?",
+                                    (usuario, firma)).fetchone()
+            previo = json.loads(fila[0]) if fila else {}
+            conexion.execute(
+                "INSERT OR REPLACE INTO mapeos VALUES (?, ?, ?, ?, ?)",
+                (usuario, firma, json.dumps([str(c) for c in columnas], ensure_ascii=False),
+                 json.dumps({**previo, **confirmados}, ensure_ascii=False), time.time()),
+            )
+    finally:
+        conexion.close()
+
+
+# ------------------------------------------------------------------------------
+# API PÚBLICA
+# ------------------------------------------------------------------------------
+def muestra_archivo(archivo, filas=MUESTRA_FILAS):
+    """Primeras filas del archivo (sin leerlo completo si no está en caché)."""
+    bloque = next(iterar_bloques(archivo, filas_por_bloque=filas), None)
+    return bloque if bloque is not None else pd.DataFrame(columns=columnas_archivo(archivo))
+
+
+def detectar_columnas(datos, roles, usuario=None, opcionales=False):
+    """
+    Columna de cada rol en 'datos' (DataFrame, basta una muestra). Retorna
+    ({rol: columna o None}, recordado): recordado es True si todos los roles
+    salieron de un mapeo confirmado antes por 'usuario' para el mismo
+    encabezado (sin usuario no se consultan los mapeos recordados).
+    'opcionales': roles que pueden no aplicar; solo se asignan si el
+    encabezado los nombra (si no, None = "No Aplica").
+    """
+    roles = list(roles)
+    desconocidos = [r for r in roles if r not in ROLES]
+    if desconocidos:
+        raise ValueError(f"Roles desconocidos: {', '.join(desconocidos)}")
+    columnas = list(datos.columns)
+    recordados = mapeo_recordado(columnas, usuario)
+    pendientes = [r for r in roles if r not in recordados]
+    mapeo = {r: recordados.get(r) for r in roles}
+    if pendientes:
+        sub = datos.loc[:, [c not in recordados.values() for c in columnas]]
+        mapeo.update(_asignar(puntajes_columnas(sub, pendientes), list(sub.columns), pendientes, opcionales))
+    return mapeo, not pendientes
@@ -0,0 +1,92 @@
+# ==============================================================================
+# CRUCE DE EXÓGENA DIAN VS CONTABILIDAD (AGREGACIÓN POR BLOQUES)
+# ==============================================================================
+# El auxiliar por tercero de un gran contribuyente puede tener millones de
+# líneas. En lugar de cargarlo completo y hacer groupby + merge sobre todo, se
+# lee por bloques de filas (ingesta.iterar_bloques) y cada bloque se reduce a
+# sumas por NIT con clave int64 (nit.py). Las reducciones parciales se combinan cada
+# cierto número de bloques, así la memoria crece con los terceros distintos y
+# no con las líneas del auxiliar. El merge final se hace sobre las tablas ya
+# reducidas.
+# ==============================================================================
+
+import pandas as pd
+
+from ingesta import iterar_bloques
+from nit import normalizar_nits
+from tipos import a_numero
+
+FILAS_POR_BLOQUE = 200_000
+BLOQUES_POR_COMBINACION = 8
+UMBRAL_DIFERENCIA = 1000
+
+
+def _reducir(parciales):
+    """Combina reducciones parciales (Valor, DV Errado indexados por clave) en una sola."""
+    if len(parciales) == 1:
+        return parciales[0]
+    return pd.concat(parciales).groupby(level=0, sort=False).agg({'Valor': 'sum', 'DV Errado': 'max'})
+
+
+def _parcial(valores, dv_errado, claves):
+    return pd.DataFrame({'Valor': valores, 'DV Errado': dv_errado}).groupby(claves, sort=False).agg(
+        {'Valor': 'sum', 'DV Errado': 'max'})
+
+
+def sumar_por_nit(archivo, col_nit, col_valor, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Suma de 'col_valor' por NIT leyendo el archivo por bloques. Retorna un
+    DataFrame con 'NIT' (texto), 'Valor' y 'DV Errado' (algún registro del
+    tercero traía un DV que no cumple el Módulo 11), una fila por tercero.
+    """
+    numericos, textos = [], []
+    for bloque in iterar_bloques(archivo, columnas=dict.fromkeys([col_nit, col_valor]), filas_por_bloque=filas_por_bloque):
+        bloque = bloque[bloque[col_nit].notna()]
+        if bloque.empty:
+            continue
+        nits = normalizar_nits(bloque[col_nit])
+        claves = nits['NIT'].to_numpy()
+        dv_errado = nits['DV Valido'].eq(False).fillna(False).to_numpy(dtype=bool)
+        valores = a_numero(bloque[col_valor]).fillna(0).to_numpy(dtype=float)
+
+        con_numero = claves >= 0
+        numericos.append(_parcial(valores[con_numero], dv_errado[con_numero], claves[con_numero]))
+        if not con_numero.all():
+            texto = bloque[col_nit].astype(str).str.strip().to_numpy()
+            textos.append(_parcial(valores[~con_numero], dv_errado[~con_numero], texto[~con_numero]))
+
+        if len(numericos) >= BLOQUES_POR_COMBINACION:
+            numericos = [_reducir(numericos)]
+        if len(textos) >= BLOQUES_POR_COMBINACION:
+            textos = [_reducir(textos)]
+
+    partes = []
+    if numericos:
+        partes.append(_reducir(numericos))
+    if textos:
+        partes.append(_reducir(textos))
+    if not partes:
+        return pd.DataFrame({'NIT': pd.Series(dtype=str), 'Valor': pd.Series(dtype=float),
+                             'DV Errado': pd.Series(dtype=bool)})
+    resultado = pd.concat(partes)
+    resultado.index = resultado.index.astype(str)
+    return resultado.rename_axis('NIT').reset_index()
+
+
+def cruzar_exogena(archivo_dian, archivo_conta, nit_dian, val_dian, nit_conta, val_conta,
+                   umbral=UMBRAL_DIFERENCIA, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Cruce completo: sumas por NIT de cada archivo, merge externo sobre las
+    tablas reducidas y diferencia. Retorna (cruce, diferencias) donde
+    'diferencias' son los terceros con |Diferencia| > umbral, de mayor a menor.
+    """
+    dian = sumar_por_nit(archivo_dian, nit_dian, val_dian, filas_por_bloque).rename(columns={'Valor': 'Valor_DIAN'})
+    conta = sumar_por_nit(archivo_conta, nit_conta, val_conta, filas_por_bloque).rename(columns={'Valor': 'Valor_Conta'})
+
+    cruce = pd.merge(dian, conta, on='NIT', how='outer', suffixes=('_DIAN', '_Conta'))
+    dv_errado = cruce.pop('DV Errado_DIAN').fillna(False).astype(bool) | cruce.pop('DV Errado_Conta').fillna(False).astype(bool)
+    cruce = cruce.fillna(0)
+    cruce['Diferencia'] = cruce['Valor_DIAN'] - cruce['Valor_Conta']
+    cruce['DV Errado'] = dv_errado
+    diferencias = cruce[cruce['Diferencia'].abs() > umbral].sort_values(by="Diferencia", ascending=False)
+    return cruce, diferencias
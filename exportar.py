@@ -0,0 +1,275 @@
+# ==============================================================================
+# EXPORTACIÓN DE REPORTES (EXCEL EN MEMORIA CONSTANTE, CSV, PARQUET)
+# ==============================================================================
+# Las descargas se armaban con pd.ExcelWriter sobre un io.BytesIO y luego
+# buffer.getvalue() copiaba todo otra vez. xlsxwriter en modo normal guarda
+# cada celda como un objeto de Python hasta cerrar el libro, así una hoja de
+# 500k pendientes ocupaba varios GB.
+#
+# Aquí el Excel se escribe con xlsxwriter en modo constant_memory: fila por
+# fila, cada fila se vuelca a disco apenas se escribe (pandas escribe por
+# columnas, por eso no se usa to_excel). El archivo de salida es un temporal
+# que vive en memoria mientras es pequeño y pasa a disco al crecer
+# (SpooledTemporaryFile). Para el botón de descarga se lee una sola vez.
+# CSV y Parquet son alternativas más rápidas y livianas para tablas grandes;
+# con varias hojas salen en un ZIP, un archivo por hoja.
+#
+# descarga_diferida() no escribe nada al mostrar los resultados: entrega una
+# función que Streamlit llama solo cuando el usuario pulsa el botón. El archivo
+# generado queda memorizado por la huella del contenido de las tablas, así los
+# reruns y un segundo clic no vuelven a serializar.
+# ==============================================================================
+
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MIME_ZIP = "application/zip"
+FORMATOS_EXPORTACION = {
+    'xlsx': ('.xlsx', MIME_XLSX),
+    'csv': ('.csv', "text/csv"),
+    'parquet': ('.parquet', "application/vnd.apache.parquet"),
+}
+
+LIMITE_MEMORIA_EXPORTAR_MB = int(os.environ.get("CONTADOR_EXPORTAR_MB", "16"))
+FILAS_POR_BLOQUE = 50_000
+MAX_FILAS_HOJA = 1_048_575          # límite de Excel sin contar el encabezado
+FORMATO_FECHA_EXCEL = "dd/mm/yyyy"
+LIMITE_MEMO_EXPORTAR_MB = int(os.environ.get("CONTADOR_EXPORTAR_MEMO_MB", "256"))
+
+_memo = OrderedDict()
+_bytes_en_memo = 0
+_lock = threading.Lock()
+
+
+def _temporal():
+    return tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_EXPORTAR_MB * 1024 * 1024)
+
+
+def _como_hojas(hojas):
+    """Acepta un DataFrame o un dict {nombre de hoja: DataFrame}."""
+    if isinstance(hojas, pd.DataFrame):
+        return {'Hoja1': hojas}
+    return dict(hojas)
+
+
+# ------------------------------------------------------------------------------
+# EXCEL (XLSXWRITER EN MODO CONSTANT_MEMORY)
+# ------------------------------------------------------------------------------
+def _nombre_hoja(nombre, usados):
+    """Nombre válido para Excel (sin []:*?/\\, máximo 31 caracteres) y sin repetir."""
+    base = re.sub(r'[\[\]:*?/\\]', '_', str(nombre)).strip("'")[:31] or 'Hoja'
+    candidato, n = base, 2
+    while candidato.lower() in usados:
+        sufijo = f" ({n})"
+        candidato, n = base[:31 - len(sufijo)] + sufijo, n + 1
+    usados.add(candidato.lower())
+    return candidato
+
+
+def _columna_excel(serie):
+    """
+    Valores de una columna listos para write_row: nulos a None, fechas a
+    datetime sin zona horaria, números a float/int de Python y el resto a texto.
+    """
+    nulos = serie.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        if getattr(serie.dt, 'tz', None) is not None:
+            serie = serie.dt.tz_localize(None)
+        valores = serie.dt.to_pydatetime()
+    elif pd.api.types.is_bool_dtype(serie):
+        valores = serie.astype(object).to_numpy()
+    elif pd.api.types.is_numeric_dtype(serie):
+        numeros = serie.to_numpy(dtype=float, na_value=np.nan)
+        nulos = nulos | ~np.isfinite(numeros)
+        if pd.api.types.is_integer_dtype(serie):
+            valores = serie.to_numpy(dtype=float, na_value=0).astype(np.int64).astype(object)
+        else:
+            valores = numeros.astype(object)
+    else:
+        valores = serie.to_numpy(dtype=object)
+        no_texto = [i for i, v in enumerate(valores) if not isinstance(v, (str, int, float, bool)) and not nulos[i]]
+        for i in no_texto:
+            valores[i] = str(valores[i])
+    valores = np.array(valores, dtype=object)
+    valores[nulos] = None
+    return valores
+
+
+def _escribir_xlsx(hojas, destino):
+    import xlsxwriter
+
+    libro = xlsxwriter.Workbook(destino, {
+        'constant_memory': True,
+        'default_date_format': FORMATO_FECHA_EXCEL,
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    encabezado = libro.add_format({'bold': True})
+    usados = set()
+    for nombre, df in hojas.items():
+        partes = range(0, max(len(df), 1), MAX_FILAS_HOJA)
+        for inicio in partes:
+            hoja = libro.add_worksheet(_nombre_hoja(nombre, usados))
+            hoja.write_row(0, 0, [str(c) for c in df.columns], encabezado)
+            fila = 1
+            fin_hoja = min(inicio + MAX_FILAS_HOJA, len(df))
+            for desde in range(inicio, fin_hoja, FILAS_POR_BLOQUE):
+                bloque = df.iloc[desde:min(desde + FILAS_POR_BLOQUE, fin_hoja)]
+                columnas = [_columna_excel(bloque.iloc[:, j]) for j in range(bloque.shape[1])]
+                for valores in zip(*columnas):
+                    hoja.write_row(fila, 0, valores)
+                    fila += 1
+    libro.close()
+
+
+# ------------------------------------------------------------------------------
+# CSV Y PARQUET
+# ------------------------------------------------------------------------------
+def _escribir_csv(df, destino):
+    texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+    try:
+        df.to_csv(texto, index=False, chunksize=FILAS_POR_BLOQUE)
+        texto.flush()
+    finally:
+        texto.detach()
+
+
+def _escribir_parquet(df, destino):
+    try:
+        df.to_parquet(destino, index=False)
+    except (TypeError, ValueError):
+        # Columnas de texto con tipos mezclados (números y textos): se guardan como texto
+        mezcladas = {c: df[c].astype('string') for c in df.columns if df[c].dtype == object}
+        destino.seek(0)
+        destino.truncate()
+        df.assign(**mezcladas).to_parquet(destino, index=False)
+
+
+def _escribir_zip(hojas, destino, escribir, extension):
+    """Una entrada por hoja; cada tabla pasa por su propio temporal antes de comprimirse."""
+    usados = set()
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as comprimido:
+        for nombre, df in hojas.items():
+            with _temporal() as parcial:
+                escribir(df, parcial)
+                parcial.seek(0)
+                with comprimido.open(_nombre_hoja(nombre, usados) + extension, 'w', force_zip64=True) as entrada:
+                    shutil.copyfileobj(parcial, entrada, 1024 * 1024)
+
+
+# ------------------------------------------------------------------------------
+# API PÚBLICA
+# ------------------------------------------------------------------------------
+def exportar(hojas, formato='xlsx', nombre='Reporte'):
+    """
+    Escribe una o varias tablas en un temporal. Retorna (archivo, nombre de
+    archivo, mime); el archivo queda al inicio, listo para leer.
+    - xlsx: una hoja por tabla (las de más de 1.048.575 filas siguen en otra hoja),
+    - csv / parquet: un archivo, o un ZIP con uno por hoja si hay varias.
+    """
+    hojas = _como_hojas(hojas)
+    nombre_archivo, mime = nombre_descarga(hojas, formato, nombre)
+    archivo = _temporal()
+    try:
+        if formato == 'xlsx':
+            _escribir_xlsx(hojas, archivo)
+        else:
+            escribir = _escribir_csv if formato == 'csv' else _escribir_parquet
+            if len(hojas) == 1:
+                escribir(next(iter(hojas.values())), archivo)
+            else:
+                _escribir_zip(hojas, archivo, escribir, FORMATOS_EXPORTACION[formato][0])
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo, nombre_archivo, mime
+
+
+def nombre_descarga(hojas, formato='xlsx', nombre='Reporte'):
+    """(nombre de archivo, mime) que tendrá la exportación, sin generarla."""
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato no soportado: {formato}")
+    extension, mime = FORMATOS_EXPORTACION[formato]
+    if formato != 'xlsx' and len(_como_hojas(hojas)) > 1:
+        extension, mime = '.zip', MIME_ZIP
+    return f"{nombre}{extension}", mime
+
+
+def contenido_exportado(archivo):
+    """Bytes del temporal (una sola lectura) y lo cierra; es lo que recibe st.download_button."""
+    try:
+        archivo.seek(0)
+        return archivo.read()
+    finally:
+        archivo.close()
+
+
+def exportar_bytes(hojas, formato='xlsx', nombre='Reporte'):
+    """Atajo: (bytes, nombre de archivo, mime)."""
+    archivo, nombre_archivo, mime = exportar(hojas, formato, nombre)
+    return contenido_exportado(archivo), nombre_archivo, mime
+
+
+# ------------------------------------------------------------------------------
+# GENERACIÓN DIFERIDA Y MEMORIZADA
+# ------------------------------------------------------------------------------
+def huella_hojas(hojas):
+    """Huella del contenido (nombres de hoja, columnas, tipos y valores) de las tablas."""
+    h = hashlib.blake2b(digest_size=20)
+    for nombre, df in _como_hojas(hojas).items():
+        h.update(repr((str(nombre), [str(c) for c in df.columns], [str(t) for t in df.dtypes], df.shape)).encode('utf-8'))
+        try:
+            h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        except TypeError:
+            # Celdas no hasheables (listas, dicts): se identifica por el objeto
+            h.update(str(id(df)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _memorizar(clave, datos):
+    global _bytes_en_memo
+    limite = LIMITE_MEMO_EXPORTAR_MB * 1024 * 1024
+    if len(datos) > limite:
+        return
+    with _lock:
+        if clave in _memo:
+            _bytes_en_memo -= len(_memo.pop(clave))
+        _memo[clave] = datos
+        _bytes_en_memo += len(datos)
+        while _bytes_en_memo > limite and _memo:
+            _, viejo = _memo.popitem(last=False)
+            _bytes_en_memo -= len(viejo)
+
+
+def exportar_memorizado(hojas, formato='xlsx', nombre='Reporte'):
+    """Bytes de la exportación; el mismo contenido en el mismo formato se genera una sola vez."""
+    clave = (huella_hojas(hojas), formato)
+    with _lock:
+        if clave in _memo:
+            _memo.move_to_end(clave)
+            return _memo[clave]
+    datos = exportar_bytes(hojas, formato, nombre)[0]
+    _memorizar(clave, datos)
+    return datos
+
+
+def descarga_diferida(hojas, formato='xlsx', nombre='Reporte'):
+    """
+    Función sin argumentos para el 'data' de st.download_button: la exportación
+    se genera (o sale de la memoria) solo cuando el usuario pide el archivo.
+    """
+    hojas = _como_hojas(hojas)
+    return lambda: exportar_memorizado(hojas, formato, nombre)
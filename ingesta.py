@@ -0,0 +1,300 @@
+# ==============================================================================
+# CAPA DE INGESTA DE ARCHIVOS (EXCEL / CSV) CON CACHÉ
+# ==============================================================================
+# Streamlit re-ejecuta todo el script con cada clic, así que un auxiliar de 50 MB
+# se volvía a leer con openpyxl cada vez que se movía un selectbox.
+# Aquí cada archivo se identifica por el hash de su contenido, se lee una sola vez
+# y el DataFrame queda en una caché LRU limitada por tamaño en memoria.
+# Los módulos pueden pedir solo las columnas que necesitan.
+# Para auxiliares que no caben cómodos en memoria, iterar_bloques() entrega la
+# tabla por bloques de filas.
+# Las rutas .parquet (catálogo de datasets, catalogo.py) se leen mapeadas en
+# memoria y solo con las columnas pedidas, sin pasar por la caché.
+# Al leer, montos, fechas y NIT se tipan una sola vez (tipos.py): la tabla
+# queda en caché ya convertida.
+# ==============================================================================
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from tipos import normalizar_tabla
+
+# Límite de memoria de la caché (MB) y tamaño a partir del cual se usa lectura en streaming
+LIMITE_CACHE_MB = int(os.environ.get("CONTADOR_CACHE_MB", "512"))
+UMBRAL_STREAMING_MB = 8
+
+try:
+    # Motor opcional en Rust, mucho más rápido que openpyxl (pandas >= 2.2)
+    import python_calamine  # noqa: F401
+    MOTOR_RAPIDO = "calamine"
+except ImportError:
+    MOTOR_RAPIDO = None
+
+_cache = OrderedDict()
+_bytes_en_cache = 0
+_lock = threading.Lock()
+_estadisticas = {"aciertos": 0, "fallos": 0, "desalojos": 0}
+
+
+# ------------------------------------------------------------------------------
+# UTILIDADES
+# ------------------------------------------------------------------------------
+def _contenido(archivo):
+    """Bytes del archivo: acepta UploadedFile de Streamlit, rutas, bytes o file-like."""
+    if isinstance(archivo, (bytes, bytearray)):
+        return bytes(archivo)
+    if isinstance(archivo, (str, os.PathLike)):
+        with open(archivo, "rb") as f:
+            return f.read()
+    if hasattr(archivo, "getvalue"):
+        return archivo.getvalue()
+    archivo.seek(0)
+    datos = archivo.read()
+    archivo.seek(0)
+    return datos
+
+
+def _nombre(archivo):
+    if isinstance(archivo, (str, os.PathLike)):
+        return str(archivo)
+    return getattr(archivo, "name", "") or ""
+
+
+def es_parquet(archivo):
+    return isinstance(archivo, (str, os.PathLike)) and str(archivo).lower().endswith(".parquet")
+
+
+def _leer_parquet(ruta, columnas=None):
+    return pd.read_parquet(ruta, columns=list(columnas) if columnas else None, memory_map=True)
+
+
+def _huella(contenido):
+    return hashlib.blake2b(contenido, digest_size=16).hexdigest()
+
+
+def huella_archivo(archivo):
+    """Hash del contenido (BLAKE2b). Dos cargas del mismo archivo comparten huella."""
+    return _huella(_contenido(archivo))
+
+
+def _nombres_columnas(encabezado):
+    """Replica la forma en que pandas nombra columnas vacías y duplicadas."""
+    nombres, vistos = [], {}
+    for i, valor in enumerate(encabezado):
+        nombre = f"Unnamed: {i}" if valor is None else valor
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+        nombres.append(nombre)
+    return nombres
+
+
+# ------------------------------------------------------------------------------
+# LECTORES
+# ------------------------------------------------------------------------------
+def _leer_xlsx_streaming(contenido, hoja, columnas):
+    """
+    Lectura en modo read-only de openpyxl fila por fila, guardando solo las
+    columnas pedidas. No arma la matriz completa de celdas en memoria.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[hoja] if isinstance(hoja, int) else wb[hoja]
+        filas = ws.iter_rows(values_only=True)
+        nombres = _nombres_columnas(next(filas, ()))
+        indices = [nombres.index(c) for c in columnas] if columnas else list(range(len(nombres)))
+        datos = [[] for _ in indices]
+        leidas = ultima_con_datos = 0
+        for fila in filas:
+            for destino, i in zip(datos, indices):
+                destino.append(fila[i] if i < len(fila) else None)
+            leidas += 1
+            if any(v is not None for v in fila):
+                ultima_con_datos = leidas
+    finally:
+        wb.close()
+
+    # Igual que pandas: se descartan las filas vacías del final
+    df = pd.DataFrame({nombres[i]: col[:ultima_con_datos] for i, col in zip(indices, datos)})
+    return df.infer_objects()
+
+
+def _bloques_xlsx(contenido, hoja, columnas, filas_por_bloque):
+    """Como _leer_xlsx_streaming, pero entrega DataFrames de a 'filas_por_bloque' filas."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[hoja] if isinstance(hoja, int) else wb[hoja]
+        filas = ws.iter_rows(values_only=True)
+        nombres = _nombres_columnas(next(filas, ()))
+        indices = [nombres.index(c) for c in columnas] if columnas else list(range(len(nombres)))
+        bloque = []
+        for fila in filas:
+            if not any(v is not None for v in fila):
+                continue
+            bloque.append([fila[i] if i < len(fila) else None for i in indices])
+            if len(bloque) >= filas_por_bloque:
+                yield pd.DataFrame(bloque, columns=[nombres[i] for i in indices]).infer_objects()
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=[nombres[i] for i in indices]).infer_objects()
+    finally:
+        wb.close()
+
+
+def _parsear(contenido, nombre, hoja, columnas):
+    usecols = list(columnas) if columnas else None
+    if nombre.lower().endswith(".csv"):
+        return pd.read_csv(io.BytesIO(contenido), usecols=usecols)
+    if MOTOR_RAPIDO:
+        return pd.read_excel(io.BytesIO(contenido), sheet_name=hoja, usecols=usecols, engine=MOTOR_RAPIDO)
+    if columnas or len(contenido) > UMBRAL_STREAMING_MB * 1024 * 1024:
+        return _leer_xlsx_streaming(contenido, hoja, usecols)
+    return pd.read_excel(io.BytesIO(contenido), sheet_name=hoja)
+
+
+# ------------------------------------------------------------------------------
+# CACHÉ LRU
+# ------------------------------------------------------------------------------
+def _guardar(clave, df):
+    global _bytes_en_cache
+    peso = int(df.memory_usage(deep=True).sum())
+    limite = LIMITE_CACHE_MB * 1024 * 1024
+    if peso > limite:
+        return
+    with _lock:
+        if clave in _cache:
+            _bytes_en_cache -= _cache.pop(clave)[1]
+        _cache[clave] = (df, peso)
+        _bytes_en_cache += peso
+        while _bytes_en_cache > limite and _cache:
+            _, (_, peso_viejo) = _cache.popitem(last=False)
+            _bytes_en_cache -= peso_viejo
+            _estadisticas["desalojos"] += 1
+
+
+def _buscar(clave):
+    with _lock:
+        if clave in _cache:
+            _cache.move_to_end(clave)
+            return _cache[clave][0]
+    return None
+
+
+def leer_tabla(archivo, columnas=None, hoja=0):
+    """
+    Punto único de lectura de Excel/CSV para todos los módulos.
+
+    - Se parsea una sola vez por contenido (hash), no por cada rerun de Streamlit.
+    - 'columnas' limita la lectura a las columnas indicadas (proyección).
+    - Montos, fechas y NIT salen ya tipados (tipos.normalizar_tabla).
+    - Retorna siempre una copia: los módulos pueden agregar columnas sin
+      contaminar la caché.
+    """
+    if es_parquet(archivo):
+        return _leer_parquet(archivo, columnas)
+    contenido = _contenido(archivo)
+    huella = _huella(contenido)
+    columnas = tuple(columnas) if columnas else None
+
+    # Si ya está la tabla completa, proyectamos desde ella
+    completa = _buscar((huella, hoja, None))
+    if completa is not None:
+        with _lock:
+            _estadisticas["aciertos"] += 1
+        return (completa[list(columnas)] if columnas else completa).copy()
+
+    if columnas:
+        parcial = _buscar((huella, hoja, columnas))
+        if parcial is not None:
+            with _lock:
+                _estadisticas["aciertos"] += 1
+            return parcial.copy()
+
+    with _lock:
+        _estadisticas["fallos"] += 1
+    df = normalizar_tabla(_parsear(contenido, _nombre(archivo), hoja, columnas))[0]
+    _guardar((huella, hoja, columnas), df)
+    return df.copy()
+
+
+def leer_excel(archivo, columnas=None, hoja=0):
+    """Alias de leer_tabla para archivos .xlsx."""
+    return leer_tabla(archivo, columnas=columnas, hoja=hoja)
+
+
+def columnas_archivo(archivo, hoja=0):
+    """
+    Solo los nombres de columna (encabezado). Si la tabla no está en caché,
+    lee únicamente la primera fila, sin parsear el resto del archivo.
+    """
+    if es_parquet(archivo):
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(archivo).names)
+    contenido = _contenido(archivo)
+    huella = _huella(contenido)
+    completa = _buscar((huella, hoja, None))
+    if completa is not None:
+        return list(completa.columns)
+
+    if _nombre(archivo).lower().endswith(".csv"):
+        return list(pd.read_csv(io.BytesIO(contenido), nrows=0).columns)
+
+    from openpyxl import load_workbook
+    wb = load_workbook(io.BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[hoja] if isinstance(hoja, int) else wb[hoja]
+        return _nombres_columnas(next(ws.iter_rows(values_only=True), ()))
+    finally:
+        wb.close()
+
+
+def estadisticas_cache():
+    """Aciertos, fallos, desalojos y uso de memoria de la caché de ingesta."""
+    with _lock:
+        return dict(_estadisticas, tablas=len(_cache), megabytes=round(_bytes_en_cache / 1024 / 1024, 2))
+
+
+def limpiar_cache():
+    global _bytes_en_cache
+    with _lock:
+        _cache.clear()
+        _bytes_en_cache = 0
+
+
+def iterar_bloques(archivo, columnas=None, hoja=0, filas_por_bloque=100_000):
+    """
+    Lee la tabla por bloques de filas (DataFrames) sin armarla completa, para
+    agregaciones fuera de memoria. No pasa por la caché; si la tabla completa ya
+    está en caché, los bloques salen de ella. Las filas totalmente vacías se omiten.
+    """
+    columnas = list(columnas) if columnas else None
+    if es_parquet(archivo):
+        import pyarrow.parquet as pq
+        for lote in pq.ParquetFile(archivo, memory_map=True).iter_batches(batch_size=filas_por_bloque, columns=columnas):
+            yield lote.to_pandas()
+        return
+
+    contenido = _contenido(archivo)
+
+    completa = _buscar((_huella(contenido), hoja, None))
+    if completa is not None:
+        tabla = completa[columnas] if columnas else completa
+        for inicio in range(0, len(tabla), filas_por_bloque):
+            yield tabla.iloc[inicio:inicio + filas_por_bloque]
+        return
+
+    if _nombre(archivo).lower().endswith(".csv"):
+        yield from pd.read_csv(io.BytesIO(contenido), usecols=columnas, chunksize=filas_por_bloque)
+    else:
+        yield from _bloques_xlsx(contenido, hoja, columnas, filas_por_bloque)
@@ -0,0 +1,211 @@
+# ==============================================================================
+# PROCESAMIENTO POR LOTES (SIN NAVEGADOR)
+# ==============================================================================
+# Corre los módulos de auditorias.py para muchos clientes desde la línea de
+# comandos, en paralelo sobre un grupo de procesos, y deja un archivo de
+# resultados por trabajo más un resumen del lote. Pensado para el proceso
+# nocturno de cientos de carteras sin abrir la app.
+#
+#   python lote.py manifiesto.json --salida resultados --procesos 8 --formato xlsx
+#
+# El manifiesto es JSON (una lista de trabajos, o {"formato": ..., "trabajos":
+# [...]}) o JSON Lines (un trabajo por línea). Cada trabajo trae 'cliente',
+# 'modulo' (ver auditorias.MODULOS) y los parámetros del módulo; las rutas
+# relativas se resuelven desde la carpeta del manifiesto. Las columnas
+# obligatorias que no se indiquen se detectan por encabezado y datos
+# (auditorias.completar_columnas); si alguna no se identifica, el trabajo falla.
+# Ejemplo:
+#
+#   {"cliente": "ACME SAS", "modulo": "conciliacion",
+#    "archivo_banco": "acme/extracto.xlsx", "archivo_libro": "acme/auxiliar.xlsx",
+#    "col_fecha_b": "Fecha", "col_valor_b": "Valor", "col_fecha_l": "Fecha",
+#    "col_valor_l": "Debito", "col_desc_b": "Descripcion"}
+#
+# Resultados: <salida>/<cliente>/<modulo>.<ext> y <salida>/resumen_lote.csv/.json
+# (estado, segundos, métricas y error de cada trabajo). Si el manifiesto trae
+# varios trabajos del mismo cliente y módulo (dos cuentas bancarias, por
+# ejemplo), cada uno sale como <modulo>_<n>.<ext>, con n su número en el
+# manifiesto: nunca se sobrescriben. El código de salida es 1 si algún
+# trabajo falló.
+# ==============================================================================
+
+import argparse
+import inspect
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from auditorias import MODULOS, completar_columnas
+from exportar import FORMATOS_EXPORTACION, exportar
+
+PROCESOS_LOTE = int(os.environ.get("CONTADOR_LOTE_PROCESOS", str(os.cpu_count() or 1)))
+
+
+# ------------------------------------------------------------------------------
+# MANIFIESTO
+# ------------------------------------------------------------------------------
+def _es_archivo(parametro):
+    return parametro.startswith('archivo') or parametro == 'fuentes'
+
+
+def _resolver(valor, base):
+    if isinstance(valor, list):
+        return [_resolver(v, base) for v in valor]
+    return valor if os.path.isabs(valor) else os.path.normpath(os.path.join(base, valor))
+
+
+def leer_manifiesto(ruta):
+    """
+    Lista de trabajos del manifiesto, con rutas absolutas y el formato de
+    salida de cada uno ('formato' del trabajo, del manifiesto o None).
+    """
+    with open(ruta, encoding='utf-8') as f:
+        if ruta.lower().endswith('.jsonl'):
+            datos = [json.loads(linea) for linea in f if linea.strip()]
+        else:
+            datos = json.load(f)
+    formato = None
+    if isinstance(datos, dict):
+        formato = datos.get('formato')
+        datos = datos.get('trabajos', [])
+
+    base = os.path.dirname(os.path.abspath(ruta))
+    trabajos = []
+    for n, trabajo in enumerate(datos, start=1):
+        if not isinstance(trabajo, dict) or 'modulo' not in trabajo:
+            raise ValueError(f"Trabajo #{n} del manifiesto sin 'modulo'")
+        trabajo = dict(trabajo)
+        trabajo.setdefault('cliente', f"trabajo_{n}")
+        trabajo.setdefault('formato', formato)
+        for clave, valor in trabajo.items():
+            if _es_archivo(clave) and valor:
+                trabajo[clave] = _resolver(valor, base)
+        trabajos.append(trabajo)
+    return trabajos
+
+
+def _carpeta_cliente(cliente):
+    return re.sub(r'[^\w\-. ]', '_', str(cliente)).strip(' .') or 'cliente'
+
+
+# ------------------------------------------------------------------------------
+# UN TRABAJO (SE EJECUTA DENTRO DE UN PROCESO DEL GRUPO)
+# ------------------------------------------------------------------------------
+def ejecutar_trabajo(trabajo, salida, formato='xlsx', sufijo=''):
+    """
+    Corre un trabajo y escribe su archivo de resultados (<modulo><sufijo>.<ext>
+    en la carpeta del cliente). Nunca lanza: retorna un dict con cliente,
+    módulo, estado (OK / ERROR), segundos, archivo, métricas del resumen y error.
+    """
+    inicio = time.perf_counter()
+    parametros = {k: v for k, v in trabajo.items() if k not in ('cliente', 'modulo', 'formato')}
+    cliente, modulo = str(trabajo['cliente']), trabajo['modulo']
+    formato = trabajo.get('formato') or formato
+    registro = {'cliente': cliente, 'modulo': modulo, 'estado': 'OK', 'segundos': 0.0, 'archivo': '', 'error': ''}
+    try:
+        if modulo not in MODULOS:
+            raise ValueError(f"Módulo desconocido: {modulo} (disponibles: {', '.join(MODULOS)})")
+        funcion = MODULOS[modulo]
+        if modulo == 'xml':
+            # El lote ya reparte los clientes entre procesos: un XML por trabajo, en serie
+            parametros.setdefault('procesos', 1)
+        parametros = completar_columnas(modulo, parametros)
+        inspect.signature(funcion).bind(**parametros)
+        resultado = funcion(**parametros)
+
+        carpeta = os.path.join(salida, _carpeta_cliente(cliente))
+        os.makedirs(carpeta, exist_ok=True)
+        archivo, nombre, _ = exportar(resultado['hojas'], formato, f"{modulo}{sufijo}")
+        destino = os.path.join(carpeta, nombre)
+        with archivo, open(destino + '.parcial', 'wb') as f:
+            shutil.copyfileobj(archivo, f, 1024 * 1024)
+        os.replace(destino + '.parcial', destino)
+
+        registro['archivo'] = destino
+        registro.update(resultado['resumen'])
+    except Exception as e:
+        registro['estado'] = 'ERROR'
+        registro['error'] = f"{type(e).__name__}: {e}"
+        registro['detalle'] = traceback.format_exc()
+    registro['segundos'] = round(time.perf_counter() - inicio, 2)
+    return registro
+
+
+# ------------------------------------------------------------------------------
+# LOTE
+# ------------------------------------------------------------------------------
+def _sufijos(trabajos):
+    """
+    '_<n>' (número del trabajo en el manifiesto) para los que comparten carpeta
+    de cliente y módulo con otro; '' para los demás.
+    """
+    claves = [(_carpeta_cliente(t.get('cliente')).lower(), t.get('modulo')) for t in trabajos]
+    cuantas = Counter(claves)
+    return [f"_{n}" if cuantas[c] > 1 else "" for n, c in enumerate(claves, start=1)]
+
+
+def ejecutar_lote(trabajos, salida, procesos=PROCESOS_LOTE, formato='xlsx', avisar=None):
+    """
+    Reparte los trabajos en un grupo de procesos. 'avisar(registro, hechos,
+    total)' se llama cada vez que termina uno. Retorna los registros en el
+    orden del manifiesto y deja resumen_lote.csv / .json en 'salida'.
+    """
+    os.makedirs(salida, exist_ok=True)
+    registros = [None] * len(trabajos)
+    with ProcessPoolExecutor(max_workers=max(1, min(procesos, len(trabajos) or 1))) as pool:
+        sufijos = _sufijos(trabajos)
+        futuros = {pool.submit(ejecutar_trabajo, t, salida, formato, sufijos[i]): i for i, t in enumerate(trabajos)}
+        for hechos, futuro in enumerate(as_completed(futuros), start=1):
+            i = futuros[futuro]
+            try:
+                registro = futuro.result()
+            except Exception as e:
+                # El proceso murió (memoria, señal): el trabajo queda como error y el lote sigue
+                registro = {'cliente': str(trabajos[i].get('cliente')), 'modulo': trabajos[i].get('modulo'),
+                            'estado': 'ERROR', 'segundos': 0.0, 'archivo': '', 'error': f"{type(e).__name__}: {e}"}
+            registros[i] = registro
+            if avisar:
+                avisar(registro, hechos, len(trabajos))
+
+    with open(os.path.join(salida, 'resumen_lote.json'), 'w', encoding='utf-8') as f:
+        json.dump(registros, f, ensure_ascii=False, indent=2, default=str)
+    pd.DataFrame(registros).drop(columns=['detalle'], errors='ignore').to_csv(
+        os.path.join(salida, 'resumen_lote.csv'), index=False, encoding='utf-8-sig')
+    return registros
+
+
+def _avisar_consola(registro, hechos, total):
+    estado = "OK" if registro['estado'] == 'OK' else f"ERROR: {registro['error']}"
+    print(f"[{hechos}/{total}] {registro['cliente']} · {registro['modulo']} · {estado} ({registro['segundos']} s)",
+          file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa por lotes los módulos de auditoría para muchos clientes.")
+    parser.add_argument('manifiesto', help="Archivo .json o .jsonl con los trabajos")
+    parser.add_argument('--salida', default='resultados_lote', help="Carpeta de resultados")
+    parser.add_argument('--procesos', type=int, default=PROCESOS_LOTE, help="Procesos en paralelo")
+    parser.add_argument('--formato', choices=list(FORMATOS_EXPORTACION), default='xlsx',
+                        help="Formato de los resultados (si el trabajo no trae el suyo)")
+    args = parser.parse_args(argv)
+
+    trabajos = leer_manifiesto(args.manifiesto)
+    inicio = time.perf_counter()
+    registros = ejecutar_lote(trabajos, args.salida, procesos=args.procesos, formato=args.formato,
+                              avisar=_avisar_consola)
+    fallidos = sum(r['estado'] != 'OK' for r in registros)
+    print(f"{len(registros) - fallidos} trabajos OK, {fallidos} con error en {time.perf_counter() - inicio:.1f} s. "
+          f"Resumen: {os.path.join(args.salida, 'resumen_lote.csv')}", file=sys.stderr)
+    return 1 if fallidos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# ==============================================================================
+# NORMALIZACIÓN DE NIT Y DÍGITO DE VERIFICACIÓN (VECTORIZADO)
+# ==============================================================================
+# Los NIT llegan de mil formas: "900123456-7", "900123456 7", "900.123.456", 900123456.0
+# (celda numérica de Excel), " 900 123 456 ". Comparados como texto no cruzan y
+# inflan las diferencias del cruce DIAN.
+#
+# Aquí se llevan todos a una clave int64 (solo el número, sin DV) y se valida
+# el DV informado con el Módulo 11 de la DIAN, calculado para columnas
+# completas: los dígitos se sacan con divisiones enteras sobre todo el arreglo
+# (15 pasadas, una por peso), sin recorrer fila por fila.
+# El texto se separa en número y DV sobre la matriz de caracteres de la columna
+# (sin regex por fila), así un maestro de 300k terceros se valida en < 1 s.
+# Lo usan el cruce de exógena, la minería de XML y la conciliación bancaria.
+# ==============================================================================
+
+import numpy as np
+import pandas as pd
+
+# Pesos del Módulo 11 (del dígito menos significativo al más significativo)
+PESOS_DV = np.array([3, 7, 13, 17, 19, 23, 29, 37, 41, 43, 47, 53, 59, 67, 71], dtype=np.int64)
+MAX_DIGITOS_NIT = len(PESOS_DV)
+SIN_NIT = -1
+
+ESTADO_OK = "✅ OK"
+ESTADO_DV_ERRADO = "❌ DV NO COINCIDE"
+ESTADO_SIN_DV = "⚠️ SIN DV"
+ESTADO_INVALIDO = "⛔ NIT INVÁLIDO"
+
+
+def calcular_dv(nits):
+    """
+    DV (0..9) para un arreglo de NIT int64 (sin DV). Las claves inválidas (< 0)
+    retornan -1. Solo cuentan los 15 dígitos menos significativos, como en la DIAN.
+    """
+    nits = np.asarray(nits, dtype=np.int64)
+    validos = nits >= 0
+    restante = np.where(validos, nits, 0)
+    suma = np.zeros(nits.shape, dtype=np.int64)
+    for peso in PESOS_DV:
+        suma += (restante % 10) * peso
+        restante //= 10
+    resto = suma % 11
+    dv = np.where(resto <= 1, resto, 11 - resto)
+    return np.where(validos, dv, -1).astype(np.int8)
+
+
+_POTENCIAS_10 = 10 ** np.arange(MAX_DIGITOS_NIT + 4, dtype=np.int64)
+_CERO, _NUEVE, _GUION, _PUNTO, _ESPACIO = (ord(c) for c in '09-. ')
+
+
+def _separar_bloque(textos):
+    """
+    Número y DV de un bloque de textos (ya sin espacios a los lados), sobre la
+    matriz de caracteres (filas = textos, columnas = posiciones) en lugar de
+    regex por fila. Reglas:
+    - un '.0' final (celda numérica guardada como texto) se ignora,
+    - si después del primer guion solo hay un dígito (y espacios), ese es el DV
+      y el número son los dígitos antes del guion,
+    - sin guion, un único dígito después del último espacio ('900123456 8')
+      también es el DV,
+    - si no, el número son todos los dígitos del texto y no hay DV,
+    - sin dígitos o con más de 18 el NIT es inválido (-1).
+    """
+    matriz = np.array(textos, dtype=str)
+    n = len(matriz)
+    ancho = matriz.dtype.itemsize // 4
+    if ancho == 0:
+        return np.full(n, SIN_NIT, dtype=np.int64), np.full(n, -1, dtype=np.int8)
+    c = matriz.view(np.uint32).reshape(n, ancho)
+    columnas = np.arange(ancho)
+    filas = np.arange(n)
+    largo = (c != 0).sum(axis=1)
+
+    # '.0+' al final
+    no_cero = (c != 0) & (c != _CERO)
+    ultimo = ancho - 1 - np.argmax(no_cero[:, ::-1], axis=1)
+    punto_final = no_cero.any(axis=1) & (c[filas, ultimo] == _PUNTO) & (ultimo < largo - 1)
+    fin = np.where(punto_final, ultimo, largo)
+    dentro = columnas < fin[:, None]
+
+    es_digito = (c >= _CERO) & (c <= _NUEVE) & dentro
+    es_guion = (c == _GUION) & dentro
+    tiene_guion = es_guion.any(axis=1)
+    es_espacio = (c == _ESPACIO) & dentro
+    tiene_espacio = es_espacio.any(axis=1)
+    ultimo_espacio = ancho - 1 - np.argmax(es_espacio[:, ::-1], axis=1)
+    # Separador del DV: el primer guion o, sin guion, el último espacio
+    separador = np.where(tiene_guion, np.argmax(es_guion, axis=1), np.where(tiene_espacio, ultimo_espacio, fin))
+
+    despues = (columnas > separador[:, None]) & dentro
+    digitos_despues = es_digito & despues
+    otros_despues = (despues & ~es_digito & ~es_espacio).any(axis=1)
+    con_dv = (tiene_guion | tiene_espacio) & (digitos_despues.sum(axis=1) == 1) & ~otros_despues
+
+    usados = es_digito & (~con_dv[:, None] | (columnas < separador[:, None]))
+    cuantos = usados.sum(axis=1)
+    posicion = np.cumsum(usados[:, ::-1], axis=1)[:, ::-1] - 1
+    digito = c.astype(np.int64) - _CERO
+    valor = np.where(usados, digito * _POTENCIAS_10[np.clip(posicion, 0, len(_POTENCIAS_10) - 1)], 0).sum(axis=1)
+    clave = np.where((cuantos >= 1) & (cuantos <= MAX_DIGITOS_NIT + 3), valor, SIN_NIT)
+
+    dv = np.where(con_dv, digito[filas, np.argmax(digitos_despues, axis=1)], -1).astype(np.int8)
+    return clave.astype(np.int64), dv
+
+
+def _separar_texto(textos, filas_por_bloque=50_000):
+    """_separar_bloque por bloques para acotar el tamaño de la matriz de caracteres."""
+    textos = list(textos)
+    claves = np.full(len(textos), SIN_NIT, dtype=np.int64)
+    dvs = np.full(len(textos), -1, dtype=np.int8)
+    for inicio in range(0, len(textos), filas_por_bloque):
+        fin = inicio + filas_por_bloque
+        claves[inicio:fin], dvs[inicio:fin] = _separar_bloque(textos[inicio:fin])
+    return claves, dvs
+
+
+def clave_nit(valores):
+    """
+    NIT canónico como int64 (sin separadores ni DV); -1 si no hay un número
+    (vacíos, 'CONSUMIDOR FINAL', ...). Acepta Series, listas o arreglos.
+    """
+    return normalizar_nits(valores)['NIT'].to_numpy()
+
+
+def normalizar_nits(valores):
+    """
+    Normaliza una columna de NIT. Retorna un DataFrame (mismo índice si es Series):
+    - NIT: clave int64 (-1 si no es un número),
+    - DV Informado: DV que venía después del guion o del espacio final (-1 si no venía),
+    - DV Calculado: Módulo 11,
+    - DV Valido: True si coincide, False si no, NA si no venía DV o no hay NIT.
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        numeros = serie.to_numpy(dtype=float)
+        validos = np.isfinite(numeros) & (numeros >= 0)
+        clave = np.where(validos, numeros, SIN_NIT).astype(np.int64)
+        dv_informado = np.full(len(serie), -1, dtype=np.int8)
+    else:
+        # Un auxiliar repite el mismo tercero miles de veces: se procesan los distintos
+        codigos, unicos = pd.factorize(serie.astype(str).where(serie.notna(), ""))
+        clave_u, dv_u = _separar_texto(pd.Series(unicos, dtype=object).str.strip())
+        clave, dv_informado = clave_u[codigos], dv_u[codigos]
+
+    dv_calculado = calcular_dv(clave)
+    comparable = (clave >= 0) & (dv_informado >= 0)
+    dv_valido = pd.array(np.where(comparable, dv_informado == dv_calculado, False), dtype="boolean")
+    dv_valido[~comparable] = pd.NA
+    return pd.DataFrame({
+        'NIT': clave,
+        'DV Informado': dv_informado,
+        'DV Calculado': dv_calculado,
+        'DV Valido': dv_valido,
+    }, index=serie.index)
+
+
+def nit_texto(valores):
+    """
+    NIT canónico como texto ('900123456'); conserva el texto original si no es
+    un número y deja vacías las celdas vacías.
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+    clave = clave_nit(serie)
+    texto = pd.Series(np.where(clave >= 0, clave.astype(str), serie.astype(str).str.strip().to_numpy()),
+                      index=serie.index, dtype=object)
+    return texto.where(serie.notna())
+
+
+def validar_nits(nits, dvs=None):
+    """
+    Validación masiva de un maestro de terceros. 'dvs' es la columna de DV del
+    archivo (opcional); sin ella se usa el DV escrito después del guion.
+    Retorna un DataFrame (mismo índice que 'nits') con NIT, DV Informado,
+    DV Calculado y Estado.
+    """
+    resultado = normalizar_nits(nits)
+    if dvs is not None:
+        dv = pd.to_numeric(pd.Series(dvs).reset_index(drop=True), errors='coerce').to_numpy(dtype=float)
+        dv_valido = np.isfinite(dv) & (dv >= 0) & (dv <= 9) & (dv == np.trunc(dv))
+        resultado['DV Informado'] = np.where(dv_valido, dv, -1).astype(np.int8)
+
+    clave = resultado['NIT'].to_numpy()
+    informado = resultado['DV Informado'].to_numpy()
+    estado = np.select(
+        [clave < 0, informado < 0, informado == resultado['DV Calculado'].to_numpy()],
+        [ESTADO_INVALIDO, ESTADO_SIN_DV, ESTADO_OK],
+        default=ESTADO_DV_ERRADO,
+    )
+    resultado['Estado'] = pd.Categorical(estado, categories=[ESTADO_OK, ESTADO_DV_ERRADO, ESTADO_SIN_DV, ESTADO_INVALIDO])
+    return resultado.drop(columns=['DV Valido'])
@@ -0,0 +1,87 @@
+# ==============================================================================
+# MOTOR DE COSTEO DE NÓMINA (VECTORIZADO)
+# ==============================================================================
+# Calcula el costo real de cada empleado para la empresa por columnas completas:
+# seguridad social (salud, pensión, ARL), parafiscales y prestaciones sociales.
+# Las tarifas salen de parametros_fiscales (por año, o por fila si se indica la
+# fecha del periodo), la ARL con una tabla indexada por [año, nivel], y los
+# campos SI/NO se interpretan una sola vez para toda la columna.
+# ==============================================================================
+
+import numpy as np
+import pandas as pd
+
+from parametros_fiscales import ANIO_VIGENTE, parametros_anio, parametros_por_fecha, tarifa_arl
+from tipos import a_numero
+
+VALORES_SI = ['si', 's', 'true', '1', 'yes']
+
+# Tarifas de salud, pensión, caja, SENA/ICBF, prestaciones y ARL: ver parametros_fiscales.py
+
+COLUMNAS_COSTEO = ['Salario', 'Aux Transporte', 'IBC', 'Salud', 'Pension', 'ARL', 'Total Seguridad Social',
+                   'Parafiscales', 'Prestaciones', 'Costo Total', 'Salario Invalido', 'Anio Sin Parametros']
+
+
+def _es_si(serie):
+    return serie.astype(str).str.strip().str.lower().isin(VALORES_SI).to_numpy()
+
+
+def _nivel_arl(serie):
+    """Nivel ARL 1..5; vacíos o fuera de rango -> 0 (tarifa Nivel 1)."""
+    nivel = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float)
+    nivel = np.where(np.isfinite(nivel), np.trunc(nivel), 0).astype(np.int64)
+    return np.where((nivel >= 1) & (nivel <= 5), nivel, 0)
+
+
+def costear_nomina(df, col_salario, col_aux, col_arl, col_exo, col_fecha=None, anio=ANIO_VIGENTE):
+    """
+    Desglose de costo empresa por empleado. Retorna un DataFrame (mismo índice
+    que df) con columnas numéricas float64 y 'Salario Invalido' (bool) para las
+    filas cuyo salario no se pudo leer como número (se costean con salario 0).
+    Con 'col_fecha' (periodo de la nómina) el auxilio y las tarifas se toman del
+    año de cada fila; sin ella, o si la fecha está vacía, se usa 'anio'. Las
+    filas de un año sin parámetros quedan en NaN y con 'Anio Sin Parametros'.
+    """
+    p = parametros_por_fecha(df[col_fecha], anio) if col_fecha else parametros_anio(anio)
+
+    bruto = df[col_salario]
+    salario = a_numero(bruto)
+    invalido = (salario.isna() & bruto.notna()).to_numpy()
+    salario = salario.fillna(0).to_numpy(dtype=float)
+
+    tiene_aux = _es_si(df[col_aux])
+    exonerado = _es_si(df[col_exo])
+    nivel = _nivel_arl(df[col_arl]) if col_arl else np.zeros(len(df), dtype=np.int64)
+
+    aux = np.where(tiene_aux, p['aux_transporte'], 0.0)
+    ibc = salario
+    base_prest = salario + aux
+
+    # 1. SEGURIDAD SOCIAL (Empleador)
+    salud = np.where(exonerado, 0.0, ibc * p['tasa_salud'])
+    pension = ibc * p['tasa_pension']
+    arl = ibc * tarifa_arl(p, nivel)
+    seg_social = salud + pension + arl
+
+    # 2. PARAFISCALES (Caja siempre; SENA + ICBF si no es exonerado)
+    paraf = ibc * p['tasa_caja'] + np.where(exonerado, 0.0, ibc * p['tasa_sena_icbf'])
+
+    # 3. PRESTACIONES SOCIALES
+    prestaciones = base_prest * p['factor_prestaciones']
+
+    costo_total = base_prest + seg_social + paraf + prestaciones
+
+    return pd.DataFrame({
+        'Salario': salario,
+        'Aux Transporte': aux,
+        'IBC': ibc,
+        'Salud': salud,
+        'Pension': pension,
+        'ARL': arl,
+        'Total Seguridad Social': seg_social,
+        'Parafiscales': paraf,
+        'Prestaciones': prestaciones,
+        'Costo Total': costo_total,
+        'Salario Invalido': invalido,
+        'Anio Sin Parametros': np.broadcast_to(p['fuera_de_tabla'], len(df)),
+    }, index=df.index)
@@ -0,0 +1,292 @@
+# ==============================================================================
+# PLANIFICADOR DE OCR CON GEMINI (CONCURRENTE Y CON LÍMITE DE CUOTA)
+# ==============================================================================
+# Antes cada imagen se procesaba en serie y creaba su propio GenerativeModel:
+# 500 facturas tomaban casi una hora, casi todo esperando la red.
+#
+# Ahora un grupo acotado de hilos envía las imágenes en paralelo con un solo
+# cliente de modelo reutilizado. Un limitador de ventana deslizante respeta las
+# solicitudes por minuto (RPM) y los tokens por minuto (TPM); los errores
+# transitorios se reintentan con espera exponencial y jitter. procesar_ocr() es
+# un generador: cada resultado se entrega apenas termina, para ir llenando la
+# tabla en pantalla.
+#
+# Antes del envío cada imagen se normaliza (rotación EXIF, escala de grises,
+# recorte al documento, reducción a LADO_MAXIMO_OCR y JPEG compacto): una foto
+# de celular de 4-12 MP pasa de varios MB a ~100-200 KB.
+#
+# Las respuestas exitosas quedan en la caché de IA (cache_ia.py) por hash de
+# (modelo, prompt, contenido de la imagen): una factura repetida no vuelve a
+# pasar por el modelo ni consume cuota.
+#
+# El modelo se puede inyectar (cualquier objeto con generate_content() que
+# retorne algo con .text), así se prueba contra un stub local sin red ni cuota.
+# ==============================================================================
+
+import io
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from cache_ia import clave_ia, guardar_cache_ia, leer_cache_ia
+from ingesta import huella_archivo
+
+try:
+    from google.api_core.exceptions import (DeadlineExceeded, InternalServerError, ResourceExhausted,
+                                            ServiceUnavailable, TooManyRequests)
+    _ERRORES_API = (ResourceExhausted, TooManyRequests, ServiceUnavailable, DeadlineExceeded, InternalServerError)
+except ImportError:     # sin el SDK de Google solo se reconocen las fallas de red
+    _ERRORES_API = ()
+
+# Cuota agotada (429), servicio caído (503), plazo vencido (504), error interno (500) y red
+ERRORES_REINTENTABLES = _ERRORES_API + (ConnectionError, TimeoutError)
+
+MODELO_OCR = 'gemini-1.5-flash'
+PROMPT_OCR = """Extrae datos JSON estricto: {"fecha": "YYYY-MM-DD", "nit": "num", "proveedor": "txt", "concepto": "txt", "base": num, "iva": num, "total": num}"""
+
+HILOS_OCR = int(os.environ.get("CONTADOR_OCR_HILOS", "4"))
+RPM_OCR = int(os.environ.get("CONTADOR_OCR_RPM", "60"))          # 0: sin límite
+TPM_OCR = int(os.environ.get("CONTADOR_OCR_TPM", "1000000"))     # 0: sin límite
+TOKENS_ESTIMADOS = 600      # prompt + imagen + respuesta, hasta conocer el uso real
+REINTENTOS = 4
+ESPERA_BASE_SEGUNDOS = 2.0
+VENTANA_SEGUNDOS = 60.0
+
+LADO_MAXIMO_OCR = int(os.environ.get("CONTADOR_OCR_LADO_MAX", "1600"))   # px del lado mayor
+CALIDAD_OCR = 80
+FORMATO_OCR = os.environ.get("CONTADOR_OCR_FORMATO", "JPEG")            # JPEG o WEBP
+
+_modelos = {}
+_lock_modelos = threading.Lock()
+
+
+def obtener_modelo(nombre=MODELO_OCR):
+    """Un solo cliente por nombre de modelo para todo el proceso (genai ya configurado)."""
+    with _lock_modelos:
+        if nombre not in _modelos:
+            import google.generativeai as genai
+            _modelos[nombre] = genai.GenerativeModel(nombre)
+        return _modelos[nombre]
+
+
+# ------------------------------------------------------------------------------
+# LIMITADOR DE CUOTA (RPM + TPM EN VENTANA DESLIZANTE)
+# ------------------------------------------------------------------------------
+class LimitadorCuota:
+    """
+    Reserva cupo antes de cada llamada (una solicitud y unos tokens estimados)
+    y bloquea si la ventana del último minuto ya está llena. Al conocer el
+    consumo real, ajustar() corrige la reserva. Un rpm o tpm en 0 (o negativo)
+    desactiva ese límite.
+    """
+
+    def __init__(self, rpm=RPM_OCR, tpm=TPM_OCR, ventana=VENTANA_SEGUNDOS, reloj=time.monotonic, dormir=time.sleep):
+        self.rpm = rpm if rpm > 0 else float('inf')
+        self.tpm = tpm if tpm > 0 else float('inf')
+        self.ventana = ventana
+        self._reloj = reloj
+        self._dormir = dormir
+        self._registros = deque()   # [instante, tokens]
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora):
+        while self._registros and ahora - self._registros[0][0] >= self.ventana:
+            self._tokens -= self._registros.popleft()[1]
+
+    def reservar(self, tokens=TOKENS_ESTIMADOS):
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                ahora = self._reloj()
+                self._purgar(ahora)
+                if len(self._registros) < self.rpm and self._tokens + tokens <= self.tpm:
+                    registro = [ahora, tokens]
+                    self._registros.append(registro)
+                    self._tokens += tokens
+                    return registro
+                espera = self.ventana - (ahora - self._registros[0][0])
+            self._dormir(max(espera, 0.01))
+
+    def ajustar(self, registro, tokens_reales):
+        with self._lock:
+            if any(r is registro for r in self._registros):
+                self._tokens += tokens_reales - registro[1]
+            registro[1] = tokens_reales
+
+
+# ------------------------------------------------------------------------------
+# PREPROCESAMIENTO DE IMAGEN
+# ------------------------------------------------------------------------------
+def _abrir_imagen(fuente):
+    """Acepta una imagen PIL o un archivo (subido / ruta); se abre dentro del hilo."""
+    if hasattr(fuente, 'mode') and hasattr(fuente, 'size'):
+        return fuente
+    from PIL import Image
+    return Image.open(fuente)
+
+
+def _caja_documento(gris, muestra=256):
+    """
+    Caja (izq, arriba, der, abajo) de la hoja dentro de la foto: la región clara
+    sobre un fondo más oscuro (mesa, escritorio). Se calcula sobre una miniatura.
+    Retorna None si no hay un contraste claro o el recorte no ahorra nada.
+    """
+    ancho, alto = gris.size
+    escala = muestra / max(ancho, alto)
+    if escala >= 1:
+        escala = 1.0
+    mini = np.asarray(gris.resize((max(1, int(ancho * escala)), max(1, int(alto * escala)))), dtype=np.float32)
+
+    umbral = (mini.mean() + mini.max()) / 2
+    claro = mini >= umbral
+    filas = np.flatnonzero(claro.mean(axis=1) > 0.3)
+    columnas = np.flatnonzero(claro.mean(axis=0) > 0.3)
+    if len(filas) < 2 or len(columnas) < 2:
+        return None
+
+    arriba, abajo = filas[0], filas[-1] + 1
+    izq, der = columnas[0], columnas[-1] + 1
+    area = (abajo - arriba) * (der - izq) / claro.size
+    if area < 0.2 or area > 0.9:
+        return None
+    margen = 0.02 * max(mini.shape)
+    return (max(0, int((izq - margen) / escala)), max(0, int((arriba - margen) / escala)),
+            min(ancho, int((der + margen) / escala)), min(alto, int((abajo + margen) / escala)))
+
+
+def preparar_imagen(fuente, lado_maximo=LADO_MAXIMO_OCR, formato=FORMATO_OCR, calidad=CALIDAD_OCR):
+    """
+    Normaliza una factura para el modelo: rotación EXIF, escala de grises,
+    recorte al documento, reducción del lado mayor a 'lado_maximo' y
+    codificación compacta. Retorna el blob {'mime_type', 'data'} que acepta
+    generate_content().
+    """
+    from PIL import Image, ImageOps
+
+    imagen = ImageOps.exif_transpose(_abrir_imagen(fuente))
+    gris = imagen.convert('L')
+    caja = _caja_documento(gris)
+    if caja:
+        gris = gris.crop(caja)
+    if max(gris.size) > lado_maximo:
+        gris.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+
+    salida = io.BytesIO()
+    formato = formato.upper()
+    if formato == 'WEBP':
+        gris.save(salida, format='WEBP', quality=calidad, method=4)
+    else:
+        formato = 'JPEG'
+        gris.save(salida, format='JPEG', quality=calidad, optimize=True)
+    return {'mime_type': f"image/{formato.lower()}", 'data': salida.getvalue()}
+
+
+# ------------------------------------------------------------------------------
+# UNA IMAGEN
+# ------------------------------------------------------------------------------
+def _huella_imagen(fuente):
+    """Hash del contenido original (antes de preprocesar: en un acierto no se procesa)."""
+    if hasattr(fuente, 'mode') and hasattr(fuente, 'size'):
+        return clave_ia(fuente.mode, list(fuente.size), fuente.tobytes())
+    return huella_archivo(fuente)
+
+
+def _leer_json(texto):
+    return json.loads(texto.replace("```json", "").replace("```", "").strip())
+
+
+def _tokens_usados(respuesta):
+    uso = getattr(respuesta, 'usage_metadata', None)
+    return getattr(uso, 'total_token_count', None) or None
+
+
+def _es_reintentable(error):
+    """
+    Cuota agotada, servicio no disponible o fallas de red: vale la pena
+    reintentar. Se decide por el tipo de excepción, no por el mensaje (una
+    clave inválida que menciona "rate" o "500" no se reintenta).
+    """
+    return isinstance(error, ERRORES_REINTENTABLES)
+
+
+def ocr_factura(imagen, modelo=None, limitador=None, reintentos=REINTENTOS, dormir=time.sleep, preprocesar=True,
+                usar_cache=True):
+    """
+    Extrae los datos de una factura. Retorna (dict, None) si la respuesta es un
+    JSON válido o (None, mensaje) si falló después de los reintentos.
+    """
+    modelo = modelo or obtener_modelo()
+    clave = None
+    if usar_cache:
+        try:
+            ajustes = [LADO_MAXIMO_OCR, FORMATO_OCR, CALIDAD_OCR] if preprocesar else None
+            clave = clave_ia(getattr(modelo, 'model_name', MODELO_OCR), PROMPT_OCR, _huella_imagen(imagen), ajustes)
+        except Exception:
+            clave = None
+        previo = leer_cache_ia(clave) if clave else None
+        if previo is not None:
+            return previo, None
+
+    try:
+        contenido = [PROMPT_OCR, preparar_imagen(imagen) if preprocesar else _abrir_imagen(imagen)]
+    except Exception as e:
+        return None, f"Imagen ilegible: {e}"
+
+    for intento in range(reintentos + 1):
+        registro = limitador.reservar() if limitador else None
+        try:
+            respuesta = modelo.generate_content(contenido)
+        except Exception as e:
+            if intento < reintentos and _es_reintentable(e):
+                dormir(ESPERA_BASE_SEGUNDOS * (2 ** intento) + random.uniform(0, ESPERA_BASE_SEGUNDOS))
+                continue
+            return None, f"Error IA: {e}"
+        if registro and _tokens_usados(respuesta):
+            limitador.ajustar(registro, _tokens_usados(respuesta))
+        try:
+            datos = _leer_json(respuesta.text)
+        except (ValueError, AttributeError) as e:
+            return None, f"Respuesta no es JSON: {e}"
+        if clave:
+            guardar_cache_ia(clave, datos)
+        return datos, None
+
+
+# ------------------------------------------------------------------------------
+# LOTES (GENERADOR: RESULTADOS A MEDIDA QUE TERMINAN)
+# ------------------------------------------------------------------------------
+def procesar_ocr(imagenes, modelo=None, hilos=HILOS_OCR, rpm=RPM_OCR, tpm=TPM_OCR, reintentos=REINTENTOS,
+                 usar_cache=True):
+    """
+    Procesa imágenes en paralelo. Genera (indice, datos, error) en orden de
+    llegada; 'indice' es la posición en 'imagenes' para reordenar al final.
+    Solo hay 2 x hilos imágenes en vuelo a la vez (memoria acotada).
+    """
+    modelo = modelo or obtener_modelo()
+    limitador = LimitadorCuota(rpm=rpm, tpm=tpm)
+    fuentes = iter(enumerate(imagenes))
+    en_vuelo = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, hilos)) as pool:
+        def lanzar():
+            for indice, imagen in fuentes:
+                en_vuelo[pool.submit(ocr_factura, imagen, modelo, limitador, reintentos,
+                                     usar_cache=usar_cache)] = indice
+                if len(en_vuelo) >= 2 * max(1, hilos):
+                    return
+
+        lanzar()
+        while en_vuelo:
+            listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                indice = en_vuelo.pop(futuro)
+                datos, error = futuro.result()
+                yield indice, datos, error
+            lanzar()
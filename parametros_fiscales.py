@@ -0,0 +1,127 @@
+# ==============================================================================
+# PARÁMETROS FISCALES Y LABORALES POR AÑO (COLOMBIA)
+# ==============================================================================
+# Tabla versionada por año gravable: UVT, SMMLV, auxilio de transporte, tarifas
+# de seguridad social, parafiscales y ARL. Los umbrales derivados (tope de
+# efectivo, bases de retención) se precalculan una sola vez al importar.
+#
+# Para auxiliares de varios años, parametros_por_fecha() entrega arreglos
+# alineados fila a fila (búsqueda vectorizada por el año de la fecha), así un
+# archivo de 5 años se evalúa en una sola pasada.
+#
+# Un año que no está en la tabla nunca toma los valores del más cercano (el
+# auxilio de transporte de 2020 no sirve para 2026): parametros_anio() lanza
+# ValueError y parametros_por_fecha() deja esas filas en NaN y las marca en
+# 'fuera_de_tabla' para que cada módulo las reporte.
+# ==============================================================================
+
+import numpy as np
+import pandas as pd
+
+from tipos import a_fecha
+
+# Valores que cambian cada año
+PARAMETROS_POR_ANIO = {
+    2020: {'uvt': 35607, 'smmlv': 877803, 'aux_transporte': 102854},
+    2021: {'uvt': 36308, 'smmlv': 908526, 'aux_transporte': 106454},
+    2022: {'uvt': 38004, 'smmlv': 1000000, 'aux_transporte': 117172},
+    2023: {'uvt': 42412, 'smmlv': 1160000, 'aux_transporte': 140606},
+    2024: {'uvt': 47065, 'smmlv': 1300000, 'aux_transporte': 162000},
+    2025: {'uvt': 49799, 'smmlv': 1430000, 'aux_transporte': 175000},
+}
+
+# Tarifas vigentes en todo el rango de la tabla (se pueden sobrescribir por año
+# agregando la misma clave en PARAMETROS_POR_ANIO)
+TARIFAS_COMUNES = {
+    'tasa_salud': 0.085,            # Empleador (exonerados Art. 114-1 ET pagan 0)
+    'tasa_pension': 0.12,
+    'tasa_caja': 0.04,
+    'tasa_sena_icbf': 0.05,         # Solo no exonerados
+    'factor_prestaciones': 0.2183,  # Prima, Cesantías, Intereses y Vacaciones
+    'limite_no_salarial': 0.40,     # Art. 30 Ley 1393 de 2010
+}
+
+# ARL por nivel de riesgo I..V (Decreto 1772 de 1994)
+TARIFAS_ARL_POR_ANIO = {anio: (0.00522, 0.01044, 0.02436, 0.0435, 0.0696) for anio in PARAMETROS_POR_ANIO}
+
+# Umbrales derivados de la UVT
+UMBRALES_UVT = {
+    'tope_efectivo': 100,        # Art. 771-5 ET
+    'base_ret_servicios': 4,
+    'base_ret_compras': 27,
+}
+
+ANIOS = np.array(sorted(PARAMETROS_POR_ANIO), dtype=np.int64)
+ANIO_VIGENTE = int(ANIOS[-1])
+
+
+def _construir_tabla():
+    """Columnas NumPy indexadas por posición de año (ANIOS)."""
+    claves = set(TARIFAS_COMUNES)
+    for valores in PARAMETROS_POR_ANIO.values():
+        claves.update(valores)
+    tabla = {
+        clave: np.array([PARAMETROS_POR_ANIO[a].get(clave, TARIFAS_COMUNES.get(clave)) for a in ANIOS], dtype=float)
+        for clave in claves
+    }
+    for nombre, multiplo in UMBRALES_UVT.items():
+        tabla[nombre] = tabla['uvt'] * multiplo
+    return tabla
+
+
+_TABLA = _construir_tabla()
+
+# Matriz [año, nivel]; la columna 0 (nivel desconocido) usa la tarifa de Nivel I
+_ARL = np.array([(TARIFAS_ARL_POR_ANIO[a][0],) + tuple(TARIFAS_ARL_POR_ANIO[a]) for a in ANIOS])
+
+
+def _indice(anios):
+    """
+    (posición en ANIOS, máscara de años que no están en la tabla). Búsqueda
+    exacta, la tabla puede tener huecos; la posición de un año ausente es -1.
+    """
+    anios = np.asarray(anios, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(ANIOS, anios), len(ANIOS) - 1)
+    fuera = ANIOS[pos] != anios
+    return np.where(fuera, -1, pos), fuera
+
+
+def parametros_anio(anio=ANIO_VIGENTE):
+    """Parámetros (escalares) de un año gravable. ValueError si el año no está en la tabla."""
+    i, fuera = _indice(anio)
+    if fuera:
+        raise ValueError(f"No hay parámetros fiscales para el año {anio} (tabla {ANIOS[0]}-{ANIOS[-1]}). "
+                         "Agrégalos en PARAMETROS_POR_ANIO.")
+    i = int(i)
+    p = {clave: columna[i].item() for clave, columna in _TABLA.items()}
+    p['anio'] = int(ANIOS[i])
+    p['indice'] = i
+    p['fuera_de_tabla'] = False
+    return p
+
+
+def parametros_por_fecha(fechas, anio_defecto=ANIO_VIGENTE):
+    """
+    Parámetros fila a fila según el año de cada fecha (arreglos alineados con
+    'fechas'). Fechas vacías o no interpretables usan 'anio_defecto'. Las filas
+    de años sin parámetros quedan en NaN y marcadas en 'fuera_de_tabla'.
+    """
+    fechas = a_fecha(pd.Series(fechas).reset_index(drop=True))
+    anios = fechas.dt.year.fillna(anio_defecto).to_numpy(dtype=np.int64)
+    idx, fuera = _indice(anios)
+    p = {clave: np.where(fuera, np.nan, columna[idx]) for clave, columna in _TABLA.items()}
+    p['anio'] = anios
+    p['indice'] = idx
+    p['fuera_de_tabla'] = fuera
+    return p
+
+
+def tarifa_arl(parametros, nivel):
+    """Tarifa ARL para un nivel (0 = desconocido, 1..5), escalar o por fila (NaN fuera de la tabla)."""
+    indice = parametros['indice']
+    return np.where(np.asarray(indice) >= 0, _ARL[indice, nivel], np.nan)
+
+
+def tabla_parametros():
+    """Vista de la tabla completa (para mostrar en pantalla o exportar)."""
+    return pd.DataFrame({clave: columna for clave, columna in sorted(_TABLA.items())}, index=pd.Index(ANIOS, name='Año'))
@@ -0,0 +1,182 @@
+# ==============================================================================
+# MOTOR DE REGLAS FISCALES (AUDITORÍA DE GASTOS)
+# ==============================================================================
+# Las reglas se declaran como datos: código, nivel de riesgo, mensaje y una
+# condición que recibe columnas completas (arreglos NumPy) y retorna una máscara
+# booleana. Así el auxiliar se evalúa por columnas, no fila por fila.
+#
+# Para agregar una regla nueva basta con añadir un dict a REGLAS_GASTOS.
+# ==============================================================================
+
+import string
+
+import numpy as np
+import pandas as pd
+
+from parametros_fiscales import ANIO_VIGENTE, parametros_anio, parametros_por_fecha
+from tipos import a_numero
+
+# CONSTANTES FISCALES COLOMBIA (AÑO GRAVABLE 2025, ver parametros_fiscales.py)
+_P2025 = parametros_anio(2025)
+SMMLV_2025 = _P2025['smmlv']
+AUX_TRANS_2025 = _P2025['aux_transporte']
+UVT_2025 = _P2025['uvt']
+TOPE_EFECTIVO = _P2025['tope_efectivo']
+BASE_RET_SERVICIOS = _P2025['base_ret_servicios']
+BASE_RET_COMPRAS = _P2025['base_ret_compras']
+
+NIVELES_RIESGO = ['BAJO', 'MEDIO', 'ALTO']
+
+PARAMETROS_GASTOS = {
+    'tope_efectivo': TOPE_EFECTIVO,
+    'base_ret_servicios': BASE_RET_SERVICIOS,
+    'base_ret_compras': BASE_RET_COMPRAS,
+}
+
+# Cada condición recibe (d, p): d = columnas preparadas, p = parámetros fiscales.
+# Los parámetros pueden ser escalares (un solo año) o arreglos por fila
+# (parametros_por_fecha), las comparaciones funcionan igual en ambos casos.
+# El mensaje puede usar {valor} para mostrar el monto de la fila.
+REGLAS_GASTOS = [
+    {
+        'codigo': 'EFECTIVO_771_5',
+        'riesgo': 'ALTO',
+        'mensaje': "⛔ RECHAZO FISCAL: Pago en efectivo (${valor:,.0f}) supera tope Art 771-5.",
+        'condicion': lambda d, p: d['es_efectivo'] & (d['valor'] > p['tope_efectivo']),
+    },
+    {
+        'codigo': 'RET_SERVICIOS',
+        'riesgo': 'MEDIO',
+        'mensaje': "⚠️ ALERTA: Verificar Retención (Base Servicios).",
+        'condicion': lambda d, p: (d['valor'] >= p['base_ret_servicios']) & (d['valor'] < p['base_ret_compras']),
+    },
+    {
+        'codigo': 'RET_COMPRAS',
+        'riesgo': 'MEDIO',
+        'mensaje': "⚠️ ALERTA: Verificar Retención (Base Compras).",
+        'condicion': lambda d, p: d['valor'] >= p['base_ret_compras'],
+    },
+    {
+        # Sin UVT del año los topes quedan en NaN y ninguna regla aplicaría: se reporta
+        'codigo': 'ANIO_SIN_PARAMETROS',
+        'riesgo': 'MEDIO',
+        'mensaje': "⚠️ REVISAR: Año sin parámetros fiscales (UVT); topes no evaluados.",
+        'condicion': lambda d, p: p.get('fuera_de_tabla', False),
+    },
+]
+
+
+def preparar_columnas_gastos(df, col_valor, col_metodo):
+    """Columnas que usan las reglas, ya convertidas una sola vez."""
+    return {
+        'valor': a_numero(df[col_valor]).fillna(0).to_numpy(dtype=float),
+        'es_efectivo': df[col_metodo].fillna("").astype(str).str.lower().str.contains('efectivo', regex=False).to_numpy(dtype=bool),
+    }
+
+
+def _formatear_valores(valores, formato):
+    """
+    Montos como Series de texto con el formato que pide el mensaje. Se
+    formatea cada valor distinto una vez (los montos se repiten mucho).
+    """
+    codigos, unicos = pd.factorize(np.asarray(valores))
+    textos = np.array([format(v, formato) for v in unicos], dtype=object)
+    return pd.Series(textos[codigos], dtype=str)
+
+
+def _armar_mensaje(mensaje, valores):
+    """
+    Mensaje de una regla para sus filas: el mismo texto si no usa {valor},
+    o una Series armada concatenando columnas de texto.
+    """
+    piezas = list(string.Formatter().parse(mensaje))
+    if all(campo is None for _, campo, _, _ in piezas):
+        return mensaje
+    texto = ""
+    for literal, campo, formato, _ in piezas:
+        texto = texto + literal
+        if campo is not None:
+            texto = texto + _formatear_valores(valores, formato or '')
+    return texto
+
+
+def evaluar_reglas(columnas, reglas=REGLAS_GASTOS, parametros=PARAMETROS_GASTOS):
+    """
+    Evalúa todas las reglas como máscaras. Retorna un DataFrame con:
+    - Hallazgo: mensajes unidos con ' | ' ("OK" si no hay ninguno),
+    - Riesgo: categórica ordenada BAJO < MEDIO < ALTO (el máximo de las reglas que aplican),
+    - Codigos: categórica con los códigos de regla unidos con '|'.
+    Cada fila se reduce a la combinación de reglas que dispara (un bit por
+    regla); los textos se arman por combinación, no fila por fila.
+    """
+    n = len(columnas['valor'])
+    nivel = np.zeros(n, dtype=np.int8)
+    combinacion = np.zeros(n, dtype=np.int64)
+
+    for bit, regla in enumerate(reglas):
+        mascara = np.broadcast_to(np.asarray(regla['condicion'](columnas, parametros), dtype=bool), (n,))
+        if not mascara.any():
+            continue
+        nivel[mascara] = np.maximum(nivel[mascara], NIVELES_RIESGO.index(regla['riesgo']))
+        combinacion[mascara] |= 1 << bit
+
+    combinaciones, grupo = np.unique(combinacion, return_inverse=True)
+    hallazgo = np.empty(n, dtype=object)
+    codigos = []
+    for k, bits in enumerate(combinaciones):
+        aplican = [regla for bit, regla in enumerate(reglas) if bits >> bit & 1]
+        codigos.append("|".join(regla['codigo'] for regla in aplican))
+        filas = grupo == k
+        texto = "OK"
+        for i, regla in enumerate(aplican):
+            mensaje = _armar_mensaje(regla['mensaje'], columnas['valor'][filas])
+            texto = mensaje if i == 0 else texto + " | " + mensaje
+        hallazgo[filas] = texto.to_numpy(dtype=object) if isinstance(texto, pd.Series) else texto
+
+    return pd.DataFrame({
+        'Hallazgo': hallazgo,
+        'Riesgo': pd.Categorical.from_codes(nivel, categories=NIVELES_RIESGO, ordered=True),
+        'Codigos': pd.Categorical.from_codes(grupo, categories=codigos),
+    })
+
+
+def auditar_gastos(df, col_valor, col_metodo, reglas=REGLAS_GASTOS, parametros=PARAMETROS_GASTOS,
+                   col_fecha=None, anio_defecto=None):
+    """
+    Atajo: prepara columnas y evalúa reglas. El resultado conserva el índice de df.
+    Con 'col_fecha' los topes se toman del año de cada fila (las fechas vacías
+    usan 'anio_defecto' o el año vigente) e ignoran 'parametros'.
+    """
+    if col_fecha:
+        parametros = parametros_por_fecha(df[col_fecha], anio_defecto or ANIO_VIGENTE)
+    resultado = evaluar_reglas(preparar_columnas_gastos(df, col_valor, col_metodo), reglas, parametros)
+    resultado.index = df.index
+    return resultado
+
+
+# ------------------------------------------------------------------------------
+# UGPP (ART. 30 LEY 1393): PAGOS NO SALARIALES MÁXIMO 40% DE LA REMUNERACIÓN
+# ------------------------------------------------------------------------------
+def escanear_ugpp(df, col_salario, col_no_salarial=None, col_fecha=None, anio=ANIO_VIGENTE):
+    """
+    Límite de pagos no salariales por empleado. Retorna un DataFrame (mismo
+    índice que df) con Salario, No Salarial, Limite, Exceso (lo que se debe
+    sumar al IBC) y Estado. Con 'col_fecha' el porcentaje se toma del año de
+    cada fila; las de un año sin parámetros quedan con Estado "SIN PARAMETROS".
+    """
+    p = parametros_por_fecha(df[col_fecha], anio) if col_fecha else parametros_anio(anio)
+    salario = a_numero(df[col_salario]).fillna(0).to_numpy(dtype=float)
+    if col_no_salarial:
+        no_salarial = a_numero(df[col_no_salarial]).fillna(0).to_numpy(dtype=float)
+    else:
+        no_salarial = np.zeros(len(df))
+
+    limite = (salario + no_salarial) * p['limite_no_salarial']
+    exceso = np.clip(no_salarial - limite, 0, None)
+    return pd.DataFrame({
+        'Salario': salario,
+        'No Salarial': no_salarial,
+        'Limite': limite,
+        'Exceso': exceso,
+        'Estado': np.where(p['fuera_de_tabla'], "SIN PARAMETROS", np.where(exceso > 0, "RIESGO ALTO", "OK")),
+    }, index=df.index)
@@ -0,0 +1,27 @@
+# ==============================================================================
+# CONFIGURACIÓN COMÚN DE PRUEBAS
+# ==============================================================================
+# Los módulos viven en la raíz del repositorio (la app es un script de
+# Streamlit, no un paquete) y leen sus rutas de variables CONTADOR_* al
+# importarse: las bases SQLite y carpetas de las pruebas van a un directorio
+# temporal, nunca a las del usuario.
+# ==============================================================================
+
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+_TEMPORAL = tempfile.mkdtemp(prefix="contador_pruebas_")
+for variable, nombre in [
+    ("CONTADOR_CACHE_IA", "cache_ia.sqlite"),
+    ("CONTADOR_COLUMNAS", "columnas.sqlite"),
+    ("CONTADOR_CONCILIACIONES", "conciliaciones.sqlite"),
+    ("CONTADOR_CATALOGO_DIR", "catalogo"),
+    ("CONTADOR_TRABAJOS_DIR", "trabajos"),
+    ("CONTADOR_LOGS_PENDIENTES", "logs_pendientes.csv"),
+]:
+    os.environ[variable] = os.path.join(_TEMPORAL, nombre)
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conciliacion import _buscar_subconjuntos, conciliar_por_etapas, emparejar_exacto
+
+
+def emparejar_base(valores_banco, fechas_banco, valores_libro, fechas_libro, dias_tolerancia=3):
+    """
+    Versión de referencia fila por fila ('first match consumes'): cada fila del
+    banco, en orden, toma la primera fila libre del libro con el mismo valor y
+    fecha dentro de la tolerancia.
+    """
+    tolerancia = pd.Timedelta(days=dias_tolerancia)
+    usados = set()
+    resultado = []
+    for valor, fecha in zip(valores_banco, fechas_banco):
+        elegido = -1
+        if pd.notna(valor) and pd.notna(fecha):
+            for j, (valor_l, fecha_l) in enumerate(zip(valores_libro, fechas_libro)):
+                if j in usados or pd.isna(valor_l) or pd.isna(fecha_l):
+                    continue
+                if valor == valor_l and abs(fecha - fecha_l) <= tolerancia:
+                    elegido = j
+                    break
+        if elegido >= 0:
+            usados.add(elegido)
+        resultado.append(elegido)
+    return np.array(resultado, dtype=np.int64)
+
+
+def _movimientos(generador, n, vacios=0.05):
+    # Pocos valores y fechas distintos: muchos candidatos repetidos por fila
+    valores = generador.choice([100.0, 250.0, 1000.0, 1250.5, 99999.0], n)
+    fechas = pd.Timestamp("2025-01-01") + pd.to_timedelta(generador.integers(0, 20, n), unit="D")
+    fechas = pd.Series(fechas).mask(generador.random(n) < vacios)
+    valores = pd.Series(valores).mask(generador.random(n) < vacios)
+    return valores, fechas
+
+
+@pytest.mark.parametrize("semilla, dias", [(0, 0), (1, 3), (2, 7)])
+def test_emparejar_exacto_igual_a_la_version_base(semilla, dias):
+    generador = np.random.default_rng(semilla)
+    valores_b, fechas_b = _movimientos(generador, 300)
+    valores_l, fechas_l = _movimientos(generador, 250)
+
+    obtenido = emparejar_exacto(valores_b, fechas_b, valores_l, fechas_l, dias_tolerancia=dias)
+    esperado = emparejar_base(valores_b, fechas_b, valores_l, fechas_l, dias_tolerancia=dias)
+    np.testing.assert_array_equal(obtenido, esperado)
+
+
+def test_emparejar_exacto_libro_se_usa_una_vez():
+    fechas = pd.Series(pd.to_datetime(["2025-01-10", "2025-01-10", "2025-01-11"]))
+    resultado = emparejar_exacto([500.0, 500.0, 500.0], fechas, [500.0, 500.0], fechas[:2])
+    assert resultado.tolist() == [0, 1, -1]
+
+
+def test_emparejar_exacto_vacios():
+    vacio = pd.Series([], dtype="datetime64[ns]")
+    assert emparejar_exacto([], vacio, [1.0], pd.Series(pd.to_datetime(["2025-01-01"]))).tolist() == []
+    assert emparejar_exacto([1.0], pd.Series(pd.to_datetime(["2025-01-01"])), [], vacio).tolist() == [-1]
+
+
+def _tabla(filas):
+    return pd.DataFrame(filas, columns=['Fecha', 'Valor']).assign(Fecha=lambda d: pd.to_datetime(d['Fecha']))
+
+
+def _etapas(banco, libro, **opciones):
+    return conciliar_por_etapas(_tabla(banco), _tabla(libro), 'Valor', 'Fecha', 'Valor', 'Fecha', **opciones)
+
+
+def test_tolerancia_menor_diferencia_y_ventana():
+    banco = [("2025-01-10", 100.0), ("2025-01-10", 100.0)]
+    libro = [("2025-01-10", 100.4), ("2025-01-10", 100.1), ("2025-01-30", 100.0), ("2025-01-11", 100.1)]
+    parejas = _etapas(banco, libro, tolerancia_valor=0.5, etapas=("tolerancia",))
+    assert parejas['Pos_Libro'].tolist() == [(1,), (3,)]
+    assert parejas['Diferencia'].round(2).tolist() == [-0.1, -0.1]
+
+
+def test_tolerancia_no_usa_partidas_sugeridas():
+    # Dos pares del libro suman 300: el grupo queda sugerido y sus partidas no pasan a tolerancia
+    banco = [("2025-01-10", 300.0), ("2025-01-10", 100.3)]
+    libro = [("2025-01-10", 100.0), ("2025-01-10", 200.0), ("2025-01-12", 100.0)]
+    parejas = _etapas(banco, libro, tolerancia_valor=0.5, etapas=("uno_a_varios", "tolerancia"))
+    assert parejas['Etapa'].tolist() == ["uno_a_varios", "tolerancia"]
+    assert parejas['Pos_Libro'].tolist() == [(0, 1), (2,)]
+    assert parejas['Sugerida'].tolist() == [True, False]
+
+
+def test_agrupada_unica_y_exacta_se_concilia():
+    banco = [("2025-01-10", 300.0)]
+    libro = [("2025-01-09", 100.0), ("2025-01-11", 200.0), ("2025-01-10", 50.0)]
+    parejas = _etapas(banco, libro, etapas=("uno_a_varios",))
+    assert parejas['Pos_Libro'].tolist() == [(0, 1)]
+    assert parejas['Sugerida'].tolist() == [False]
+
+
+def test_agrupada_por_tolerancia_queda_sugerida():
+    banco = [("2025-01-10", 300.2)]
+    libro = [("2025-01-10", 100.0), ("2025-01-10", 200.0)]
+    parejas = _etapas(banco, libro, tolerancia_valor=0.5, etapas=("uno_a_varios",))
+    assert parejas['Sugerida'].tolist() == [True]
+
+
+def test_varios_a_uno():
+    banco = [("2025-01-10", 40.0), ("2025-01-10", 60.0), ("2025-01-10", -60.0)]
+    libro = [("2025-01-10", 100.0)]
+    parejas = _etapas(banco, libro, etapas=("varios_a_uno",))
+    assert parejas['Pos_Banco'].tolist() == [(0, 1)]
+    assert parejas['Sugerida'].tolist() == [False]
+
+
+def test_buscar_subconjuntos():
+    assert _buscar_subconjuntos([10, 20, 30, 40], 50, 0, 3) == [[0, 3], [1, 2]]
+    assert _buscar_subconjuntos([10, 20, 30, 40], 60, 0, 3, limite=5) == [[1, 3], [0, 1, 2]]
+    assert _buscar_subconjuntos([10, 20], 31, 1, 2) == [[0, 1]]
+    assert _buscar_subconjuntos([10, 20], 100, 0, 2) == []
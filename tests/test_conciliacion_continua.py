@@ -0,0 +1,86 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from conciliacion_continua import conciliar_incremental, olvidar_cuenta
+
+
+def _tabla(filas):
+    return pd.DataFrame(filas, columns=['Fecha', 'Valor', 'Detalle']).assign(Fecha=lambda d: pd.to_datetime(d['Fecha']))
+
+
+BANCO_ENERO = _tabla([("2025-01-05", 100.0, "Cheque 1"), ("2025-01-10", 250.0, "Transferencia"),
+                      ("2025-01-20", 75.0, "Comision")])
+LIBRO_ENERO = _tabla([("2025-01-05", 100.0, "CE-1"), ("2025-01-11", 250.0, "CE-2")])
+
+
+def _conciliar(usuario, banco, libro, archivo, cuenta="Bancolombia"):
+    return conciliar_incremental(usuario, cuenta, banco, libro, 'Valor', 'Fecha', 'Valor', 'Fecha',
+                                 col_desc_b='Detalle', col_desc_l='Detalle', archivo=archivo)
+
+
+@pytest.fixture
+def archivo(tmp_path):
+    return str(tmp_path / "conciliaciones.sqlite")
+
+
+def test_arrastra_abiertas_y_no_repite_conciliadas(archivo):
+    parejas, banco, _, resumen = _conciliar("ana", BANCO_ENERO, LIBRO_ENERO, archivo)
+    assert len(parejas) == 2
+    assert banco['Conciliado'].tolist() == [True, True, False]
+
+    # Febrero: el extracto acumulado repite enero y el libro trae la comisión
+    banco_feb = pd.concat([BANCO_ENERO, _tabla([("2025-02-03", 40.0, "Cuota")])], ignore_index=True)
+    libro_feb = _tabla([("2025-01-20", 75.0, "ND-3")])
+    parejas, banco, libro, resumen = _conciliar("ana", banco_feb, libro_feb, archivo)
+    assert resumen['conciliadas_antes_banco'] == 2
+    assert banco['Origen'].tolist() == ["Periodo anterior", "Nuevo"]
+    assert len(parejas) == 1
+    assert libro['Conciliado'].all()
+
+
+def test_arrastra_partidas_que_el_archivo_ya_no_trae(archivo):
+    _conciliar("ana", BANCO_ENERO, LIBRO_ENERO, archivo)
+    _, banco, _, resumen = _conciliar("ana", _tabla([]), _tabla([]), archivo)
+    assert resumen['arrastradas_banco'] == 1
+    assert banco['Origen'].tolist() == ["Arrastrada"]
+    assert banco['Valor'].tolist() == [75.0]
+
+
+def test_historial_separado_por_usuario(archivo):
+    _conciliar("ana", BANCO_ENERO, LIBRO_ENERO, archivo)
+    # Otro usuario con el mismo nombre de cuenta empieza desde cero
+    _, banco, _, resumen = _conciliar("luis", _tabla([]), _tabla([]), archivo)
+    assert banco.empty
+    assert resumen['arrastradas_banco'] == 0
+
+    olvidar_cuenta("luis", "Bancolombia", archivo=archivo)
+    _, banco, _, _ = _conciliar("ana", _tabla([]), _tabla([]), archivo)
+    assert len(banco) == 1
+
+    olvidar_cuenta("ana", "Bancolombia", archivo=archivo)
+    _, banco, _, _ = _conciliar("ana", _tabla([]), _tabla([]), archivo)
+    assert banco.empty
+
+
+def test_requiere_usuario(archivo):
+    with pytest.raises(ValueError):
+        _conciliar("", BANCO_ENERO, LIBRO_ENERO, archivo)
+
+
+def test_historial_sin_usuario_se_aparta(archivo):
+    conexion = sqlite3.connect(archivo)
+    with conexion:
+        conexion.execute("CREATE TABLE partidas (cuenta TEXT NOT NULL, lado TEXT NOT NULL, huella INTEGER NOT NULL, "
+                         "estado TEXT NOT NULL, etapa TEXT, grupo TEXT, fila TEXT, actualizado REAL NOT NULL, "
+                         "PRIMARY KEY (cuenta, lado, huella))")
+        conexion.execute("INSERT INTO partidas VALUES ('Bancolombia', 'b', 1, 'abierta', NULL, NULL, "
+                         "'{\"Fecha\": \"2024-12-01\", \"Valor\": 5.0, \"Detalle\": \"x\"}', 0)")
+    conexion.close()
+
+    _, banco, _, _ = _conciliar("ana", _tabla([]), _tabla([]), archivo)
+    assert banco.empty
+    conexion = sqlite3.connect(archivo)
+    assert conexion.execute("SELECT COUNT(*) FROM partidas_sin_usuario").fetchone() == (1,)
+    conexion.close()
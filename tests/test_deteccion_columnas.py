@@ -0,0 +1,49 @@
+import pandas as pd
+
+from deteccion_columnas import detectar_columnas, recordar_columnas
+
+NOMINA = pd.DataFrame({
+    'Nombre': ["Ana Gomez", "Luis Perez", "Marta Ruiz"],
+    'Sueldo': [1423500, 2500000, 3800000],
+    'Fecha Ingreso': pd.to_datetime(["2020-02-01", "2022-07-15", "2024-01-10"]),
+    'Auxilio Transporte': ["SI", "SI", "NO"],
+    'Exonerado': ["SI", "NO", "SI"],
+})
+
+
+def test_opcionales_sin_encabezado_quedan_en_no_aplica():
+    mapeo, recordado = detectar_columnas(NOMINA, ['empleado', 'salario', 'auxilio', 'exonerado'])
+    assert mapeo == {'empleado': 'Nombre', 'salario': 'Sueldo', 'auxilio': 'Auxilio Transporte',
+                     'exonerado': 'Exonerado'}
+    assert not recordado
+
+    opcionales, _ = detectar_columnas(NOMINA, ['arl', 'periodo'], opcionales=True)
+    # "Fecha Ingreso" es una fecha, pero no el período liquidado
+    assert opcionales == {'arl': None, 'periodo': None}
+
+
+def test_opcionales_con_encabezado_se_asignan():
+    datos = NOMINA.assign(**{'Periodo': pd.to_datetime(["2025-01-31"] * 3), 'Nivel ARL': [1, 1, 3]})
+    opcionales, _ = detectar_columnas(datos, ['arl', 'periodo'], opcionales=True)
+    assert opcionales == {'arl': 'Nivel ARL', 'periodo': 'Periodo'}
+
+
+def test_rol_obligatorio_sin_candidato_queda_vacio():
+    datos = pd.DataFrame({'Codigo': ["A1", "B2"], 'Observacion': ["x", "y"]})
+    mapeo, _ = detectar_columnas(datos, ['valor'])
+    assert mapeo == {'valor': None}
+
+
+def test_mapeos_recordados_por_usuario():
+    datos = pd.DataFrame({'Fecha': pd.to_datetime(["2025-01-01"]), 'Neto': [1.0], 'Bruto': [2.0]})
+    columnas = list(datos.columns)
+    recordar_columnas(columnas, {'valor': 'Bruto'}, "cliente-a")
+
+    mapeo, recordado = detectar_columnas(datos, ['valor'], "cliente-a")
+    assert mapeo == {'valor': 'Bruto'}
+    assert recordado
+    # La confirmación de un usuario no se aplica a los archivos de otro
+    _, recordado = detectar_columnas(datos, ['valor'], "cliente-b")
+    assert not recordado
+    _, recordado = detectar_columnas(datos, ['valor'])
+    assert not recordado
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+import exogena
+from exogena import cruzar_exogena, sumar_por_nit
+
+
+def _csv(ruta, filas):
+    pd.DataFrame(filas, columns=['Tercero', 'Valor']).to_csv(ruta, index=False)
+    return str(ruta)
+
+
+@pytest.fixture
+def archivos(tmp_path):
+    dian = _csv(tmp_path / "dian.csv", [
+        ("900.123.456-8", 1000), ("900123456", 500), ("800200300-3", 2000),
+        ("CONSUMIDOR FINAL", 50), ("860034313-7", 10),
+    ])
+    conta = _csv(tmp_path / "conta.csv", [
+        ("900123456-8", 1500), ("800200300", 200), (None, 999), ("CONSUMIDOR FINAL", 50),
+        ("700100200", 3000), ("900123456", "1.000,00"),
+    ])
+    return dian, conta
+
+
+@pytest.mark.parametrize("filas_por_bloque", [2, 1000])
+def test_sumar_por_nit_por_bloques(archivos, monkeypatch, filas_por_bloque):
+    monkeypatch.setattr(exogena, "BLOQUES_POR_COMBINACION", 2)
+    suma = sumar_por_nit(archivos[0], 'Tercero', 'Valor', filas_por_bloque).set_index('NIT')
+    # Con y sin puntos o DV, el mismo NIT queda en una sola fila
+    assert suma['Valor'].to_dict() == {"900123456": 1500.0, "800200300": 2000.0,
+                                       "CONSUMIDOR FINAL": 50.0, "860034313": 10.0}
+    assert suma.loc["800200300", 'DV Errado']
+    assert not suma.loc["900123456", 'DV Errado']
+
+
+def test_cruzar_exogena(archivos):
+    cruce, diferencias = cruzar_exogena(archivos[0], archivos[1], 'Tercero', 'Valor', 'Tercero', 'Valor',
+                                        umbral=100, filas_por_bloque=2)
+    cruce = cruce.set_index('NIT')
+    assert cruce.loc["900123456", ['Valor_DIAN', 'Valor_Conta']].tolist() == [1500.0, 2500.0]
+    assert cruce.loc["700100200", 'Valor_DIAN'] == 0
+    assert cruce.loc["CONSUMIDOR FINAL", 'Diferencia'] == 0
+    assert cruce.loc["800200300", 'DV Errado']
+    assert diferencias['NIT'].tolist() == ["800200300", "900123456", "700100200"]
+
+
+def test_sumar_por_nit_sin_filas(tmp_path):
+    suma = sumar_por_nit(_csv(tmp_path / "vacio.csv", [(None, 10)]), 'Tercero', 'Valor')
+    assert suma.empty
+    assert suma.columns.tolist() == ['NIT', 'Valor', 'DV Errado']
@@ -0,0 +1,112 @@
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import exportar
+from exportar import descarga_diferida, exportar_bytes, huella_hojas, nombre_descarga
+
+TABLA = pd.DataFrame({
+    'Fecha': pd.to_datetime(["2025-01-05", None]),
+    'Tercero': ["ACME", None],
+    'Valor': [1234.5, float('nan')],
+    'Cantidad': pd.array([3, None], dtype="Int64"),
+    'Cuenta': ["110505", "0012"],
+})
+
+
+def test_xlsx_tipos_y_nulos():
+    datos, nombre, _ = exportar_bytes({'Pendientes': TABLA}, 'xlsx', 'Conciliacion')
+    assert nombre == "Conciliacion.xlsx"
+    hoja = load_workbook(io.BytesIO(datos))['Pendientes']
+    filas = list(hoja.values)
+    assert filas[0] == tuple(TABLA.columns)
+    assert filas[1] == (pd.Timestamp("2025-01-05").to_pydatetime(), "ACME", 1234.5, 3, "110505")
+    # Los textos con ceros a la izquierda no se convierten en números
+    assert filas[2] == (None, None, None, None, "0012")
+
+
+def test_xlsx_parte_hojas_largas(monkeypatch):
+    monkeypatch.setattr(exportar, "MAX_FILAS_HOJA", 2)
+    monkeypatch.setattr(exportar, "FILAS_POR_BLOQUE", 1)
+    datos, _, _ = exportar_bytes({'Datos': pd.DataFrame({'n': range(5)})}, 'xlsx')
+    libro = load_workbook(io.BytesIO(datos))
+    assert libro.sheetnames == ["Datos", "Datos (2)", "Datos (3)"]
+    assert [fila[0] for fila in libro["Datos (3)"].values] == ["n", 4]
+
+
+def test_csv_y_parquet_de_una_hoja():
+    datos, nombre, mime = exportar_bytes(TABLA, 'csv')
+    assert (nombre, mime) == ("Reporte.csv", "text/csv")
+    assert datos.startswith(b"\xef\xbb\xbf")
+    leido = pd.read_csv(io.BytesIO(datos), encoding='utf-8-sig', dtype={'Cuenta': str})
+    assert leido['Cuenta'].tolist() == ["110505", "0012"]
+
+    datos, nombre, _ = exportar_bytes(TABLA, 'parquet')
+    assert nombre == "Reporte.parquet"
+    pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(datos)), TABLA)
+
+
+def test_parquet_con_tipos_mezclados():
+    mezclada = pd.DataFrame({'Referencia': pd.Series([123, "ABC"], dtype=object)})
+    datos, _, _ = exportar_bytes(mezclada, 'parquet')
+    assert pd.read_parquet(io.BytesIO(datos))['Referencia'].tolist() == ["123", "ABC"]
+
+
+def test_varias_hojas_en_zip():
+    hojas = {'Banco': TABLA, 'Libro/Mayor': TABLA.head(1)}
+    assert nombre_descarga(hojas, 'csv', 'Cruce') == ("Cruce.zip", exportar.MIME_ZIP)
+    datos, _, _ = exportar_bytes(hojas, 'csv', 'Cruce')
+    with zipfile.ZipFile(io.BytesIO(datos)) as comprimido:
+        assert comprimido.namelist() == ["Banco.csv", "Libro_Mayor.csv"]
+
+
+def test_formato_no_soportado():
+    with pytest.raises(ValueError):
+        nombre_descarga(TABLA, 'pdf')
+
+
+@pytest.fixture
+def memo_vacia(monkeypatch):
+    monkeypatch.setattr(exportar, "_memo", exportar.OrderedDict())
+    monkeypatch.setattr(exportar, "_bytes_en_memo", 0)
+    llamadas = []
+    original = exportar.exportar_bytes
+
+    def contar(*args, **kwargs):
+        llamadas.append(args[1:])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(exportar, "exportar_bytes", contar)
+    return llamadas
+
+
+def test_descarga_diferida_genera_al_pedirla_y_memoriza(memo_vacia):
+    descarga = descarga_diferida({'Pendientes': TABLA}, 'csv', 'Pendientes')
+    assert memo_vacia == []
+    primera = descarga()
+    assert descarga() == primera
+    # Otra tabla con el mismo contenido (otro objeto) también sale de la memoria
+    assert descarga_diferida({'Pendientes': TABLA.copy()}, 'csv', 'Pendientes')() == primera
+    assert memo_vacia == [('csv', 'Pendientes')]
+
+    descarga_diferida({'Pendientes': TABLA}, 'xlsx', 'Pendientes')()
+    assert len(memo_vacia) == 2
+
+
+def test_memo_respeta_el_limite(memo_vacia, monkeypatch):
+    monkeypatch.setattr(exportar, "LIMITE_MEMO_EXPORTAR_MB", 0)
+    descarga = descarga_diferida(TABLA, 'csv')
+    descarga()
+    descarga()
+    assert len(memo_vacia) == 2
+    assert len(exportar._memo) == 0
+
+
+def test_huella_cambia_con_el_contenido():
+    base = huella_hojas({'Hoja': TABLA})
+    assert huella_hojas({'Hoja': TABLA.copy()}) == base
+    assert huella_hojas({'Otra': TABLA}) != base
+    assert huella_hojas({'Hoja': TABLA.assign(Valor=[1.0, 2.0])}) != base
@@ -0,0 +1,52 @@
+import json
+import os
+
+from lote import ejecutar_lote, leer_manifiesto, main
+
+GASTOS_CSV = "Fecha,Proveedor,Valor,Metodo\n2025-03-01,ACME,150000000,Efectivo\n2025-03-02,Papeleria,20000,Transferencia\n"
+
+
+def _manifiesto(tmp_path, trabajos, nombre="manifiesto.json"):
+    (tmp_path / "datos").mkdir(exist_ok=True)
+    (tmp_path / "datos" / "gastos.csv").write_text(GASTOS_CSV, encoding="utf-8")
+    ruta = tmp_path / nombre
+    if nombre.endswith(".jsonl"):
+        ruta.write_text("\n".join(json.dumps(t) for t in trabajos), encoding="utf-8")
+    else:
+        ruta.write_text(json.dumps({"formato": "csv", "trabajos": trabajos}), encoding="utf-8")
+    return str(ruta)
+
+
+def _gastos(cliente, **extra):
+    # Sin columnas: se detectan por encabezado y datos
+    return dict(cliente=cliente, modulo="gastos", archivo="datos/gastos.csv", **extra)
+
+
+def test_leer_manifiesto_resuelve_rutas(tmp_path):
+    trabajos = leer_manifiesto(_manifiesto(tmp_path, [_gastos("ACME"), {"modulo": "gastos", "archivo": "/x/y.csv"}]))
+    assert trabajos[0]['archivo'] == os.path.join(str(tmp_path), "datos", "gastos.csv")
+    assert trabajos[0]['formato'] == "csv"
+    assert trabajos[1]['cliente'] == "trabajo_2"
+    assert trabajos[1]['archivo'] == "/x/y.csv"
+
+
+def test_lote_no_sobrescribe_trabajos_repetidos(tmp_path):
+    ruta = _manifiesto(tmp_path, [_gastos("ACME"), _gastos("ACME", formato="xlsx"), _gastos("Beta"),
+                                  {"cliente": "Beta", "modulo": "no_existe"}], nombre="lote.jsonl")
+    salida = str(tmp_path / "salida")
+    registros = ejecutar_lote(leer_manifiesto(ruta), salida, procesos=2, formato="csv")
+
+    assert [r['estado'] for r in registros] == ["OK", "OK", "OK", "ERROR"]
+    assert [os.path.relpath(r['archivo'], salida) if r['archivo'] else "" for r in registros] == [
+        os.path.join("ACME", "gastos_1.csv"), os.path.join("ACME", "gastos_2.xlsx"), os.path.join("Beta", "gastos.csv"), ""]
+    assert "Módulo desconocido" in registros[3]['error']
+    assert os.path.exists(os.path.join(salida, "resumen_lote.csv"))
+    with open(os.path.join(salida, "resumen_lote.json"), encoding="utf-8") as f:
+        assert len(json.load(f)) == 4
+
+
+def test_main_codigo_de_salida(tmp_path):
+    ruta = _manifiesto(tmp_path, [_gastos("ACME")])
+    assert main([ruta, "--salida", str(tmp_path / "ok"), "--procesos", "1"]) == 0
+    ruta = _manifiesto(tmp_path, [{"cliente": "ACME", "modulo": "gastos", "archivo": "datos/falta.csv"}], "malo.json")
+    assert main([ruta, "--salida", str(tmp_path / "malo"), "--procesos", "1"]) == 1
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from nit import calcular_dv, normalizar_nits, validar_nits, ESTADO_DV_ERRADO, ESTADO_OK, ESTADO_SIN_DV
+
+
+def dv_escalar(nit):
+    """Módulo 11 de la DIAN, dígito a dígito (versión de referencia)."""
+    pesos = [3, 7, 13, 17, 19, 23, 29, 37, 41, 43, 47, 53, 59, 67, 71]
+    digitos = str(nit).zfill(15)[-15:]
+    suma = sum(int(d) * p for d, p in zip(reversed(digitos), pesos))
+    resto = suma % 11
+    return resto if resto <= 1 else 11 - resto
+
+
+def test_calcular_dv_igual_al_escalar():
+    generador = np.random.default_rng(0)
+    nits = np.concatenate([
+        generador.integers(1, 10 ** 6, 2000),
+        generador.integers(8 * 10 ** 8, 10 ** 9, 2000),
+        generador.integers(10 ** 9, 10 ** 15, 2000),
+        [0, 1, 9, 10, 999999999999999, 10 ** 15 + 5],
+    ])
+    esperado = [dv_escalar(n) for n in nits]
+    assert calcular_dv(nits).tolist() == esperado
+
+
+def test_calcular_dv_invalidos():
+    assert calcular_dv([-1, 860034313]).tolist() == [-1, 7]
+
+
+@pytest.mark.parametrize("texto, nit, dv", [
+    ("900123456-8", 900123456, 8),
+    ("900.123.456 - 8", 900123456, 8),
+    ("900123456 8", 900123456, 8),
+    ("900123456 -8", 900123456, 8),
+    ("900 123 456", 900123456, -1),
+    (" 900123456 ", 900123456, -1),
+    ("900123456.0", 900123456, -1),
+    ("900123456 12", 90012345612, -1),
+    ("CONSUMIDOR FINAL", -1, -1),
+])
+def test_normalizar_nits_texto(texto, nit, dv):
+    resultado = normalizar_nits([texto])
+    assert resultado['NIT'].iloc[0] == nit
+    assert resultado['DV Informado'].iloc[0] == dv
+
+
+def test_validar_nits_estados():
+    resultado = validar_nits(["900123456-8", "900123456-3", "900123456"])
+    assert resultado['Estado'].tolist() == [ESTADO_OK, ESTADO_DV_ERRADO, ESTADO_SIN_DV]
@@ -0,0 +1,135 @@
+import json
+import threading
+
+import pytest
+from PIL import Image
+
+import ocr_ia
+from ocr_ia import LimitadorCuota, _es_reintentable, ocr_factura, procesar_ocr
+
+FACTURA = {"fecha": "2025-03-01", "nit": "900123456", "proveedor": "ACME", "concepto": "Papeleria",
+           "base": 1000, "iva": 190, "total": 1190}
+
+
+class _Respuesta:
+    def __init__(self, texto):
+        self.text = texto
+
+
+class ModeloStub:
+    """Modelo local: falla con 'errores' en las primeras llamadas y luego responde 'texto'."""
+
+    def __init__(self, errores=(), texto=None):
+        self.errores = list(errores)
+        self.texto = texto if texto is not None else "```json\n" + json.dumps(FACTURA) + "\n```"
+        self.llamadas = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contenido):
+        assert contenido[0] == ocr_ia.PROMPT_OCR
+        with self._lock:
+            self.llamadas += 1
+            error = self.errores.pop(0) if self.errores else None
+        if error:
+            raise error
+        return _Respuesta(self.texto)
+
+
+def _imagen(color="white"):
+    return Image.new("RGB", (60, 40), color)
+
+
+@pytest.fixture(autouse=True)
+def sin_espera(monkeypatch):
+    monkeypatch.setattr(ocr_ia, "ESPERA_BASE_SEGUNDOS", 0.0)
+
+
+def test_es_reintentable_por_tipo():
+    assert _es_reintentable(ConnectionError("reset"))
+    assert _es_reintentable(TimeoutError())
+    # El mensaje no decide: una clave inválida que menciona "rate" o "500" no se reintenta
+    assert not _es_reintentable(ValueError("429 rate limit 500"))
+    assert not _es_reintentable(PermissionError("API key not valid"))
+
+
+def test_es_reintentable_errores_api():
+    excepciones = pytest.importorskip("google.api_core.exceptions")
+    assert _es_reintentable(excepciones.ResourceExhausted("cuota"))
+    assert _es_reintentable(excepciones.ServiceUnavailable("caido"))
+    assert not _es_reintentable(excepciones.PermissionDenied("clave"))
+
+
+def test_ocr_factura_reintenta_errores_transitorios():
+    modelo = ModeloStub(errores=[ConnectionError("reset"), TimeoutError("lento")])
+    esperas = []
+    datos, error = ocr_factura(_imagen(), modelo, reintentos=3, dormir=esperas.append, usar_cache=False)
+    assert error is None
+    assert datos == FACTURA
+    assert modelo.llamadas == 3
+    assert len(esperas) == 2
+
+
+def test_ocr_factura_no_reintenta_errores_permanentes():
+    modelo = ModeloStub(errores=[ValueError("API key not valid")])
+    esperas = []
+    datos, error = ocr_factura(_imagen(), modelo, reintentos=3, dormir=esperas.append, usar_cache=False)
+    assert datos is None
+    assert "API key not valid" in error
+    assert modelo.llamadas == 1
+    assert esperas == []
+
+
+def test_ocr_factura_agota_reintentos():
+    modelo = ModeloStub(errores=[ConnectionError("reset")] * 5)
+    datos, error = ocr_factura(_imagen(), modelo, reintentos=2, dormir=lambda _: None, usar_cache=False)
+    assert datos is None
+    assert error.startswith("Error IA")
+    assert modelo.llamadas == 3
+
+
+def test_ocr_factura_respuesta_no_json():
+    datos, error = ocr_factura(_imagen(), ModeloStub(texto="no pude leer la factura"), usar_cache=False)
+    assert datos is None
+    assert error.startswith("Respuesta no es JSON")
+
+
+def test_procesar_ocr_con_stub():
+    modelo = ModeloStub(errores=[ConnectionError("reset")])
+    imagenes = [_imagen(), _imagen("gray"), _imagen("black"), _imagen()]
+    resultados = list(procesar_ocr(imagenes, modelo, hilos=2, rpm=1000, usar_cache=False))
+
+    assert sorted(indice for indice, _, _ in resultados) == [0, 1, 2, 3]
+    assert all(error is None and datos == FACTURA for _, datos, error in resultados)
+    # La falla transitoria se reintentó: una llamada más que imágenes
+    assert modelo.llamadas == len(imagenes) + 1
+
+
+def test_procesar_ocr_imagen_ilegible():
+    modelo = ModeloStub()
+    resultados = dict((indice, (datos, error)) for indice, datos, error in
+                      procesar_ocr([_imagen(), "/no/existe.jpg"], modelo, hilos=2, usar_cache=False))
+    assert resultados[0] == (FACTURA, None)
+    assert resultados[1][0] is None
+    assert resultados[1][1].startswith("Imagen ilegible")
+    assert modelo.llamadas == 1
+
+
+def test_limitador_cuota_espera_y_sin_limite():
+    instante = [0.0]
+    esperas = []
+
+    def dormir(segundos):
+        esperas.append(segundos)
+        instante[0] += segundos
+
+    limitador = LimitadorCuota(rpm=2, tpm=10 ** 6, ventana=60.0, reloj=lambda: instante[0], dormir=dormir)
+    for _ in range(3):
+        limitador.reservar()
+    assert esperas == [60.0]
+
+    # rpm/tpm en 0 desactivan el límite en vez de fallar con la ventana vacía
+    for rpm, tpm in [(0, 10 ** 6), (10, 0), (0, 0), (-1, -1)]:
+        limitador = LimitadorCuota(rpm=rpm, tpm=tpm, reloj=lambda: 0.0, dormir=esperas.append)
+        for _ in range(10):
+            limitador.reservar(tokens=600)
+        assert esperas == [60.0]
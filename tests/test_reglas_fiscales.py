@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from reglas_fiscales import NIVELES_RIESGO, TOPE_EFECTIVO, _formatear_valores, auditar_gastos, evaluar_reglas
+
+
+def test_formatear_valores_igual_a_format():
+    valores = np.array([0.4, -0.4, -0.6, 999.5, 1000.0, -1234567.8, 12345678901.0, 1000.0])
+    for formato in (',.0f', '.0f', ',.2f'):
+        assert _formatear_valores(valores, formato).tolist() == [format(v, formato) for v in valores]
+
+
+def test_auditar_gastos_hallazgos():
+    df = pd.DataFrame({'Valor': [TOPE_EFECTIVO + 1000, 100.0, TOPE_EFECTIVO + 1000],
+                       'Metodo': ["Efectivo", "Transferencia", "Transferencia"]}, index=[10, 11, 12])
+    resultado = auditar_gastos(df, 'Valor', 'Metodo')
+
+    assert resultado.index.tolist() == [10, 11, 12]
+    assert resultado['Hallazgo'].iloc[0].startswith(f"⛔ RECHAZO FISCAL: Pago en efectivo (${TOPE_EFECTIVO + 1000:,.0f})")
+    assert " | ⚠️ ALERTA: Verificar Retención (Base Compras)." in resultado['Hallazgo'].iloc[0]
+    assert resultado['Hallazgo'].iloc[1] == "OK"
+    assert resultado['Codigos'].tolist() == ["EFECTIVO_771_5|RET_COMPRAS", "", "RET_COMPRAS"]
+    assert resultado['Riesgo'].tolist() == ["ALTO", "BAJO", "MEDIO"]
+    assert isinstance(resultado['Codigos'].dtype, pd.CategoricalDtype)
+    assert list(resultado['Riesgo'].cat.categories) == NIVELES_RIESGO
+
+
+def test_evaluar_reglas_mensaje_con_formato_propio():
+    reglas = [{'codigo': 'X', 'riesgo': 'BAJO', 'mensaje': "Valor {valor:.2f} {{revisar}}",
+               'condicion': lambda d, p: d['valor'] > 0}]
+    resultado = evaluar_reglas({'valor': np.array([1.234, -1.0])}, reglas, {})
+    assert resultado['Hallazgo'].tolist() == ["Valor 1.23 {revisar}", "OK"]
+
+
+def test_evaluar_reglas_sin_filas():
+    resultado = evaluar_reglas({'valor': np.array([], dtype=float), 'es_efectivo': np.array([], dtype=bool)})
+    assert resultado.empty
+    assert list(resultado.columns) == ['Hallazgo', 'Riesgo', 'Codigos']
@@ -0,0 +1,65 @@
+import pandas as pd
+
+from tipos import normalizar_columna
+
+
+def _normalizar(valores, nombre):
+    return normalizar_columna(pd.Series(valores, dtype=object, name=nombre))
+
+
+def test_cuenta_contable_queda_como_texto():
+    serie, tipo = _normalizar(["110505", "110510", "220505", "5105"], "Cuenta")
+    assert tipo == 'texto'
+    assert serie.tolist() == ["110505", "110510", "220505", "5105"]
+
+
+def test_referencia_con_ceros_a_la_izquierda_queda_como_texto():
+    serie, tipo = _normalizar(["000123", "004567", "000089"], "Referencia")
+    assert tipo == 'texto'
+    assert serie.iloc[0] == "000123"
+
+
+def test_codigo_de_ocho_digitos_no_es_fecha():
+    _, tipo = _normalizar(["00012345", "00012346"], "Codigo")
+    assert tipo == 'texto'
+
+
+def test_fechas_con_puntos():
+    serie, tipo = _normalizar(["01.03.2025", "15.03.2025", "31.12.2024", None], "Fecha")
+    assert tipo == 'fecha'
+    assert serie.iloc[0] == pd.Timestamp("2025-03-01")
+    assert serie.iloc[2] == pd.Timestamp("2024-12-31")
+    assert pd.isna(serie.iloc[3])
+
+
+def test_fechas_con_puntos_sin_encabezado_de_fecha():
+    _, tipo = _normalizar(["2025.03.01", "2025.03.15"], "Columna 3")
+    assert tipo == 'fecha'
+
+
+def test_montos_con_encabezado_de_valor():
+    serie, tipo = _normalizar(["1.234.567", "2.500,50", "(300)"], "Valor")
+    assert tipo == 'monto'
+    assert serie.tolist() == [1234567.0, 2500.5, -300.0]
+
+
+def test_columna_mezclada_queda_como_texto():
+    _, tipo = _normalizar(["ABC", "123", "2024"], "Observacion")
+    assert tipo == 'texto'
+
+
+def test_valor_unitario_no_es_nit():
+    serie, tipo = normalizar_columna(pd.Series([1000.5, 250.25], name="Valor Unitario"))
+    assert tipo == 'monto'
+    assert serie.tolist() == [1000.5, 250.25]
+    _, tipo = _normalizar(["1.000,50", "2.500"], "Precio Unitario")
+    assert tipo == 'monto'
+    _, tipo = _normalizar(["12,5", "3"], "Aporte Comunitario")
+    assert tipo == 'monto'
+
+
+def test_encabezados_de_nit():
+    for nombre in ["NIT", "N.I.T.", "Nit Tercero", "Cédula", "Identificación"]:
+        serie, tipo = normalizar_columna(pd.Series([900123456.0, 800200300.0], name=nombre))
+        assert tipo == 'nit'
+        assert serie.tolist() == ["900123456", "800200300"]
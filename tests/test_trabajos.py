@@ -0,0 +1,104 @@
+import io
+import os
+import time
+
+import pytest
+
+import auditorias
+import trabajos
+from trabajos import (ERROR, TERMINADO, enviar_trabajo, estado_trabajo, limpiar_trabajos, listar_trabajos,
+                      resultado_parcial, resultado_trabajo)
+
+GASTOS_CSV = b"Fecha,Proveedor,Valor,Metodo\n2025-03-01,ACME,150000000,Efectivo\n2025-03-02,Papeleria,20000,Transferencia\n"
+
+
+def _registrar(id_trabajo, modulo, usuario="ana"):
+    conexion = trabajos._conexion()
+    try:
+        conexion.execute("INSERT INTO trabajos (id, usuario, modulo, descripcion, estado, creado, pid_servidor) "
+                         "VALUES (?, ?, ?, '', ?, ?, ?)", (id_trabajo, usuario, modulo, trabajos.PENDIENTE,
+                                                           time.time(), os.getpid()))
+    finally:
+        conexion.close()
+    os.makedirs(os.path.join(trabajos.CARPETA_TRABAJOS, id_trabajo, "entradas"), exist_ok=True)
+
+
+def _modulo_prueba(filas, progreso=None):
+    for n, fila in enumerate(filas, start=1):
+        progreso(n / len(filas), fila=fila)
+    return {'hojas': {}, 'resumen': {'filas': len(filas)}}
+
+
+def _modulo_fallido():
+    raise ValueError("columna inexistente")
+
+
+@pytest.fixture
+def modulos_prueba(monkeypatch):
+    monkeypatch.setitem(auditorias.MODULOS, 'prueba', _modulo_prueba)
+    monkeypatch.setitem(auditorias.MODULOS, 'fallido', _modulo_fallido)
+
+
+def test_ejecutar_guarda_resultado_parcial_y_borra_entradas(modulos_prueba):
+    _registrar("t-ok", 'prueba')
+    trabajos._ejecutar("t-ok", 'prueba', {'filas': [{'a': 1}, {'a': 2}]}, trabajos.CARPETA_TRABAJOS)
+
+    trabajo = estado_trabajo("t-ok")
+    assert trabajo['estado'] == TERMINADO
+    assert trabajo['resumen'] == {'filas': 2}
+    assert resultado_parcial("t-ok") == [{'a': 1}, {'a': 2}]
+    resultado = resultado_trabajo("t-ok")
+    assert resultado['resumen'] == {'filas': 2}
+    assert resultado_trabajo("t-ok") is resultado
+    assert not os.path.exists(os.path.join(trabajos.CARPETA_TRABAJOS, "t-ok", "entradas"))
+
+
+def test_ejecutar_registra_error(modulos_prueba):
+    _registrar("t-error", 'fallido')
+    trabajos._ejecutar("t-error", 'fallido', {}, trabajos.CARPETA_TRABAJOS)
+    trabajo = estado_trabajo("t-error")
+    assert trabajo['estado'] == ERROR
+    assert "columna inexistente" in trabajo['error']
+    assert resultado_trabajo("t-error") is None
+
+
+def test_resultado_parcial_ignora_linea_incompleta():
+    _registrar("t-parcial", 'prueba')
+    with open(os.path.join(trabajos.CARPETA_TRABAJOS, "t-parcial", "parcial.jsonl"), "w", encoding="utf-8") as f:
+        f.write('{"a": 1}\n{"a": ')
+    assert resultado_parcial("t-parcial") == [{'a': 1}]
+    assert resultado_parcial("no-existe") == []
+
+
+def test_limpiar_trabajos_vencidos(modulos_prueba):
+    _registrar("t-viejo", 'prueba')
+    _registrar("t-nuevo", 'prueba')
+    _registrar("t-activo", 'prueba')
+    for id_trabajo in ("t-viejo", "t-nuevo"):
+        trabajos._ejecutar(id_trabajo, 'prueba', {'filas': [{'a': 1}]}, trabajos.CARPETA_TRABAJOS)
+    hace_un_mes = time.time() - 30 * 86400
+    trabajos._actualizar(trabajos.CARPETA_TRABAJOS, "t-viejo", finalizado=hace_un_mes)
+    trabajos._actualizar(trabajos.CARPETA_TRABAJOS, "t-activo", creado=hace_un_mes)
+
+    assert limpiar_trabajos(dias=7) == 1
+    assert estado_trabajo("t-viejo") is None
+    assert not os.path.exists(os.path.join(trabajos.CARPETA_TRABAJOS, "t-viejo"))
+    assert estado_trabajo("t-nuevo")['estado'] == TERMINADO
+    assert estado_trabajo("t-activo") is not None
+    assert limpiar_trabajos(dias=0) == 0
+
+
+def test_enviar_trabajo_en_el_grupo_de_procesos():
+    archivo = io.BytesIO(GASTOS_CSV)
+    archivo.name = "gastos.csv"
+    id_trabajo = enviar_trabajo('gastos', dict(archivo=archivo, col_fecha='Fecha', col_tercero='Proveedor',
+                                               col_valor='Valor', col_metodo='Metodo'), usuario="luis")
+    limite = time.time() + 120
+    while estado_trabajo(id_trabajo)['estado'] in trabajos.ACTIVOS and time.time() < limite:
+        time.sleep(0.2)
+
+    trabajo = estado_trabajo(id_trabajo)
+    assert trabajo['estado'] == TERMINADO, trabajo['error']
+    assert [t['id'] for t in listar_trabajos(usuario="luis")] == [id_trabajo]
+    assert listar_trabajos(usuario="otro") == []
+    assert resultado_trabajo(id_trabajo)['hojas']
@@ -0,0 +1,179 @@
+import io
+import os
+import zipfile
+
+from xml_dian import carpeta_servidor, extraer_documento, extraer_xml_dian, iterar_documentos, lote_a_tablas
+
+FACTURA = """<?xml version="1.0" encoding="UTF-8"?>
+<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+         xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+         xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+  <cbc:ID>SETP990000001</cbc:ID>
+  <cbc:IssueDate>2025-03-01</cbc:IssueDate>
+  <cac:AccountingSupplierParty><cac:Party><cac:PartyTaxScheme>
+    <cbc:RegistrationName>ACME SAS</cbc:RegistrationName><cbc:CompanyID>900.123.456</cbc:CompanyID>
+  </cac:PartyTaxScheme></cac:Party></cac:AccountingSupplierParty>
+  <cac:AccountingCustomerParty><cac:Party><cac:PartyTaxScheme>
+    <cbc:RegistrationName>Cliente SAS</cbc:RegistrationName><cbc:CompanyID>800200300</cbc:CompanyID>
+  </cac:PartyTaxScheme></cac:Party></cac:AccountingCustomerParty>
+  <cac:TaxTotal>
+    <cbc:TaxAmount>190.00</cbc:TaxAmount>
+    <cac:TaxSubtotal>
+      <cbc:TaxableAmount>1000.00</cbc:TaxableAmount><cbc:TaxAmount>190.00</cbc:TaxAmount>
+      <cac:TaxCategory><cbc:Percent>19.00</cbc:Percent>
+        <cac:TaxScheme><cbc:ID>01</cbc:ID><cbc:Name>IVA</cbc:Name></cac:TaxScheme></cac:TaxCategory>
+    </cac:TaxSubtotal>
+  </cac:TaxTotal>
+  <cac:WithholdingTaxTotal>
+    <cbc:TaxAmount>25.00</cbc:TaxAmount>
+    <cac:TaxSubtotal>
+      <cbc:TaxableAmount>1000.00</cbc:TaxableAmount><cbc:TaxAmount>25.00</cbc:TaxAmount>
+      <cac:TaxCategory><cbc:Percent>2.50</cbc:Percent>
+        <cac:TaxScheme><cbc:ID>06</cbc:ID><cbc:Name>ReteRenta</cbc:Name></cac:TaxScheme></cac:TaxCategory>
+    </cac:TaxSubtotal>
+  </cac:WithholdingTaxTotal>
+  <cac:LegalMonetaryTotal>
+    <cbc:LineExtensionAmount>1000.00</cbc:LineExtensionAmount>
+    <cbc:TaxInclusiveAmount>1190.00</cbc:TaxInclusiveAmount>
+    <cbc:PayableAmount>1190.00</cbc:PayableAmount>
+  </cac:LegalMonetaryTotal>
+  <cac:InvoiceLine>
+    <cbc:ID>1</cbc:ID><cbc:InvoicedQuantity>4</cbc:InvoicedQuantity>
+    <cbc:LineExtensionAmount>1000.00</cbc:LineExtensionAmount>
+    <cac:TaxTotal><cbc:TaxAmount>190.00</cbc:TaxAmount></cac:TaxTotal>
+    <cac:Item><cbc:Description>Resma papel</cbc:Description>
+      <cac:SellersItemIdentification><cbc:ID>P-01</cbc:ID></cac:SellersItemIdentification></cac:Item>
+    <cac:Price><cbc:PriceAmount>250.00</cbc:PriceAmount></cac:Price>
+  </cac:InvoiceLine>
+</Invoice>
+"""
+
+ADJUNTO = f"""<?xml version="1.0" encoding="UTF-8"?>
+<AttachedDocument xmlns="urn:oasis:names:specification:ubl:schema:xsd:AttachedDocument-2"
+    xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+    xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+  <cac:Attachment><cac:ExternalReference><cbc:Description><![CDATA[{FACTURA.split("?>", 1)[1]}]]></cbc:Description>
+  </cac:ExternalReference></cac:Attachment>
+</AttachedDocument>
+"""
+
+
+def test_extraer_documento_lineas_e_impuestos():
+    encabezado, lineas, impuestos = extraer_documento(FACTURA.encode(), "f1.xml")
+
+    assert encabezado['Prefijo'] == "SETP990000001"
+    assert encabezado['Total a Pagar'] == 1190.0
+    assert encabezado['Base Imponible'] == 1000.0
+    assert encabezado['Total Impuestos'] == 190.0
+    assert encabezado['Total Retenciones'] == 25.0
+    assert lineas == [{'Archivo': "f1.xml", 'Prefijo': "SETP990000001", 'Linea': "1", 'Codigo': "P-01",
+                       'Descripcion': "Resma papel", 'Cantidad': 4.0, 'Precio Unitario': 250.0,
+                       'Base Linea': 1000.0, 'Impuestos Linea': 190.0}]
+    assert [(f['Tipo'], f['Codigo Tributo'], f['Tributo'], f['Tarifa'], f['Base'], f['Valor']) for f in impuestos] == [
+        ("Impuesto", "01", "IVA", 19.0, 1000.0, 190.0),
+        ("Retencion", "06", "ReteRenta", 2.5, 1000.0, 25.0),
+    ]
+
+
+def test_extraer_documento_adjunto_y_error():
+    encabezado, lineas, _ = extraer_documento(ADJUNTO.encode(), "ad.xml")
+    assert encabezado['Prefijo'] == "SETP990000001"
+    assert len(lineas) == 1
+    encabezado, lineas, impuestos = extraer_documento(b"<no es xml", "malo.xml")
+    assert encabezado == {'Archivo': "malo.xml", 'Error': "Error XML"}
+    assert lineas == impuestos == []
+
+
+def test_lote_a_tablas_desde_zip_y_carpeta(tmp_path):
+    contenido = io.BytesIO()
+    with zipfile.ZipFile(contenido, "w") as z:
+        z.writestr("a.xml", FACTURA)
+        z.writestr("leeme.txt", "no es XML")
+    (tmp_path / "b.xml").write_text(FACTURA, encoding="utf-8")
+    subido = io.BytesIO(contenido.getvalue())
+    subido.name = "lote.zip"
+
+    documentos = list(iterar_documentos([subido, str(tmp_path)]))
+    assert [nombre for nombre, _ in documentos] == ["lote.zip/a.xml", "b.xml"]
+
+    encabezados, lineas, impuestos = lote_a_tablas(iter(documentos), procesos=1)
+    assert len(encabezados) == 2
+    # NIT normalizado (sin puntos) para cruzar con la exógena
+    assert encabezados['NIT Emisor'].tolist() == ["900123456", "900123456"]
+    assert len(lineas) == 2
+    assert impuestos['Valor'].sum() == 2 * (190.0 + 25.0)
+
+
+def test_carpeta_servidor_solo_dentro_de_la_raiz(tmp_path):
+    raiz = tmp_path / "xml"
+    (raiz / "cliente" / "2025").mkdir(parents=True)
+    (tmp_path / "privado").mkdir()
+    os.symlink(tmp_path / "privado", raiz / "enlace")
+
+    assert carpeta_servidor("cliente/2025", base=str(raiz)) == os.path.realpath(raiz / "cliente" / "2025")
+    assert carpeta_servidor(str(raiz / "cliente"), base=str(raiz)) == os.path.realpath(raiz / "cliente")
+    assert carpeta_servidor("../privado", base=str(raiz)) is None
+    assert carpeta_servidor(str(tmp_path / "privado"), base=str(raiz)) is None
+    assert carpeta_servidor("/etc", base=str(raiz)) is None
+    assert carpeta_servidor("enlace", base=str(raiz)) is None
+    assert carpeta_servidor("no_existe", base=str(raiz)) is None
+    # Sin raíz configurada no se acepta ninguna carpeta
+    assert carpeta_servidor(str(raiz), base="") is None
+
+
+NOTA_CREDITO = """<?xml version="1.0" encoding="UTF-8"?>
+<CreditNote xmlns="urn:oasis:names:specification:ubl:schema:xsd:CreditNote-2"
+            xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+            xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+  <cbc:ID>NC-7</cbc:ID>
+  <cac:TaxTotal>
+    <cbc:TaxAmount>19.00</cbc:TaxAmount>
+    <cac:TaxSubtotal>
+      <cbc:TaxableAmount>100.00</cbc:TaxableAmount><cbc:TaxAmount>19.00</cbc:TaxAmount>
+      <cac:TaxCategory><cbc:Percent>19</cbc:Percent>
+        <cac:TaxScheme><cbc:ID>01</cbc:ID><cbc:Name>IVA</cbc:Name></cac:TaxScheme></cac:TaxCategory>
+    </cac:TaxSubtotal>
+  </cac:TaxTotal>
+  <cac:TaxTotal>
+    <cbc:TaxAmount>8.00</cbc:TaxAmount>
+    <cac:TaxSubtotal>
+      <cbc:TaxableAmount>100.00</cbc:TaxableAmount><cbc:TaxAmount>8.00</cbc:TaxAmount>
+      <cbc:PerUnitAmount>4.00</cbc:PerUnitAmount>
+      <cac:TaxCategory><cac:TaxScheme><cbc:ID>04</cbc:ID><cbc:Name>INC</cbc:Name></cac:TaxScheme></cac:TaxCategory>
+    </cac:TaxSubtotal>
+  </cac:TaxTotal>
+  <cac:LegalMonetaryTotal>
+    <cbc:LineExtensionAmount>100.00</cbc:LineExtensionAmount>
+    <cbc:TaxInclusiveAmount>125.00</cbc:TaxInclusiveAmount>
+    <cbc:PayableAmount>125.00</cbc:PayableAmount>
+  </cac:LegalMonetaryTotal>
+  <cac:CreditNoteLine>
+    <cbc:ID>1</cbc:ID><cbc:CreditedQuantity>2</cbc:CreditedQuantity>
+    <cbc:LineExtensionAmount>100.00</cbc:LineExtensionAmount>
+    <cac:TaxTotal><cbc:TaxAmount>19.00</cbc:TaxAmount></cac:TaxTotal>
+    <cac:TaxTotal><cbc:TaxAmount>8.00</cbc:TaxAmount></cac:TaxTotal>
+    <cac:Item><cbc:Description>Devolucion</cbc:Description>
+      <cac:StandardItemIdentification><cbc:ID>7701234</cbc:ID></cac:StandardItemIdentification>
+      <cac:SellersItemIdentification><cbc:ID>P-09</cbc:ID></cac:SellersItemIdentification></cac:Item>
+  </cac:CreditNoteLine>
+</CreditNote>
+"""
+
+
+def test_nota_credito_varios_tributos():
+    encabezado, lineas, impuestos = extraer_documento(NOTA_CREDITO.encode(), "nc.xml")
+    # Sale de la suma de los TaxTotal, no de TaxInclusive - LineExtension
+    assert encabezado['Total Impuestos'] == 27.0
+    assert encabezado['Total Retenciones'] == 0
+    assert [(f['Linea'], f['Codigo'], f['Cantidad'], f['Precio Unitario'], f['Impuestos Linea']) for f in lineas] == [
+        ("1", "7701234", 2.0, None, 27.0)]
+    # El INC por unidad no trae porcentaje: la tarifa es el valor por unidad
+    assert [(f['Prefijo'], f['Tributo'], f['Tarifa'], f['Valor']) for f in impuestos] == [
+        ("NC-7", "IVA", 19.0, 19.0), ("NC-7", "INC", 4.0, 8.0)]
+
+
+def test_solo_encabezado_sin_detalle():
+    encabezado, lineas, impuestos = extraer_documento(FACTURA.encode(), "f1.xml", detalle=False)
+    assert lineas == impuestos == []
+    assert encabezado == extraer_xml_dian(FACTURA.encode(), "f1.xml")
+    assert encabezado['Total Impuestos'] == 190.0
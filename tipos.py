@@ -0,0 +1,338 @@
+# ==============================================================================
+# NORMALIZACIÓN DE TIPOS (MONTOS, FECHAS, NIT) EN UNA SOLA PASADA
+# ==============================================================================
+# Cada módulo volvía a convertir las mismas columnas con pd.to_numeric y
+# pd.to_datetime sin formato. Con los auxiliares colombianos eso sale mal o
+# lento: "$1.234.567,89" no es un número para pandas (queda NaN y el gasto
+# desaparece de la auditoría), y "03/04/2024" sin formato se lee como 4 de
+# marzo o se adivina fila por fila.
+#
+# Aquí el formato se detecta una vez por columna sobre una muestra:
+#   - montos: separador decimal (',' o '.') y de miles, símbolo de moneda,
+#     negativos con '-' o entre paréntesis,
+#   - fechas: el formato explícito (dd/mm/aaaa, aaaa-mm-dd, ...) que convierte
+#     la muestra, o el serial de Excel si la celda viene como número,
+# y luego se convierte toda la columna de forma vectorizada con ese formato.
+# Al tipar una tabla las fechas se prueban antes que los montos ("03.04.2024"
+# no es 3.042.024), y un texto de solo dígitos pasa a monto únicamente si el
+# encabezado nombra un valor: cuentas, códigos, facturas o referencias
+# ("110505", "000123") se quedan como texto.
+# ingesta.py normaliza cada tabla al leerla (queda en caché ya tipada) y los
+# módulos usan a_numero() / a_fecha(), que no hacen nada si la columna ya
+# viene con su tipo.
+# ==============================================================================
+
+import datetime
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+MUESTRA_FORMATO = 2_000             # celdas no vacías que se miran para detectar el formato
+MINIMO_CONVERTIBLE = 0.95           # fracción de celdas no vacías que debe convertir para cambiar el tipo
+DECIMAL_POR_DEFECTO = ','           # "1.234" sin más pistas es mil doscientos treinta y cuatro (Colombia)
+
+# Palabras completas del encabezado (sin tildes) que nombran un NIT; las largas también como prefijo
+PALABRAS_NIT = ('nit', 'nits', 'cedula', 'documento', 'identificacion')
+# Encabezados (sin tildes, como prefijo de una palabra) que nombran un valor o un código
+PALABRAS_MONTO = ('valor', 'monto', 'importe', 'total', 'saldo', 'debito', 'credito', 'salario', 'sueldo',
+                  'precio', 'costo', 'neto', 'bruto', 'iva', 'retencion', 'cuantia', 'abono', 'pago', 'base',
+                  'auxilio', 'bonificacion', 'devengado', 'deducido', 'descuento')
+PALABRAS_CODIGO = ('cuenta', 'codigo', 'cod', 'factura', 'referencia', 'ref', 'comprobante', 'consecutivo',
+                   'numero', 'nro', 'documento', 'doc')
+
+# Del más probable al menos probable en un auxiliar colombiano (día antes que mes)
+FORMATOS_FECHA = (
+    '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%d/%m/%y', '%d-%m-%y',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+    '%Y%m%d', '%m/%d/%Y',
+)
+# Seriales de Excel plausibles (1900-01-01 a 9999-12-31)
+SERIAL_EXCEL_MIN, SERIAL_EXCEL_MAX = 1, 2_958_465
+ORIGEN_EXCEL = '1899-12-30'
+
+_PATRON_MONTO = r'^\(?[-+]?\s*(?:\$|COP|USD)?\s*[-+]?\d[\d.,\' ]*\s*(?:COP|USD)?\s*-?\)?$'
+
+
+def _serie(valores):
+    return valores if isinstance(valores, pd.Series) else pd.Series(valores)
+
+
+def _muestra(serie):
+    no_vacias = serie.dropna()
+    return no_vacias.iloc[:MUESTRA_FORMATO]
+
+
+def _textos(serie):
+    """Máscara de celdas de texto (una columna object puede mezclar números, fechas y textos)."""
+    if isinstance(serie.dtype, pd.StringDtype):
+        return serie.notna().to_numpy()
+    return serie.map(type).eq(str).to_numpy()
+
+
+# ------------------------------------------------------------------------------
+# MONTOS
+# ------------------------------------------------------------------------------
+def detectar_decimal(textos):
+    """
+    Separador decimal (',' o '.') de una muestra de montos en texto. Decide el
+    último separador de cada texto: si hay de los dos tipos, o si después del
+    último vienen 1, 2 o más de 3 dígitos, es el decimal; un separador repetido
+    es de miles. Si nada lo decide ("1.234"), DECIMAL_POR_DEFECTO.
+    """
+    textos = pd.Series(textos, dtype='string').str.replace(r'[^\d.,]', '', regex=True)
+    ultimo = textos.str.extract(r'([.,])(\d*)$')
+    sep, cola = ultimo[0], ultimo[1].str.len()
+    puntos, comas = textos.str.count(r'\.'), textos.str.count(',')
+    ambos = (puntos > 0) & (comas > 0)
+    repetido = ((sep == '.') & (puntos > 1)) | ((sep == ',') & (comas > 1))
+    decide = sep.notna() & (ambos | repetido | (cola != 3))
+    # El último separador es decimal salvo cuando se repite (entonces es de miles)
+    decimal = sep.where(~repetido, sep.map({'.': ',', ',': '.'}))
+    votos = decimal[decide.fillna(False)].value_counts()
+    if votos.empty:
+        return DECIMAL_POR_DEFECTO
+    return votos.idxmax()
+
+
+def _texto_a_numero(textos, decimal):
+    textos = textos.astype('string').str.strip()
+    validos = textos.str.match(_PATRON_MONTO, case=False).fillna(False)
+    negativo = textos.str.startswith('(') | textos.str.startswith('-') | textos.str.endswith('-') \
+        | textos.str.contains(r'[$A-Za-z]\s*-', regex=True)
+    miles = '.' if decimal == ',' else ','
+    limpio = textos.str.replace(r'[^\d.,]', '', regex=True).str.replace(miles, '', regex=False)
+    if decimal == ',':
+        limpio = limpio.str.replace(',', '.', regex=False)
+    numeros = pd.to_numeric(limpio.where(validos), errors='coerce').astype(float)
+    return numeros.where(~negativo.fillna(False).astype(bool), -numeros)
+
+
+def a_numero(valores, decimal=None):
+    """
+    Montos como float64 (mismo índice si es Series). Acepta columnas ya
+    numéricas (no hace nada), textos con formato colombiano o anglosajón
+    ("$1.234.567,89", "1,234.50", "(2.500)") y columnas mezcladas. Lo que no
+    es un monto queda NaN. 'decimal' fuerza el separador en vez de detectarlo.
+    """
+    serie = _serie(valores)
+    if pd.api.types.is_bool_dtype(serie):
+        return serie.astype(float)
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+    textos = _textos(serie)
+    if not textos.any():
+        return pd.to_numeric(serie, errors='coerce').astype(float)
+    resultado = pd.to_numeric(serie.where(~textos), errors='coerce').astype(float) if not textos.all() \
+        else pd.Series(np.nan, index=serie.index)
+    en_texto = serie[textos]
+    decimal = decimal or detectar_decimal(_muestra(en_texto))
+    resultado[textos] = _texto_a_numero(en_texto, decimal).to_numpy()
+    return resultado
+
+
+# ------------------------------------------------------------------------------
+# FECHAS
+# ------------------------------------------------------------------------------
+def detectar_formato_fecha(textos):
+    """Primer formato de FORMATOS_FECHA que convierte la muestra (None si ninguno llega al mínimo)."""
+    textos = pd.Series(textos, dtype='string').str.strip()
+    textos = textos[textos.str.len() > 0]
+    if textos.empty:
+        return None
+    for formato in FORMATOS_FECHA:
+        candidatas = textos
+        if formato == '%Y%m%d':
+            # Sin separadores solo aaaammdd completo: "000123" no es el año 1
+            candidatas = textos.where(textos.str.fullmatch(r'(19|20)\d{6}').fillna(False))
+        convertidas = pd.to_datetime(candidatas, format=formato, errors='coerce').notna().sum()
+        if convertidas >= MINIMO_CONVERTIBLE * len(textos):
+            return formato
+    return None
+
+
+def _serial_excel(numeros):
+    numeros = pd.to_numeric(numeros, errors='coerce').astype(float)
+    plausibles = (numeros >= SERIAL_EXCEL_MIN) & (numeros <= SERIAL_EXCEL_MAX)
+    return pd.to_datetime(numeros.where(plausibles), unit='D', origin=ORIGEN_EXCEL, errors='coerce')
+
+
+def a_fecha(valores, formato=None):
+    """
+    Fechas como datetime64 (mismo índice si es Series). Columnas ya de fecha no
+    cambian; números se leen como serial de Excel; textos con el formato
+    detectado en la muestra (día antes que mes) o 'formato'. Lo que no se
+    puede leer queda NaT.
+    """
+    serie = _serie(valores)
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return _serial_excel(serie)
+    textos = _textos(serie)
+    resultado = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+    if not textos.all():
+        numericos = ~textos & serie.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool)).to_numpy()
+        if numericos.any():
+            resultado[numericos] = _serial_excel(serie[numericos]).to_numpy(dtype='datetime64[ns]')
+        otros = ~textos & ~numericos & serie.notna().to_numpy()
+        if otros.any():
+            # datetime / date de openpyxl
+            resultado[otros] = pd.to_datetime(serie[otros], errors='coerce').to_numpy(dtype='datetime64[ns]')
+    if textos.any():
+        en_texto = serie[textos].astype('string').str.strip()
+        formato = formato or detectar_formato_fecha(_muestra(en_texto))
+        if formato:
+            fechas = pd.to_datetime(en_texto, format=formato, errors='coerce')
+        else:
+            fechas = pd.to_datetime(en_texto, format='mixed', dayfirst=True, errors='coerce')
+        resultado[textos] = fechas.to_numpy(dtype='datetime64[ns]')
+    return resultado
+
+
+# ------------------------------------------------------------------------------
+# TABLA COMPLETA
+# ------------------------------------------------------------------------------
+def _es_nit(nombre):
+    """Por palabras, no por subcadenas: 'Valor Unitario' o 'Comunitario' no son NIT; 'N.I.T.' sí."""
+    palabras = _palabras(nombre)
+    if ' n i t ' in f" {' '.join(palabras)} ":
+        return True
+    return any(p == clave or (len(clave) > 3 and p.startswith(clave)) for p in palabras for clave in PALABRAS_NIT)
+
+
+def texto_nit(serie):
+    """NIT como texto: 900123456.0 (celda numérica) pasa a '900123456'; el DV escrito se conserva."""
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        enteros = pd.to_numeric(serie, errors='coerce').round().astype('Int64')
+        return enteros.astype('string')
+    return serie.astype('string').str.strip()
+
+
+def reducir_enteros(serie):
+    """
+    Enteros al tipo más compacto, sin bajar de int32: columnas como días u
+    horas multiplicadas por un salario desbordarían un int8/int16 en silencio.
+    Los montos se quedan en float64 (float32 pierde los pesos desde 16 millones).
+    """
+    if serie.empty:
+        return serie
+    if serie.min() >= np.iinfo(np.int32).min and serie.max() <= np.iinfo(np.int32).max:
+        return serie.astype(np.int32)
+    return serie
+
+
+def _convertible(convertida, no_vacias):
+    return convertida.notna().sum() >= MINIMO_CONVERTIBLE * no_vacias
+
+
+def _palabras(nombre):
+    nombre = unicodedata.normalize('NFKD', str(nombre)).encode('ascii', 'ignore').decode('ascii').lower()
+    return re.findall(r'[a-z]+', nombre)
+
+
+def _nombra(nombre, palabras):
+    """El encabezado tiene una palabra que empieza por alguna de 'palabras' ('Débitos' nombra 'debito')."""
+    return any(p.startswith(clave) for p in _palabras(nombre) for clave in palabras)
+
+
+def _formato_fechas(muestra):
+    """
+    Formato de fecha explícito de la muestra ('' si son celdas de fecha de
+    Excel) o None. Sin formato no se adivina: "2024" o "1,5" no son fechas.
+    """
+    textos = _textos(muestra)
+    otros = muestra[~textos]
+    if not otros.map(lambda v: isinstance(v, (datetime.date, np.datetime64))).all():
+        return None
+    if not textos.any():
+        return ''
+    return detectar_formato_fecha(muestra[textos])
+
+
+def _es_codigo(nombre, textos):
+    """Cuentas, códigos, facturas, referencias o celdas con ceros a la izquierda ("000123")."""
+    if _nombra(nombre, PALABRAS_CODIGO) and not _nombra(nombre, PALABRAS_MONTO):
+        return True
+    return textos.astype('string').str.strip().str.match(r'^0\d').fillna(False).any()
+
+
+def _tiene_formato_monto(textos):
+    """Símbolo de moneda, separadores, signo o paréntesis: "$1.234", "2.500,50", "(300)"."""
+    return textos.astype('string').str.contains(r'[$.,()]|^\s*-|-\s*$|COP|USD', case=False, regex=True).fillna(False).any()
+
+
+def normalizar_columna(serie, nombre=None):
+    """
+    (serie tipada, tipo) con tipo 'nit' | 'fecha' | 'monto' | 'entero' |
+    'texto' | 'logico'. En columnas de texto se prueban primero las fechas (con
+    formato explícito); los montos solo si el encabezado nombra un valor o las
+    celdas traen formato de monto, y nunca en columnas de códigos.
+    """
+    nombre = serie.name if nombre is None else nombre
+    if _es_nit(nombre) and not pd.api.types.is_datetime64_any_dtype(serie):
+        return texto_nit(serie), 'nit'
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie, 'fecha'
+    if pd.api.types.is_bool_dtype(serie):
+        return serie, 'logico'
+    if pd.api.types.is_integer_dtype(serie):
+        return reducir_enteros(serie), 'entero'
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie, 'monto'
+
+    no_vacias = int(serie.notna().sum())
+    if no_vacias:
+        # El formato se decide con la muestra; toda la columna se convierte solo si la muestra convierte
+        muestra = _muestra(serie)
+        formato = _formato_fechas(muestra)
+        if formato is not None and _convertible(a_fecha(muestra, formato or None), len(muestra)):
+            fechas = a_fecha(serie, formato or None)
+            if _convertible(fechas, no_vacias):
+                return fechas, 'fecha'
+        en_texto = muestra[_textos(muestra)]
+        monto = _nombra(nombre, PALABRAS_MONTO) or len(en_texto) < len(muestra) or _tiene_formato_monto(en_texto)
+        if monto and not _es_codigo(nombre, en_texto) and _convertible(a_numero(muestra), len(muestra)):
+            numeros = a_numero(serie)
+            if _convertible(numeros, no_vacias):
+                return numeros, 'monto'
+    # Lo que quede mezclado (números y textos) se guarda como texto
+    return serie.astype('string'), 'texto'
+
+
+def convertir_columna(serie, tipo):
+    """
+    Convierte la serie a un tipo ya decidido (por ejemplo, el del primer bloque
+    de un archivo leído por partes). Lo que no se puede convertir queda vacío.
+    """
+    if tipo == 'nit':
+        return texto_nit(serie)
+    if tipo == 'fecha':
+        return a_fecha(serie)
+    if tipo == 'monto':
+        return a_numero(serie)
+    if tipo == 'entero':
+        numeros = pd.to_numeric(serie, errors='coerce') if not pd.api.types.is_numeric_dtype(serie) else serie
+        return numeros.where(numeros % 1 == 0).astype('Int64')
+    if tipo == 'logico':
+        return serie.astype('boolean')
+    return serie.astype('string')
+
+
+def normalizar_tabla(df, esquema=None):
+    """
+    Tipa todas las columnas de la tabla (ver normalizar_columna). Retorna
+    (DataFrame tipado, esquema {columna: tipo}). Con 'esquema' no se detecta
+    nada: cada columna se convierte al tipo indicado (convertir_columna).
+    """
+    tipado, tipos_columnas = {}, {}
+    for n, columna in enumerate(df.columns):
+        serie = df.iloc[:, n]
+        if esquema is None:
+            tipado[n], tipos_columnas[columna] = normalizar_columna(serie, columna)
+        else:
+            tipado[n], tipos_columnas[columna] = convertir_columna(serie, esquema[columna]), esquema[columna]
+    resultado = pd.DataFrame(tipado, index=df.index)
+    resultado.columns = df.columns
+    return resultado, tipos_columnas
@@ -0,0 +1,344 @@
+# ==============================================================================
+# COLA DE TRABAJOS EN SEGUNDO PLANO (PROCESOS + TABLA SQLITE)
+# ==============================================================================
+# La conciliación, la minería de XML y el OCR corrían dentro del hilo del
+# script de Streamlit: cualquier clic re-ejecutaba la página y cortaba el
+# trabajo, y refrescar el navegador perdía 20 minutos de proceso.
+#
+# Aquí la página solo envía el trabajo (módulo de auditorias.py + parámetros)
+# y recibe un ID. Un grupo de procesos del servidor lo ejecuta; el estado, el
+# avance y el resumen quedan en un SQLite, y el resultado completo en disco:
+#   <CARPETA_TRABAJOS>/trabajos.sqlite
+#   <CARPETA_TRABAJOS>/<id>/entradas/...   (archivos subidos, se borran al terminar)
+#   <CARPETA_TRABAJOS>/<id>/resultado.pkl  ({'hojas', 'resumen'})
+#   <CARPETA_TRABAJOS>/<id>/parcial.jsonl  (filas listas mientras corre, p. ej. OCR)
+# La página consulta el estado por ID en cada rerun y, al terminar, recoge el
+# resultado (memorizado por ID: el refresco de cada segundo no lo vuelve a leer). Los trabajos sobreviven a reruns y recargas del navegador, y
+# varios corren en paralelo (PROCESOS_TRABAJOS). Los trabajos terminados se
+# borran (registro y archivos) DIAS_TRABAJOS días después de terminar.
+# Los procesos se crean con 'spawn' (sin heredar los hilos del servidor);
+# el OCR toma la clave de Gemini de la variable GOOGLE_API_KEY.
+# ==============================================================================
+
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+CARPETA_TRABAJOS = os.environ.get("CONTADOR_TRABAJOS_DIR", "trabajos")
+PROCESOS_TRABAJOS = int(os.environ.get("CONTADOR_TRABAJOS_PROCESOS", "2"))
+INTERVALO_AVANCE = 0.5          # segundos mínimos entre escrituras de avance
+RESULTADOS_EN_MEMORIA = 8       # resultados deserializados que se conservan (por ID)
+DIAS_TRABAJOS = float(os.environ.get("CONTADOR_TRABAJOS_DIAS", "7"))   # 0 = no borrar
+INTERVALO_LIMPIEZA = 3600.0     # segundos mínimos entre limpiezas
+
+PENDIENTE = "pendiente"
+EJECUTANDO = "ejecutando"
+TERMINADO = "terminado"
+ERROR = "error"
+CANCELADO = "cancelado"
+ACTIVOS = (PENDIENTE, EJECUTANDO)
+
+_ejecutor = None
+_futuros = {}
+_resultados = OrderedDict()
+_ultima_limpieza = None
+_lock = threading.Lock()
+
+
+def _archivo_db(carpeta):
+    return os.path.join(carpeta, "trabajos.sqlite")
+
+
+def _conexion(carpeta=None):
+    carpeta = carpeta or CARPETA_TRABAJOS
+    os.makedirs(carpeta, exist_ok=True)
+    conexion = sqlite3.connect(_archivo_db(carpeta), timeout=30, isolation_level=None)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS trabajos ("
+        "id TEXT PRIMARY KEY, usuario TEXT, modulo TEXT NOT NULL, descripcion TEXT, estado TEXT NOT NULL, "
+        "progreso REAL NOT NULL DEFAULT 0, creado REAL NOT NULL, iniciado REAL, finalizado REAL, "
+        "pid_servidor INTEGER, pid INTEGER, resumen TEXT, error TEXT)"
+    )
+    conexion.execute("CREATE INDEX IF NOT EXISTS idx_usuario ON trabajos(usuario, modulo, creado)")
+    return conexion
+
+
+def _actualizar(carpeta, id_trabajo, **campos):
+    conexion = _conexion(carpeta)
+    try:
+        asignaciones = ", ".join(f"{c} = ?" for c in campos)
+        conexion.execute(f"UPDATE trabajos SET {asignaciones} WHERE id = ?", (*campos.values(), id_trabajo))
+    finally:
+        conexion.close()
+
+
+def _vivo(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ------------------------------------------------------------------------------
+# EJECUCIÓN (DENTRO DEL PROCESO DEL GRUPO)
+# ------------------------------------------------------------------------------
+def _ejecutar(id_trabajo, modulo, parametros, carpeta):
+    from auditorias import MODULOS
+
+    _actualizar(carpeta, id_trabajo, estado=EJECUTANDO, iniciado=time.time(), pid=os.getpid())
+    ultimo = [0.0]
+    parcial = os.path.join(carpeta, id_trabajo, "parcial.jsonl")
+
+    def progreso(fraccion, *_, fila=None, **__):
+        # Cada fila lista se agrega de inmediato (la página la muestra sin esperar el final)
+        if fila is not None:
+            with open(parcial, "a", encoding="utf-8") as f:
+                f.write(json.dumps(fila, ensure_ascii=False, default=str) + "\n")
+        ahora = time.monotonic()
+        if ahora - ultimo[0] >= INTERVALO_AVANCE:
+            ultimo[0] = ahora
+            _actualizar(carpeta, id_trabajo, progreso=float(min(max(fraccion, 0.0), 1.0)))
+
+    try:
+        funcion = MODULOS[modulo]
+        if 'progreso' in inspect.signature(funcion).parameters:
+            parametros = dict(parametros, progreso=progreso)
+        resultado = funcion(**parametros)
+        destino = os.path.join(carpeta, id_trabajo, "resultado.pkl")
+        with open(destino + ".parcial", "wb") as f:
+            pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(destino + ".parcial", destino)
+        _actualizar(carpeta, id_trabajo, estado=TERMINADO, progreso=1.0, finalizado=time.time(),
+                    resumen=json.dumps(resultado.get('resumen', {}), ensure_ascii=False, default=str))
+    except Exception as e:
+        _actualizar(carpeta, id_trabajo, estado=ERROR, finalizado=time.time(), error=f"{type(e).__name__}: {e}")
+    finally:
+        # Los archivos del cliente solo hacen falta mientras corre
+        shutil.rmtree(os.path.join(carpeta, id_trabajo, "entradas"), ignore_errors=True)
+
+
+# ------------------------------------------------------------------------------
+# ENVÍO (PROCESO DEL SERVIDOR)
+# ------------------------------------------------------------------------------
+def _obtener_ejecutor():
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = ProcessPoolExecutor(max_workers=max(1, PROCESOS_TRABAJOS),
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _ejecutor
+
+
+def _materializar(valor, carpeta, usados):
+    """Un archivo subido (o bytes) se guarda en disco: al proceso del grupo solo viaja la ruta."""
+    if isinstance(valor, (list, tuple)):
+        return [_materializar(v, carpeta, usados) for v in valor]
+    if valor is None or isinstance(valor, (str, os.PathLike)):
+        return valor
+    nombre = os.path.basename(getattr(valor, 'name', '') or f"archivo_{len(usados)}")
+    base, extension = os.path.splitext(nombre)
+    n = 1
+    while nombre in usados:
+        nombre, n = f"{base}_{n}{extension}", n + 1
+    usados.add(nombre)
+    ruta = os.path.join(carpeta, nombre)
+    datos = bytes(valor) if isinstance(valor, (bytes, bytearray)) else valor.getvalue()
+    with open(ruta, "wb") as f:
+        f.write(datos)
+    return ruta
+
+
+def enviar_trabajo(modulo, parametros, usuario=None, descripcion=""):
+    """
+    Registra el trabajo y lo pone en la cola. 'parametros' son los de la
+    función del módulo en auditorias.py (sin 'progreso'); los archivos subidos
+    se copian a la carpeta del trabajo. Retorna el ID.
+    """
+    from auditorias import MODULOS
+
+    if modulo not in MODULOS:
+        raise ValueError(f"Módulo desconocido: {modulo}")
+    id_trabajo = uuid.uuid4().hex[:12]
+    carpeta = CARPETA_TRABAJOS
+    entradas = os.path.join(carpeta, id_trabajo, "entradas")
+    os.makedirs(entradas, exist_ok=True)
+    usados = set()
+    parametros = {clave: _materializar(valor, entradas, usados) if clave.startswith('archivo') or clave == 'fuentes' else valor
+                  for clave, valor in parametros.items()}
+
+    conexion = _conexion(carpeta)
+    try:
+        conexion.execute(
+            "INSERT INTO trabajos (id, usuario, modulo, descripcion, estado, creado, pid_servidor) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (id_trabajo, usuario, modulo, descripcion, PENDIENTE, time.time(), os.getpid()),
+        )
+    finally:
+        conexion.close()
+    futuro = _obtener_ejecutor().submit(_ejecutar, id_trabajo, modulo, parametros, carpeta)
+    with _lock:
+        _futuros[id_trabajo] = futuro
+    futuro.add_done_callback(lambda f: _al_terminar(id_trabajo, f))
+    return id_trabajo
+
+
+def _al_terminar(id_trabajo, futuro):
+    with _lock:
+        _futuros.pop(id_trabajo, None)
+    if futuro.cancelled():
+        return
+    error = futuro.exception()
+    if error is not None:
+        # El proceso murió (memoria, señal) antes de poder registrar el error
+        _actualizar(CARPETA_TRABAJOS, id_trabajo, estado=ERROR, finalizado=time.time(),
+                    error=f"Proceso interrumpido: {type(error).__name__}: {error}")
+
+
+# ------------------------------------------------------------------------------
+# CONSULTA
+# ------------------------------------------------------------------------------
+def _como_dict(cursor, fila):
+    trabajo = {col[0]: valor for col, valor in zip(cursor.description, fila)}
+    trabajo['resumen'] = json.loads(trabajo['resumen']) if trabajo['resumen'] else {}
+    return trabajo
+
+
+def _revisar_huerfano(trabajo):
+    """Un trabajo activo cuyo servidor o proceso ya no existe (reinicio) queda como error."""
+    if trabajo['estado'] not in ACTIVOS or trabajo['id'] in _futuros:
+        return trabajo
+    duenio = trabajo['pid'] if trabajo['estado'] == EJECUTANDO else trabajo['pid_servidor']
+    if trabajo['pid_servidor'] != os.getpid() and not _vivo(duenio):
+        trabajo.update(estado=ERROR, error="Trabajo interrumpido por un reinicio del servidor")
+        _actualizar(CARPETA_TRABAJOS, trabajo['id'], estado=ERROR, error=trabajo['error'], finalizado=time.time())
+    return trabajo
+
+
+def estado_trabajo(id_trabajo):
+    """Fila del trabajo (estado, progreso, resumen, error, ...) o None si no existe."""
+    conexion = _conexion()
+    try:
+        cursor = conexion.execute("SELECT * FROM trabajos WHERE id = ?", (id_trabajo,))
+        fila = cursor.fetchone()
+        return _revisar_huerfano(_como_dict(cursor, fila)) if fila else None
+    finally:
+        conexion.close()
+
+
+def listar_trabajos(usuario=None, modulo=None, limite=20):
+    """Trabajos más recientes (opcionalmente de un usuario y módulo). De paso limpia los vencidos."""
+    _limpiar_si_toca()
+    condiciones, valores = [], []
+    if usuario is not None:
+        condiciones.append("usuario = ?"); valores.append(usuario)
+    if modulo is not None:
+        condiciones.append("modulo = ?"); valores.append(modulo)
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    conexion = _conexion()
+    try:
+        cursor = conexion.execute(f"SELECT * FROM trabajos {donde} ORDER BY creado DESC LIMIT ?", (*valores, limite))
+        return [_revisar_huerfano(_como_dict(cursor, fila)) for fila in cursor.fetchall()]
+    finally:
+        conexion.close()
+
+
+def resultado_trabajo(id_trabajo):
+    """
+    {'hojas', 'resumen'} de un trabajo terminado; None si no ha terminado. El
+    resultado no cambia una vez escrito: se memoriza por ID (no modificarlo).
+    """
+    with _lock:
+        if id_trabajo in _resultados:
+            _resultados.move_to_end(id_trabajo)
+            return _resultados[id_trabajo]
+    ruta = os.path.join(CARPETA_TRABAJOS, id_trabajo, "resultado.pkl")
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, "rb") as f:
+        resultado = pickle.load(f)
+    with _lock:
+        _resultados[id_trabajo] = resultado
+        while len(_resultados) > RESULTADOS_EN_MEMORIA:
+            _resultados.popitem(last=False)
+    return resultado
+
+
+def resultado_parcial(id_trabajo):
+    """Filas (dicts) que el trabajo ya entregó mientras corre; [] si aún no hay."""
+    ruta = os.path.join(CARPETA_TRABAJOS, id_trabajo, "parcial.jsonl")
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            lineas = f.readlines()
+    except FileNotFoundError:
+        return []
+    # La última línea puede estar a medio escribir
+    return [json.loads(linea) for linea in lineas if linea.endswith("\n")]
+
+
+def cancelar_trabajo(id_trabajo):
+    """Cancela un trabajo que aún no empezó. Retorna True si se canceló."""
+    with _lock:
+        futuro = _futuros.get(id_trabajo)
+    if futuro is not None and futuro.cancel():
+        _actualizar(CARPETA_TRABAJOS, id_trabajo, estado=CANCELADO, finalizado=time.time())
+        return True
+    return False
+
+
+def borrar_trabajo(id_trabajo):
+    """Elimina el registro y los archivos de un trabajo que ya no está activo."""
+    trabajo = estado_trabajo(id_trabajo)
+    if trabajo is None or trabajo['estado'] in ACTIVOS:
+        return False
+    shutil.rmtree(os.path.join(CARPETA_TRABAJOS, id_trabajo), ignore_errors=True)
+    with _lock:
+        _resultados.pop(id_trabajo, None)
+    conexion = _conexion()
+    try:
+        conexion.execute("DELETE FROM trabajos WHERE id = ?", (id_trabajo,))
+    finally:
+        conexion.close()
+    return True
+
+
+def limpiar_trabajos(dias=DIAS_TRABAJOS):
+    """
+    Borra los trabajos que terminaron (bien, con error o cancelados) hace más
+    de 'dias' días, con sus archivos. Retorna cuántos se borraron.
+    """
+    if dias <= 0:
+        return 0
+    limite = time.time() - dias * 86400
+    conexion = _conexion()
+    try:
+        vencidos = conexion.execute(
+            "SELECT id FROM trabajos WHERE estado NOT IN (?, ?) AND COALESCE(finalizado, creado) < ?",
+            (*ACTIVOS, limite)).fetchall()
+    finally:
+        conexion.close()
+    return sum(borrar_trabajo(id_trabajo) for (id_trabajo,) in vencidos)
+
+
+def _limpiar_si_toca():
+    """limpiar_trabajos() a lo sumo cada INTERVALO_LIMPIEZA segundos por proceso del servidor."""
+    global _ultima_limpieza
+    ahora = time.monotonic()
+    with _lock:
+        if _ultima_limpieza is not None and ahora - _ultima_limpieza < INTERVALO_LIMPIEZA:
+            return
+        _ultima_limpieza = ahora
+    limpiar_trabajos()
@@ -0,0 +1,425 @@
+# ==============================================================================
+# EXTRACCIÓN MASIVA DE XML (FACTURACIÓN ELECTRÓNICA DIAN - UBL 2.1)
+# ==============================================================================
+# Antes cada campo se buscaba con './/' (recorrido de todo el árbol por búsqueda,
+# ~10 por documento). Ahora se usan rutas directas desde la raíz, precompiladas
+# una sola vez en notación '{uri}local', así cada búsqueda baja solo por la rama
+# que corresponde.
+#
+# Para lotes grandes (miles de archivos) los documentos se reparten en bloques
+# entre varios procesos y los resultados vuelven en orden, bloque a bloque.
+#
+# Los documentos pueden venir sueltos, dentro de ZIP (como los entrega la DIAN y
+# los proveedores) o en una carpeta del servidor (solo dentro de
+# CARPETA_XML_SERVIDOR, ver carpeta_servidor()). Se leen de a uno, sin
+# descomprimir a disco. Si el XML es un AttachedDocument, se extrae la factura
+# embebida en el CDATA antes de leer los campos.
+#
+# Los NIT de emisor y receptor salen normalizados (nit.py: sin puntos ni DV),
+# para que crucen con la exógena y el auxiliar contable.
+# ==============================================================================
+
+import io
+import os
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from nit import nit_texto
+
+NS_ATTACHED = 'urn:oasis:names:specification:ubl:schema:xsd:AttachedDocument-2'
+
+NS_UBL = {
+    'urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2': 'cac',
+    'urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2': 'cbc',
+}
+
+# Rutas directas desde la raíz (Invoice / CreditNote / DebitNote) -> columna
+RUTAS_ENCABEZADO = {
+    ('cbc:ID',): 'Prefijo',
+    ('cbc:IssueDate',): 'Fecha Emision',
+    ('cac:AccountingSupplierParty', 'cac:Party', 'cac:PartyTaxScheme', 'cbc:CompanyID'): 'NIT Emisor',
+    ('cac:AccountingSupplierParty', 'cac:Party', 'cac:PartyTaxScheme', 'cbc:RegistrationName'): 'Emisor',
+    ('cac:AccountingCustomerParty', 'cac:Party', 'cac:PartyTaxScheme', 'cbc:CompanyID'): 'NIT Receptor',
+    ('cac:AccountingCustomerParty', 'cac:Party', 'cac:PartyTaxScheme', 'cbc:RegistrationName'): 'Receptor',
+    ('cac:LegalMonetaryTotal', 'cbc:PayableAmount'): 'Total a Pagar',
+    ('cac:LegalMonetaryTotal', 'cbc:LineExtensionAmount'): 'Base Imponible',
+    ('cac:LegalMonetaryTotal', 'cbc:TaxInclusiveAmount'): 'Total con Impuestos',
+    # Las notas débito usan RequestedMonetaryTotal
+    ('cac:RequestedMonetaryTotal', 'cbc:PayableAmount'): 'Total a Pagar',
+    ('cac:RequestedMonetaryTotal', 'cbc:LineExtensionAmount'): 'Base Imponible',
+    ('cac:RequestedMonetaryTotal', 'cbc:TaxInclusiveAmount'): 'Total con Impuestos',
+}
+
+COLUMNAS_ENCABEZADO = ['Archivo', 'Prefijo', 'Fecha Emision', 'NIT Emisor', 'Emisor',
+                       'NIT Receptor', 'Receptor', 'Total a Pagar', 'Base Imponible', 'Total Impuestos',
+                       'Total Retenciones']
+
+COLUMNAS_LINEAS = ['Archivo', 'Prefijo', 'Linea', 'Codigo', 'Descripcion', 'Cantidad',
+                   'Precio Unitario', 'Base Linea', 'Impuestos Linea']
+
+COLUMNAS_IMPUESTOS = ['Archivo', 'Prefijo', 'Tipo', 'Codigo Tributo', 'Tributo', 'Tarifa', 'Base', 'Valor']
+
+# Documentos por bloque enviado a cada proceso y mínimo de documentos para usar el pool
+TAMANO_BLOQUE = 256
+MINIMO_PARALELO = 500
+
+# Única raíz desde la que la app acepta carpetas del servidor ('' = no se aceptan)
+CARPETA_XML_SERVIDOR = os.environ.get("CONTADOR_XML_DIR", "")
+
+
+def _compilar(ruta):
+    """('cac:LegalMonetaryTotal', 'cbc:PayableAmount') -> '{urn...}LegalMonetaryTotal/{urn...}PayableAmount'."""
+    uri = {prefijo: u for u, prefijo in NS_UBL.items()}
+    return '/'.join('{%s}%s' % (uri[t.split(':')[0]], t.split(':')[1]) for t in ruta)
+
+
+_RUTAS_COMPILADAS = [(_compilar(ruta), campo) for ruta, campo in RUTAS_ENCABEZADO.items()]
+_RUTA_EMBEBIDO = _compilar(('cac:Attachment', 'cac:ExternalReference', 'cbc:Description'))
+
+# Detalle: líneas (factura, nota crédito, nota débito) y subtotales de impuestos
+_LINEAS = [_compilar((t,)) for t in ('cac:InvoiceLine', 'cac:CreditNoteLine', 'cac:DebitNoteLine')]
+_CANTIDADES = [_compilar((t,)) for t in ('cbc:InvoicedQuantity', 'cbc:CreditedQuantity', 'cbc:DebitedQuantity')]
+_TOTALES_IMPUESTO = {'Impuesto': _compilar(('cac:TaxTotal',)), 'Retencion': _compilar(('cac:WithholdingTaxTotal',))}
+_P = {nombre: _compilar(ruta) for nombre, ruta in {
+    'id': ('cbc:ID',),
+    'base': ('cbc:LineExtensionAmount',),
+    'valor_impuesto': ('cbc:TaxAmount',),
+    'subtotal': ('cac:TaxSubtotal',),
+    'base_gravable': ('cbc:TaxableAmount',),
+    'tarifa': ('cac:TaxCategory', 'cbc:Percent'),
+    'tarifa_unidad': ('cbc:PerUnitAmount',),
+    'codigo_tributo': ('cac:TaxCategory', 'cac:TaxScheme', 'cbc:ID'),
+    'tributo': ('cac:TaxCategory', 'cac:TaxScheme', 'cbc:Name'),
+    'descripcion': ('cac:Item', 'cbc:Description'),
+    'codigo': ('cac:Item', 'cac:StandardItemIdentification', 'cbc:ID'),
+    'codigo_vendedor': ('cac:Item', 'cac:SellersItemIdentification', 'cbc:ID'),
+    'precio': ('cac:Price', 'cbc:PriceAmount'),
+}.items()}
+
+
+def _campos_encabezado(root):
+    """Primer valor encontrado para cada columna de RUTAS_ENCABEZADO."""
+    encontrados = {}
+    for ruta, campo in _RUTAS_COMPILADAS:
+        if campo in encontrados:
+            continue
+        elem = root.find(ruta)
+        if elem is not None:
+            encontrados[campo] = (elem.text or "").strip()
+    return encontrados
+
+
+def _raiz_documento(contenido):
+    """
+    Raíz del documento a analizar. Un AttachedDocument (contenedor que envía el
+    proveedor) trae la factura original como texto en
+    cac:Attachment/cac:ExternalReference/cbc:Description; en ese caso se
+    parsea ese contenido y se retorna su raíz.
+    """
+    root = ET.fromstring(contenido)
+    if root.tag == '{%s}AttachedDocument' % NS_ATTACHED:
+        embebido = root.find(_RUTA_EMBEBIDO)
+        if embebido is not None and (embebido.text or "").strip():
+            return ET.fromstring(embebido.text.strip().encode('utf-8'))
+    return root
+
+
+def _texto(elem, ruta):
+    hijo = elem.find(ruta)
+    return (hijo.text or "").strip() if hijo is not None else ""
+
+
+def _numero(elem, ruta):
+    texto = _texto(elem, ruta)
+    return float(texto) if texto else None
+
+
+def _subtotales(root):
+    """Filas de la tabla de impuestos (nivel documento): IVA, INC, ICA, retenciones..."""
+    filas = []
+    for tipo, ruta in _TOTALES_IMPUESTO.items():
+        for total in root.iterfind(ruta):
+            for sub in total.iterfind(_P['subtotal']):
+                tarifa = _numero(sub, _P['tarifa'])
+                filas.append({
+                    'Tipo': tipo,
+                    'Codigo Tributo': _texto(sub, _P['codigo_tributo']),
+                    'Tributo': _texto(sub, _P['tributo']),
+                    'Tarifa': tarifa if tarifa is not None else _numero(sub, _P['tarifa_unidad']),
+                    'Base': _numero(sub, _P['base_gravable']),
+                    'Valor': _numero(sub, _P['valor_impuesto']) or 0.0,
+                })
+    return filas
+
+
+def _lineas(root):
+    filas = []
+    for ruta in _LINEAS:
+        for linea in root.iterfind(ruta):
+            cantidad = None
+            for ruta_cant in _CANTIDADES:
+                cantidad = _numero(linea, ruta_cant)
+                if cantidad is not None:
+                    break
+            impuestos = sum(_numero(t, _P['valor_impuesto']) or 0.0 for t in linea.iterfind(_TOTALES_IMPUESTO['Impuesto']))
+            filas.append({
+                'Linea': _texto(linea, _P['id']),
+                'Codigo': _texto(linea, _P['codigo']) or _texto(linea, _P['codigo_vendedor']),
+                'Descripcion': _texto(linea, _P['descripcion']),
+                'Cantidad': cantidad,
+                'Precio Unitario': _numero(linea, _P['precio']),
+                'Base Linea': _numero(linea, _P['base']),
+                'Impuestos Linea': impuestos,
+            })
+    return filas
+
+
+def extraer_documento(contenido, nombre, detalle=True):
+    """
+    Una sola lectura del XML produce las tres tablas:
+    (encabezado: dict, lineas: lista de dicts, impuestos: lista de dicts).
+
+    'Total Impuestos' suma los cac:TaxTotal del documento (IVA, INC, ICA...) y
+    'Total Retenciones' los cac:WithholdingTaxTotal; si la factura no trae
+    TaxTotal se conserva el cálculo anterior (TaxInclusive - LineExtension).
+    """
+    try:
+        root = _raiz_documento(contenido)
+        campos = _campos_encabezado(root)
+        data = {'Archivo': nombre}
+        for col in COLUMNAS_ENCABEZADO[1:7]:
+            if col in campos:
+                data[col] = campos[col]
+
+        impuestos = _subtotales(root)
+        if any(c in campos for c in ('Total a Pagar', 'Base Imponible', 'Total con Impuestos')):
+            data['Total a Pagar'] = float(campos.get('Total a Pagar') or 0)
+            data['Base Imponible'] = float(campos.get('Base Imponible') or 0)
+            data['Total Impuestos'] = float(campos.get('Total con Impuestos') or 0) - data['Base Imponible']
+        if root.find(_TOTALES_IMPUESTO['Impuesto']) is not None:
+            data['Total Impuestos'] = sum(_numero(t, _P['valor_impuesto']) or 0.0 for t in root.iterfind(_TOTALES_IMPUESTO['Impuesto']))
+        data['Total Retenciones'] = sum(f['Valor'] for f in impuestos if f['Tipo'] == 'Retencion')
+
+        if not detalle:
+            return data, [], []
+        clave = {'Archivo': nombre, 'Prefijo': data.get('Prefijo', '')}
+        return data, [dict(clave, **f) for f in _lineas(root)], [dict(clave, **f) for f in impuestos]
+    except Exception:
+        return {"Archivo": nombre, "Error": "Error XML"}, [], []
+
+
+def extraer_xml_dian(contenido, nombre):
+    """Solo el encabezado de una factura electrónica a partir de sus bytes."""
+    return extraer_documento(contenido, nombre, detalle=False)[0]
+
+
+def parsear_xml_dian(archivo_xml):
+    """Compatibilidad: recibe un archivo subido (UploadedFile o file-like con .name)."""
+    contenido = archivo_xml.getvalue() if hasattr(archivo_xml, 'getvalue') else archivo_xml.read()
+    return extraer_xml_dian(contenido, getattr(archivo_xml, 'name', ''))
+
+
+# ------------------------------------------------------------------------------
+# FUENTES DE DOCUMENTOS (ARCHIVOS SUELTOS, ZIP, CARPETAS)
+# ------------------------------------------------------------------------------
+def _es_xml(nombre):
+    return nombre.lower().endswith('.xml')
+
+
+def _es_zip(nombre):
+    return nombre.lower().endswith('.zip')
+
+
+def _desde_zip(archivo, nombre_zip):
+    """Miembros XML de un ZIP, leídos uno por uno (incluye ZIP anidados)."""
+    with zipfile.ZipFile(archivo) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            nombre = f"{nombre_zip}/{info.filename}"
+            if _es_xml(info.filename):
+                yield nombre, zf.read(info)
+            elif _es_zip(info.filename):
+                yield from _desde_zip(io.BytesIO(zf.read(info)), nombre)
+
+
+def _desde_ruta(ruta):
+    if _es_zip(ruta):
+        yield from _desde_zip(ruta, os.path.basename(ruta))
+    elif _es_xml(ruta):
+        with open(ruta, 'rb') as f:
+            yield os.path.basename(ruta), f.read()
+
+
+def carpeta_servidor(ruta, base=None):
+    """
+    Ruta absoluta de la carpeta pedida si, ya resuelta ('..' y enlaces
+    simbólicos), queda dentro de 'base' (por defecto CARPETA_XML_SERVIDOR) y
+    existe; None si no. Las rutas relativas se toman desde 'base'.
+    """
+    base = CARPETA_XML_SERVIDOR if base is None else base
+    if not base or not ruta:
+        return None
+    raiz = os.path.realpath(base)
+    destino = os.path.realpath(os.path.join(raiz, ruta))
+    if os.path.commonpath([raiz, destino]) != raiz or not os.path.isdir(destino):
+        return None
+    return destino
+
+
+def iterar_documentos(fuentes):
+    """
+    Generador de (nombre, bytes) a partir de una mezcla de:
+    - archivos subidos en Streamlit (.xml o .zip),
+    - rutas a archivos .xml / .zip,
+    - rutas a carpetas (se recorren recursivamente, en orden alfabético).
+    Cada documento se lee solo cuando se pide.
+    """
+    for fuente in fuentes:
+        if isinstance(fuente, (str, os.PathLike)):
+            ruta = os.fspath(fuente)
+            if os.path.isdir(ruta):
+                for carpeta, subcarpetas, archivos in os.walk(ruta):
+                    subcarpetas.sort()
+                    for nombre in sorted(archivos):
+                        yield from _desde_ruta(os.path.join(carpeta, nombre))
+            else:
+                yield from _desde_ruta(ruta)
+        else:
+            nombre = getattr(fuente, 'name', '')
+            if _es_zip(nombre):
+                yield from _desde_zip(fuente, nombre)
+            elif _es_xml(nombre):
+                yield nombre, fuente.getvalue() if hasattr(fuente, 'getvalue') else fuente.read()
+
+
+def contar_documentos(fuentes):
+    """
+    Conteo aproximado para la barra de progreso, sin leer contenidos: usa el
+    directorio central de cada ZIP (los ZIP anidados no se abren).
+    """
+    def en_zip(archivo):
+        with zipfile.ZipFile(archivo) as zf:
+            return sum(1 for info in zf.infolist() if _es_xml(info.filename))
+
+    total = 0
+    for fuente in fuentes:
+        if isinstance(fuente, (str, os.PathLike)):
+            ruta = os.fspath(fuente)
+            rutas = [os.path.join(c, n) for c, _, ns in os.walk(ruta) for n in ns] if os.path.isdir(ruta) else [ruta]
+            for r in rutas:
+                total += en_zip(r) if _es_zip(r) else int(_es_xml(r))
+        else:
+            nombre = getattr(fuente, 'name', '')
+            total += en_zip(fuente) if _es_zip(nombre) else int(_es_xml(nombre))
+    return total
+
+
+# ------------------------------------------------------------------------------
+# PROCESAMIENTO POR LOTES
+# ------------------------------------------------------------------------------
+def _extraer_bloque(bloque, detalle=False):
+    if detalle:
+        return [extraer_documento(contenido, nombre) for nombre, contenido in bloque]
+    return [extraer_xml_dian(contenido, nombre) for nombre, contenido in bloque]
+
+
+def _bloques(documentos, tamano):
+    bloque = []
+    for doc in documentos:
+        bloque.append(doc)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def extraer_lote(documentos, procesos=None, tamano_bloque=TAMANO_BLOQUE, total=None, detalle=False):
+    """
+    Generador de resultados (dict por documento, en el mismo orden de entrada).
+    Con detalle=True cada resultado es la tupla (encabezado, lineas, impuestos).
+
+    'documentos' es un iterable de (nombre, bytes) que se consume de forma
+    perezosa: solo hay en vuelo unos pocos bloques por proceso, así la memoria
+    no depende del tamaño del lote. Lotes pequeños se procesan en serie para no
+    pagar el arranque del pool.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1 or (total is not None and total < MINIMO_PARALELO):
+        for bloque in _bloques(documentos, tamano_bloque):
+            yield from _extraer_bloque(bloque, detalle)
+        return
+
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        en_vuelo = deque()
+        for bloque in _bloques(documentos, tamano_bloque):
+            en_vuelo.append(pool.submit(_extraer_bloque, bloque, detalle))
+            if len(en_vuelo) >= 2 * procesos:
+                yield from en_vuelo.popleft().result()
+        while en_vuelo:
+            yield from en_vuelo.popleft().result()
+
+
+class _Acumulador:
+    """Arma un DataFrame por bloques de filas, sin retener la lista completa de dicts."""
+
+    def __init__(self, columnas, filas_por_bloque):
+        self.columnas, self.filas_por_bloque = columnas, filas_por_bloque
+        self.partes, self.filas = [], []
+
+    def agregar(self, filas):
+        self.filas.extend(filas)
+        if len(self.filas) >= self.filas_por_bloque:
+            self.partes.append(pd.DataFrame(self.filas))
+            self.filas = []
+
+    def dataframe(self):
+        if self.filas:
+            self.partes.append(pd.DataFrame(self.filas))
+        if not self.partes:
+            return pd.DataFrame(columns=self.columnas)
+        df = pd.concat(self.partes, ignore_index=True)
+        orden = [c for c in self.columnas if c in df.columns] + [c for c in df.columns if c not in self.columnas]
+        return df[orden]
+
+
+def _normalizar_nits(df):
+    for col in ('NIT Emisor', 'NIT Receptor'):
+        if col in df.columns and len(df):
+            df[col] = nit_texto(df[col])
+    return df
+
+
+def lote_a_dataframe(documentos, procesos=None, total=None, progreso=None, filas_por_bloque=5000):
+    """
+    Consume extraer_lote() y arma el DataFrame de encabezados por bloques.
+    'progreso' recibe el número de documentos procesados.
+    """
+    encabezados = _Acumulador(COLUMNAS_ENCABEZADO, filas_por_bloque)
+    for n, fila in enumerate(extraer_lote(documentos, procesos=procesos, total=total), start=1):
+        encabezados.agregar([fila])
+        if progreso is not None and (n % 100 == 0 or n == total):
+            progreso(n)
+    return _normalizar_nits(encabezados.dataframe())
+
+
+def lote_a_tablas(documentos, procesos=None, total=None, progreso=None, filas_por_bloque=5000):
+    """
+    Igual que lote_a_dataframe() pero en el mismo recorrido arma también las
+    tablas largas de líneas e impuestos. Retorna (encabezados, lineas, impuestos).
+    """
+    encabezados = _Acumulador(COLUMNAS_ENCABEZADO, filas_por_bloque)
+    lineas = _Acumulador(COLUMNAS_LINEAS, filas_por_bloque)
+    impuestos = _Acumulador(COLUMNAS_IMPUESTOS, filas_por_bloque)
+    for n, (enc, lin, imp) in enumerate(extraer_lote(documentos, procesos=procesos, total=total, detalle=True), start=1):
+        encabezados.agregar([enc])
+        lineas.agregar(lin)
+        impuestos.agregar(imp)
+        if progreso is not None and (n % 100 == 0 or n == total):
+            progreso(n)
+    return _normalizar_nits(encabezados.dataframe()), lineas.dataframe(), impuestos.dataframe()